@@ -1,4 +1,7 @@
 # backend/app.py
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask, request, jsonify
 from flask import Blueprint, render_template, request, jsonify
 from flask_cors import CORS
@@ -7,12 +10,24 @@ from exam.routes import exam_bp
 from mobile.routes import mobile_bp
 from upload.routes import upload_bp
 from database import init_db
+from indexes import ensure_indexes
 import config
 import os
 from flask_mail import Mail
 from audio_analysis.routes import audio_analysis
+from jobs.routes import jobs_bp
+import threading
+
+# Filled in as the module loads; printed at startup and read by benchmarks/bench_startup.py
+STARTUP_TIMINGS = {"imports_ms": round((time.perf_counter() - _import_started) * 1000, 1)}
+
+def apply_indexes(db):
+    report = ensure_indexes(db)
+    for error in report["errors"]:
+        print(f"Index {error['collection']}.{error['index']} not created: {error['error']}")
 
 def create_app(config_class=config):
+    started = time.perf_counter()
     app = Flask(__name__)
 
     # Global CORS: uses FRONTEND_URL env var in production, defaults to "*" for local dev
@@ -28,13 +43,14 @@ def create_app(config_class=config):
     mail = Mail()
     mail.init_app(app)
 
-    # Initialize database and inject into app.config
-    try:
-        db_objects = init_db()
-        app.config.update(db_objects)
-    except Exception as e:
-        print(f"Failed to connect to MongoDB: {e}")
-        raise
+    # Shared database handles; the connection pool opens lazily on the first query
+    db_objects = init_db()
+    app.config.update(db_objects)
+
+    # Create any missing indexes (idempotent; `python indexes.py ensure` does the same).
+    # Runs off the startup path so a slow Atlas round trip doesn't delay boot.
+    if config.Config.ENSURE_INDEXES_ON_STARTUP:
+        threading.Thread(target=apply_indexes, args=(db_objects["db"],), daemon=True).start()
 
     # Register blueprints
     app.register_blueprint(auth_bp,          url_prefix="/auth")
@@ -42,7 +58,16 @@ def create_app(config_class=config):
     app.register_blueprint(upload_bp,        url_prefix="/upload")
     app.register_blueprint(mobile_bp,        url_prefix="/mobile")
     app.register_blueprint(audio_analysis,   url_prefix="/api/audio-analysis")
+    app.register_blueprint(jobs_bp,          url_prefix="/jobs")
+
+    # Background jobs normally run in `python -m jobs.worker`; local setups can host them here
+    if config.Config.JOB_WORKER_EMBEDDED:
+        from jobs.worker import start_embedded_worker
+        start_embedded_worker()
 
+    STARTUP_TIMINGS["create_app_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    print(f"App ready: imports {STARTUP_TIMINGS['imports_ms']} ms, "
+          f"create_app {STARTUP_TIMINGS['create_app_ms']} ms")
     return app
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+"""
+The audio feature cache: VAD segments and MFCCs of analyzed recordings.
+
+Re-clustering a recording with other settings, or analyzing the same audio
+again, reuses the stored features instead of decoding it and running VAD and
+MFCC extraction again. Run from the backend directory:
+
+    python -m audio_analysis.cache warm --exam EXAM_ID [--workers N]
+    python -m audio_analysis.cache evict [--max-age-days 30] [--max-gb 5]
+    python -m audio_analysis.cache stats
+
+`warm` computes the features of every finished recording of an exam ahead
+of a re-analysis, one pool process per core. `evict` trims the cache to the
+configured (or given) limits; it also runs by itself as entries are added.
+"""
+import os
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from config import Config
+from audio_analysis.diarization_core.feature_cache import FeatureCache
+
+logger = logging.getLogger(__name__)
+
+
+def default_feature_cache():
+    """The feature cache configured in Config, or None when it is disabled."""
+    if not Config.AUDIO_FEATURE_CACHE:
+        return None
+    return FeatureCache(Config.AUDIO_FEATURE_CACHE_FOLDER,
+                        max_age_seconds=Config.AUDIO_FEATURE_CACHE_MAX_AGE_DAYS * 86400,
+                        max_bytes=Config.AUDIO_FEATURE_CACHE_MAX_BYTES)
+
+
+def exam_recordings(attempts_collection, exam_id, root):
+    """
+    Finished recordings of every attempt of an exam.
+
+    Recordings still being uploaded, and files missing from `root`, are
+    skipped.
+
+    Args:
+        attempts_collection: `attempted_exams`
+        exam_id (str): The exam
+        root (str): Directory holding the recording files
+
+    Returns:
+        list: {username, file, path} of each recording, in attempt order
+    """
+    recordings = []
+    cursor = attempts_collection.find({"examId": exam_id, "recordings": {"$exists": True}},
+                                      {"username": 1, "recordings.file": 1, "recordings.status": 1})
+    for attempt in cursor:
+        for recording in attempt.get("recordings", []):
+            if not recording.get("file") or recording.get("status") == "recording":
+                continue
+            path = os.path.join(root, recording["file"])
+            if not os.path.isfile(path):
+                logger.warning(f"Recording {recording['file']} of {attempt['username']} is missing")
+                continue
+            recordings.append({"username": attempt["username"], "file": recording["file"], "path": path})
+    return recordings
+
+
+def _warm_one(path):
+    """Body of a pool process: make sure the features of one recording are cached."""
+    from jobs.tasks import get_diarizer
+    diarizer = get_diarizer()
+    cache = diarizer.feature_cache
+    hits = cache.hits
+    started = time.perf_counter()
+    voice_segments, features_list, _ = diarizer.load_features(path)
+    return {
+        "hit": cache.hits > hits,
+        "seconds": time.perf_counter() - started,
+        "segments": len(features_list),
+        "voiced": sum(end - start for start, end in voice_segments),
+    }
+
+
+def warm(exam_id, workers=None):
+    if not Config.AUDIO_FEATURE_CACHE:
+        print("The feature cache is disabled (AUDIO_FEATURE_CACHE=false)")
+        return
+    from database import init_db
+    recordings = exam_recordings(init_db()["db_collection"], exam_id, Config.AUDIO_UPLOAD_FOLDER)
+    if not recordings:
+        print(f"No finished recordings for exam {exam_id}")
+        return
+    print(f"Warming the feature cache with {len(recordings)} recordings of exam {exam_id}")
+
+    started = time.perf_counter()
+    hits, failed = 0, 0
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as pool:
+        futures = {pool.submit(_warm_one, recording["path"]): recording for recording in recordings}
+        for future in as_completed(futures):
+            recording = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"  {recording['file']}: failed ({e})")
+                continue
+            hits += result["hit"]
+            print(f"  {recording['file']}: {'cached' if result['hit'] else 'computed'} in "
+                  f"{result['seconds']:.2f} s ({result['segments']} segments, {result['voiced']:.0f} s voiced)")
+    print(f"Done in {time.perf_counter() - started:.1f} s: {len(recordings) - hits - failed} computed, "
+          f"{hits} already cached, {failed} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    warm_parser = commands.add_parser("warm", help="cache the features of an exam's recordings")
+    warm_parser.add_argument("--exam", required=True, help="exam id")
+    warm_parser.add_argument("--workers", type=int, help="pool processes (default: one per core)")
+    evict_parser = commands.add_parser("evict", help="trim the cache")
+    evict_parser.add_argument("--max-age-days", type=float, default=Config.AUDIO_FEATURE_CACHE_MAX_AGE_DAYS)
+    evict_parser.add_argument("--max-gb", type=float, default=Config.AUDIO_FEATURE_CACHE_MAX_BYTES / 1024 ** 3)
+    commands.add_parser("stats", help="size of the cache")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    cache = FeatureCache(Config.AUDIO_FEATURE_CACHE_FOLDER)
+    if args.command == "warm":
+        warm(args.exam, args.workers)
+    elif args.command == "evict":
+        removed, freed = cache.evict(max_age_seconds=args.max_age_days * 86400,
+                                     max_bytes=int(args.max_gb * 1024 ** 3))
+        print(f"Removed {removed} entries, {freed / 1024 ** 2:.1f} MiB")
+    else:
+        stats = cache.stats()
+        oldest = f", least recently used {(time.time() - stats['oldest']) / 86400:.1f} days ago" \
+            if stats["oldest"] else ""
+        print(f"{stats['entries']} entries, {stats['bytes'] / 1024 ** 2:.1f} MiB in "
+              f"{Config.AUDIO_FEATURE_CACHE_FOLDER}{oldest}")
+
+
+if __name__ == "__main__":
+    main()
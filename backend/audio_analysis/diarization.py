@@ -4,38 +4,146 @@ import librosa
 from .diarization_core.voice_detector import VoiceDetector
 from .diarization_core.feature_extractor import FeatureExtractor
 from .diarization_core.speaker_diarization import SpeakerDiarization
+from .diarization_core.audio_decoder import AudioDecoder, DecodedAudio
+from .diarization_core.rolling_windows import RollingSpeakerWindows
 import logging
 
 logger = logging.getLogger(__name__)
 
 class ExamAudioDiarizer:
-    def __init__(self, sample_rate=16000):
+    def __init__(self, sample_rate=16000, max_speakers=4, scratch_dir=None, feature_cache=None):
         self.sample_rate = sample_rate
+        self.feature_cache = feature_cache  # FeatureCache, or None to always recompute
+        self.decoder = AudioDecoder(sample_rate=sample_rate, scratch_dir=scratch_dir)
         self.voice_detector = VoiceDetector(sample_rate=sample_rate)
         self.feature_extractor = FeatureExtractor(sample_rate=sample_rate)
-        self.speaker_diarizer = SpeakerDiarization(num_speakers=2)  # Assuming 2 speakers (student and proctor)
+        # the speaker count is estimated per recording: 0 (no speech), 1 (the student) or more
+        self.speaker_diarizer = SpeakerDiarization(num_speakers=None, max_speakers=max_speakers)
+        # rolling windows hold a few dozen embeddings, where a chance split scores higher
+        self.window_diarizer = SpeakerDiarization(num_speakers=None, max_speakers=max_speakers, min_silhouette=0.6)
         
+    def load_audio(self, audio_source):
+        """
+        Decode a recording and find its voice segments in the same pass.
+        
+        ffmpeg decodes straight to 16-bit PCM at the analysis rate and each chunk
+        goes through the streaming VAD as it arrives; without ffmpeg the file is
+        read with librosa instead.
+        
+        Args:
+            audio_source: Path of the audio file, or a binary file object (ffmpeg only)
+            
+        Returns:
+            tuple: (DecodedAudio, list of voice segments)
+        """
+        if self.decoder.available():
+            vad = self.voice_detector.stream()
+            voice_segments = []
+            decoded = self.decoder.decode(audio_source, on_chunk=lambda chunk: voice_segments.extend(vad.feed(chunk)))
+            voice_segments.extend(vad.close())
+            return decoded, voice_segments
+        
+        logger.warning("ffmpeg not found; loading audio with librosa")
+        audio_data, _ = librosa.load(audio_source, sr=self.sample_rate)
+        return DecodedAudio(audio_data, self.sample_rate), self.voice_detector.detect_voice_segments(audio_data)
+    
+    def feature_fingerprint(self):
+        """Everything the VAD segments and MFCCs of a recording depend on besides its bytes."""
+        extractor = self.feature_extractor
+        return {
+            "decoder": "ffmpeg" if self.decoder.available() else "librosa",
+            "sample_rate": self.sample_rate,
+            "vad": [self.voice_detector.frame_duration_ms, self.voice_detector.aggressiveness,
+                    self.voice_detector.buffer_size],
+            "mfcc": [extractor.n_mfcc, extractor.n_mels, extractor.n_fft, extractor.hop_length,
+                     extractor.single_pass, extractor.max_block_frames, extractor.top_db],
+        }
+    
+    def load_features(self, audio_source):
+        """
+        Voice segments and per-segment MFCCs of a recording.
+        
+        With a feature cache, a recording whose bytes were analyzed before under
+        the same settings is not decoded again: its segments and features come
+        back from the cache, memory-mapped. Otherwise they are computed and stored.
+        
+        Args:
+            audio_source: Path of the audio file, or a binary file object (never cached)
+            
+        Returns:
+            tuple: (list of voice segments, list of feature dictionaries, duration of the audio in seconds)
+        """
+        key = None
+        if self.feature_cache is not None and isinstance(audio_source, (str, os.PathLike)):
+            key = self.feature_cache.key(audio_source, self.feature_fingerprint())
+            cached = self.feature_cache.get(key)
+            if cached is not None:
+                logger.info(f"Using cached features of {audio_source} ({len(cached.features_list)} segments)")
+                return cached.voice_segments, cached.features_list, cached.meta.get("duration")
+        
+        decoded, voice_segments = self.load_audio(audio_source)
+        with decoded:
+            features_list = self.feature_extractor.extract_features_from_segments(
+                decoded.samples, voice_segments, self.sample_rate
+            )
+            duration = decoded.duration
+        
+        if key is not None:
+            self.feature_cache.put(key, voice_segments, features_list,
+                                   source=os.fspath(audio_source), duration=duration)
+        return voice_segments, features_list, duration
+    
+    def rolling_windows(self, window_seconds=30.0, hop_seconds=15.0, start_seconds=0.0):
+        """
+        Rolling speaker summaries for one recording, fed PCM as it is decoded.
+        
+        Each recording gets a VAD of its own; the feature extractor and the
+        window speaker model are shared.
+        
+        Returns:
+            RollingSpeakerWindows: Summaries of window_seconds of audio every hop_seconds
+        """
+        return RollingSpeakerWindows(VoiceDetector(sample_rate=self.sample_rate), self.feature_extractor,
+                                     self.window_diarizer, window_seconds=window_seconds,
+                                     hop_seconds=hop_seconds, start_seconds=start_seconds)
+    
+    def summarize_windows(self, audio_source, window_seconds=30.0, hop_seconds=15.0):
+        """
+        Rolling-window speaker summaries of a finished recording, the same ones
+        the live monitor produces. The recording is decoded chunk by chunk and
+        never held in memory whole when ffmpeg is available.
+        
+        Args:
+            audio_source: Path of the audio file
+            
+        Returns:
+            list: Window summaries in time order
+        """
+        windows = self.rolling_windows(window_seconds, hop_seconds)
+        summaries = []
+        if self.decoder.available():
+            for chunk in self.decoder.iter_chunks(audio_source):
+                summaries.extend(windows.feed(chunk))
+        else:
+            logger.warning("ffmpeg not found; loading audio with librosa")
+            audio_data, _ = librosa.load(audio_source, sr=self.sample_rate)
+            summaries.extend(windows.feed(np.frombuffer(self.voice_detector.to_pcm16(audio_data), dtype=np.int16)))
+        summaries.extend(windows.close())
+        return summaries
+    
     def process_exam_audio(self, audio_file_path):
         """
         Process exam audio file to detect and separate speakers
         
         Args:
-            audio_file_path: Path to the exam audio file
+            audio_file_path: Path to the exam audio file (any format ffmpeg reads), or a binary file object
             
         Returns:
             dict: Dictionary containing diarization results with speaker segments
         """
         try:
-            # Load audio file
-            audio_data, sr = librosa.load(audio_file_path, sr=self.sample_rate)
-            
-            # Detect voice segments
-            voice_segments = self.voice_detector.detect_voice_segments(audio_data)
-            
-            # Extract features from segments
-            features_list = self.feature_extractor.extract_features_from_segments(
-                audio_data, voice_segments, self.sample_rate
-            )
+            # Voice segments and their features, from the feature cache when the audio was seen before
+            voice_segments, features_list, duration = self.load_features(audio_file_path)
             
             # Perform speaker diarization
             diarized_segments = self.speaker_diarizer.diarize(features_list)
@@ -46,6 +154,9 @@ class ExamAudioDiarizer:
             # Format results for visualization
             results = {
                 "success": True,
+                "num_speakers": len({segment['speaker'] for segment in merged_segments}),
+                "speaker_count_scores": {str(k): round(score, 3) for k, score
+                                         in self.speaker_diarizer.speaker_count_scores.items()},
                 "segments": [
                     {
                         "speaker": f"Speaker {segment['speaker']}",
@@ -55,6 +166,7 @@ class ExamAudioDiarizer:
                     }
                     for segment in merged_segments
                 ],
+                "audio_duration": duration,
                 "total_duration": sum(segment['end_time'] - segment['start_time'] 
                                     for segment in merged_segments)
             }
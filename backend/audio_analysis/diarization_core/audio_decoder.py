@@ -0,0 +1,308 @@
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PIPE_READ_BYTES = 64 * 1024
+STREAM_PIPE_BYTES = 1024 * 1024  # ffmpeg's output pipe for live streams: ~30 s of 16 kHz PCM
+
+
+class AudioDecodeError(RuntimeError):
+    """ffmpeg is missing or could not decode the input."""
+
+
+class DecodedAudio:
+    """
+    Mono int16 PCM of a decoded recording.
+
+    `samples` is an in-memory array, or for long recordings a read-only
+    memory map of a scratch file that close() removes.
+    """
+    def __init__(self, samples, sample_rate, scratch_path=None):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.scratch_path = scratch_path
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def close(self):
+        self.samples = np.zeros(0, dtype=np.int16)
+        if self.scratch_path and os.path.exists(self.scratch_path):
+            try:
+                os.remove(self.scratch_path)
+            except OSError as e:
+                logger.warning(f"Could not remove scratch file {self.scratch_path}: {e}")
+        self.scratch_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PCMStream:
+    """
+    An ffmpeg process decoding a recording while it is still being written.
+
+    Encoded bytes go in with write() and decoded int16 PCM comes out of
+    read(), and neither blocks: both pipes are non-blocking, bytes ffmpeg is
+    not ready for are held until the next call, and read() returns whatever
+    has been decoded so far. One thread can drive hundreds of these.
+    """
+    def __init__(self, process):
+        self.process = process
+        self.finished = False
+        self._pending = bytearray()
+        self._closing = False
+        self._carry = b""
+        self._errors = b""
+        for pipe in (process.stdin, process.stdout, process.stderr):
+            os.set_blocking(pipe.fileno(), False)
+        if hasattr(fcntl, "F_SETPIPE_SZ"):  # Linux
+            try:
+                fcntl.fcntl(process.stdout.fileno(), fcntl.F_SETPIPE_SZ, STREAM_PIPE_BYTES)
+            except OSError:
+                pass  # a default-sized pipe only means ffmpeg waits for read() more often
+
+    def write(self, data):
+        """Queue encoded bytes for ffmpeg."""
+        self._pending += data
+        self._flush()
+
+    def close_input(self):
+        """No more bytes will come; read() reports `finished` once ffmpeg has decoded the rest."""
+        self._closing = True
+        self._flush()
+
+    def _flush(self):
+        stdin = self.process.stdin
+        while self._pending and not stdin.closed:
+            try:
+                written = os.write(stdin.fileno(), self._pending)
+            except BlockingIOError:
+                return
+            except BrokenPipeError:
+                self._pending.clear()  # ffmpeg exited; read() reports why
+                break
+            del self._pending[:written]
+        if self._closing and not self._pending and not stdin.closed:
+            stdin.close()
+
+    def _drain(self, pipe, limit):
+        pieces, size = [], 0
+        while size < limit:
+            try:
+                data = os.read(pipe.fileno(), min(STREAM_PIPE_BYTES, limit - size))
+            except BlockingIOError:
+                return b"".join(pieces), False
+            if not data:
+                return b"".join(pieces), True
+            pieces.append(data)
+            size += len(data)
+        return b"".join(pieces), False
+
+    def read(self, max_samples=None):
+        """
+        Decoded samples available now.
+
+        Args:
+            max_samples (int): Return at most this many, leaving the rest for later calls
+
+        Returns:
+            numpy.ndarray: int16 PCM, possibly empty
+
+        Raises:
+            AudioDecodeError: ffmpeg exited with an error
+        """
+        self._flush()
+        if self.finished:
+            return np.zeros(0, dtype=np.int16)
+        limit = max_samples * 2 if max_samples else float("inf")
+        data, eof = self._drain(self.process.stdout, limit)
+        errors, _ = self._drain(self.process.stderr, 64 * 1024)
+        self._errors = (self._errors + errors)[-4096:]
+
+        data = self._carry + data
+        usable = len(data) - len(data) % 2
+        self._carry = data[usable:]
+        if eof:
+            self.finished = True
+            returncode = self.process.wait()
+            self.process.stdin.close()
+            self.process.stdout.close()
+            self.process.stderr.close()
+            if returncode != 0:
+                message = self._errors.decode(errors="replace").strip()
+                raise AudioDecodeError(f"ffmpeg exited with {returncode}: {message[-500:]}")
+        return np.frombuffer(data[:usable], dtype=np.int16)
+
+    def kill(self):
+        """Stop ffmpeg without waiting for the rest of the audio."""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+            pipe.close()
+        self.finished = True
+
+
+class AudioDecoder:
+    """
+    Decodes any container/codec ffmpeg understands (webm/opus from MediaRecorder,
+    wav, mp3, ...) to 16-bit mono PCM at the analysis sample rate in one pass,
+    reading ffmpeg's output from a pipe instead of a converted file on disk.
+    """
+    def __init__(self, sample_rate=16000, chunk_seconds=5.0, spill_after_seconds=900,
+                 scratch_dir=None, ffmpeg=None):
+        """
+        Initialize the decoder.
+
+        Args:
+            sample_rate (int): Output sample rate in Hz
+            chunk_seconds (float): Audio handed to on_chunk at a time
+            spill_after_seconds (float): Length beyond which PCM is kept in a memory-mapped scratch file
+            scratch_dir (str): Directory for scratch files (system temp dir if None)
+            ffmpeg (str): ffmpeg executable; FFMPEG_BINARY or "ffmpeg" on the PATH if None
+        """
+        self.sample_rate = sample_rate
+        self.chunk_bytes = max(2, int(chunk_seconds * sample_rate) * 2)
+        self.spill_after_samples = int(spill_after_seconds * sample_rate)
+        self.scratch_dir = scratch_dir
+        self.ffmpeg = ffmpeg or os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+    def available(self):
+        return shutil.which(self.ffmpeg) is not None
+
+    def _command(self, input_name):
+        return [self.ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error",
+                "-i", input_name, "-vn", "-ac", "1", "-ar", str(self.sample_rate),
+                "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1"]
+
+    def iter_chunks(self, source):
+        """
+        Yield the decoded audio as int16 arrays of about chunk_seconds each.
+
+        Args:
+            source: Path of the recording, or a binary file object read to its end
+
+        Raises:
+            AudioDecodeError: ffmpeg is not installed or failed on the input
+        """
+        from_path = isinstance(source, (str, os.PathLike))
+        try:
+            process = subprocess.Popen(self._command(os.fspath(source) if from_path else "pipe:0"),
+                                       stdin=subprocess.DEVNULL if from_path else subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise AudioDecodeError(f"ffmpeg not found ({self.ffmpeg})")
+
+        if not from_path:
+            threading.Thread(target=self._feed, args=(source, process.stdin),
+                             name="ffmpeg-feed", daemon=True).start()
+        # collect stderr concurrently so a chatty ffmpeg cannot fill the pipe and stall
+        errors = []
+        stderr_reader = threading.Thread(target=lambda: errors.append(process.stderr.read()),
+                                         name="ffmpeg-stderr", daemon=True)
+        stderr_reader.start()
+
+        carry = b""
+        try:
+            while True:
+                data = process.stdout.read(self.chunk_bytes)
+                if not data:
+                    break
+                data = carry + data
+                usable = len(data) - len(data) % 2
+                carry = data[usable:]
+                if usable:
+                    yield np.frombuffer(data[:usable], dtype=np.int16)
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+            stderr_reader.join()
+        if returncode != 0:
+            message = b"".join(errors).decode(errors="replace").strip()
+            raise AudioDecodeError(f"ffmpeg exited with {returncode}: {message[-500:]}")
+
+    @staticmethod
+    def _feed(source, stdin):
+        try:
+            shutil.copyfileobj(source, stdin, PIPE_READ_BYTES)
+        except (BrokenPipeError, OSError):
+            pass  # ffmpeg stopped reading; its exit status reports why
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+    def open_stream(self):
+        """
+        Start decoding a recording that is still growing.
+
+        Returns:
+            PCMStream: Takes the recording's bytes in order as they arrive
+
+        Raises:
+            AudioDecodeError: ffmpeg is not installed
+        """
+        try:
+            process = subprocess.Popen(self._command("pipe:0"), stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        except FileNotFoundError:
+            raise AudioDecodeError(f"ffmpeg not found ({self.ffmpeg})")
+        return PCMStream(process)
+
+    def decode(self, source, on_chunk=None):
+        """
+        Decode a recording to int16 PCM.
+
+        Args:
+            source: Path of the recording, or a binary file object
+            on_chunk (callable): Called with each int16 chunk as it is decoded,
+                e.g. VoiceActivityStream.feed, so analysis overlaps decoding
+
+        Returns:
+            DecodedAudio: PCM in memory, or memory-mapped once past spill_after_seconds
+        """
+        chunks, total, scratch, scratch_path = [], 0, None, None
+        try:
+            for chunk in self.iter_chunks(source):
+                if on_chunk is not None:
+                    on_chunk(chunk)
+                total += len(chunk)
+                if scratch is None and total > self.spill_after_samples:
+                    fd, scratch_path = tempfile.mkstemp(suffix=".pcm", dir=self.scratch_dir)
+                    scratch = os.fdopen(fd, "wb")
+                    for pending in chunks:
+                        scratch.write(pending.tobytes())
+                    chunks = []
+                if scratch is not None:
+                    scratch.write(chunk.tobytes())
+                else:
+                    chunks.append(chunk)
+        except BaseException:
+            if scratch is not None:
+                scratch.close()
+                os.remove(scratch_path)
+            raise
+
+        if scratch is None:
+            samples = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+            return DecodedAudio(samples, self.sample_rate)
+        scratch.close()
+        logger.info(f"Decoded {total / self.sample_rate:.0f}s of audio into scratch file {scratch_path}")
+        return DecodedAudio(np.memmap(scratch_path, dtype=np.int16, mode="r"), self.sample_rate, scratch_path)
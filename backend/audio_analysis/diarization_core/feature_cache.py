@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# bump when the stored layout or the meaning of a fingerprint changes
+FORMAT_VERSION = 1
+
+READ_SIZE = 1024 * 1024
+
+
+class CachedFeatures:
+    """
+    A cache entry: the VAD segments of a recording and the MFCC matrix of each
+    segment kept by the feature extractor. The matrices are views on one
+    memory-mapped array, so nothing is read until a segment is used.
+    """
+    def __init__(self, path, voice_segments, features_list, meta):
+        self.path = path
+        self.voice_segments = voice_segments
+        self.features_list = features_list
+        self.meta = meta
+
+
+class FeatureCache:
+    """
+    VAD segments and MFCCs of recordings, stored on disk and keyed by the hash
+    of the recording's bytes and of the settings that produced them.
+
+    The same audio therefore hits the cache under any file name (a recording
+    fetched and posted again to /api/audio-analysis, say), and changing the
+    VAD or MFCC settings simply misses. Each entry is a directory
+    `<root>/<key[:2]>/<key>/` holding:
+        vad.npy       (n, 2) start and end of every voice segment, seconds
+        segments.npy  (m, 2) the segments features were extracted for
+        offsets.npy   (m + 1,) first frame of each of those in features.npy
+        features.npy  (coefficients, frames) all segments' MFCCs side by side
+        meta.json     settings, source, sizes
+    Entries are written to a temporary directory and renamed into place, so
+    a reader never sees half an entry. A hit refreshes the entry's mtime;
+    evict() drops entries unused for max_age_seconds, then the least recently
+    used until the cache fits in max_bytes.
+    """
+    def __init__(self, root, max_age_seconds=None, max_bytes=None, evict_interval=600):
+        """
+        Initialize the cache.
+
+        Args:
+            root (str): Cache directory
+            max_age_seconds (float): Entries unused for longer are evicted (None: no age limit)
+            max_bytes (int): Size the cache is trimmed to (None: no size limit)
+            evict_interval (float): Seconds between the evictions put() runs by itself
+        """
+        self.root = root
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self._last_eviction = 0.0
+
+    def key(self, audio_path, fingerprint):
+        """
+        Cache key of a recording.
+
+        Args:
+            audio_path (str): The recording
+            fingerprint (dict): Settings the features depend on (JSON serializable)
+
+        Returns:
+            str: Hex SHA-256 of the settings and the file's bytes
+        """
+        digest = hashlib.sha256(json.dumps({"version": FORMAT_VERSION, **fingerprint},
+                                           sort_keys=True).encode())
+        with open(audio_path, "rb") as f:
+            while True:
+                block = f.read(READ_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """
+        Returns:
+            CachedFeatures: The entry, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            voice_segments = np.load(os.path.join(path, "vad.npy"))
+            segments = np.load(os.path.join(path, "segments.npy"))
+            offsets = np.load(os.path.join(path, "offsets.npy"))
+            features = np.load(os.path.join(path, "features.npy"), mmap_mode="r")
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Unreadable feature cache entry {path}: {e}")
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)  # recently used, for eviction
+        except OSError:
+            pass
+        self.hits += 1
+        features_list = [
+            {'start_time': float(start), 'end_time': float(end), 'features': features[:, first:last]}
+            for (start, end), first, last in zip(segments, offsets[:-1], offsets[1:])
+        ]
+        return CachedFeatures(path, [tuple(segment) for segment in voice_segments.tolist()], features_list, meta)
+
+    def put(self, key, voice_segments, features_list, **meta):
+        """
+        Store a recording's segments and features under `key`.
+
+        Args:
+            key (str): From key()
+            voice_segments (list): (start, end) of every voice segment
+            features_list (list): Feature dictionaries from FeatureExtractor.extract_features_from_segments
+            **meta: Extra fields for meta.json (e.g. source)
+
+        Returns:
+            str: The entry's directory
+        """
+        path = self._path(key)
+        os.makedirs(self.root, exist_ok=True)
+        staging = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        try:
+            lengths = [f['features'].shape[1] for f in features_list]
+            offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+            n_coefficients = features_list[0]['features'].shape[0] if features_list else 0
+            dtype = features_list[0]['features'].dtype if features_list else np.float32
+            np.save(os.path.join(staging, "vad.npy"), np.asarray(voice_segments, dtype=np.float64).reshape(-1, 2))
+            np.save(os.path.join(staging, "segments.npy"),
+                    np.array([(f['start_time'], f['end_time']) for f in features_list], dtype=np.float64).reshape(-1, 2))
+            np.save(os.path.join(staging, "offsets.npy"), offsets)
+            # filled segment by segment rather than concatenated in memory first
+            features = np.lib.format.open_memmap(os.path.join(staging, "features.npy"), mode="w+",
+                                                 dtype=dtype, shape=(n_coefficients, int(offsets[-1])))
+            for f, first, last in zip(features_list, offsets[:-1], offsets[1:]):
+                features[:, first:last] = f['features']
+            features.flush()
+            del features
+            with open(os.path.join(staging, "meta.json"), "w") as f:
+                json.dump({"version": FORMAT_VERSION, "created": time.time(), "segments": len(features_list),
+                           "frames": int(offsets[-1]), **meta}, f)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.rename(staging, path)
+            except OSError:
+                # another process stored the same recording first
+                shutil.rmtree(staging, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        if time.monotonic() - self._last_eviction > self.evict_interval:
+            self.evict()
+        return path
+
+    def _entries(self):
+        """(last used, bytes, path) of every entry."""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for shard in os.scandir(self.root):
+            if not shard.is_dir() or shard.name.startswith(".tmp-"):
+                continue
+            try:
+                for entry in os.scandir(shard.path):
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+            except OSError:
+                continue  # evicted by another process meanwhile
+        return entries
+
+    def _remove_abandoned_staging(self, older_than=3600):
+        """Staging directories left by writers that died before renaming them into place."""
+        if not os.path.isdir(self.root):
+            return
+        for entry in os.scandir(self.root):
+            try:
+                if entry.name.startswith(".tmp-") and entry.stat().st_mtime < time.time() - older_than:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                continue
+
+    def evict(self, max_age_seconds=None, max_bytes=None):
+        """
+        Remove entries unused for too long, then the least recently used ones
+        until the cache fits. Limits default to the ones the cache was built with.
+
+        Returns:
+            tuple: (entries removed, bytes freed)
+        """
+        self._last_eviction = time.monotonic()
+        self._remove_abandoned_staging()
+        max_age_seconds = self.max_age_seconds if max_age_seconds is None else max_age_seconds
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        cutoff = time.time() - max_age_seconds if max_age_seconds is not None else None
+        removed, freed = 0, 0
+        for used, size, path in entries:
+            too_old = cutoff is not None and used < cutoff
+            too_big = max_bytes is not None and total - freed > max_bytes
+            if not (too_old or too_big):
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            removed, freed = removed + 1, freed + size
+        if removed:
+            logger.info(f"Evicted {removed} feature cache entries ({freed / 2 ** 20:.1f} MiB)")
+        return removed, freed
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "oldest": min((used for used, _, _ in entries), default=None),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
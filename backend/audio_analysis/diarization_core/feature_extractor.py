@@ -1,14 +1,47 @@
 import numpy as np
 import librosa
+import scipy.fft
 import logging
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
+
+@lru_cache(maxsize=8)
+def _mel_basis(sample_rate, n_fft, n_mels):
+    """Mel filterbank, built once per configuration and shared by every call."""
+    basis = librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels)
+    basis.setflags(write=False)
+    return basis
+
+
+@lru_cache(maxsize=8)
+def _dct_basis(n_mels, n_mfcc):
+    """Orthonormal DCT-II rows that turn a log-mel frame into MFCCs (as librosa.feature.mfcc)."""
+    basis = scipy.fft.dct(np.eye(n_mels), type=2, norm='ortho', axis=0)[:n_mfcc]
+    basis.setflags(write=False)
+    return basis
+
+
+@lru_cache(maxsize=8)
+def _delta_operator(width, order):
+    """
+    librosa.feature.delta (a Savitzky-Golay filter in 'interp' mode) as a
+    width x width matrix A on a window of `width` frames: row width // 2 holds
+    the interior coefficients, the rows before and after it the polynomial
+    fits used for the first and last width // 2 frames of a sequence.
+    """
+    impulses = np.eye(width)
+    operator = librosa.feature.delta(impulses, width=width, order=order, axis=-1, mode='interp').T
+    operator.setflags(write=False)
+    return operator
+
 class FeatureExtractor:
     """
     Class for extracting MFCC features from audio for diarization.
     """
-    def __init__(self, sample_rate=16000, n_mfcc=13, n_mels=40, n_fft=512, hop_length=160):
+    def __init__(self, sample_rate=16000, n_mfcc=13, n_mels=40, n_fft=512, hop_length=160,
+                 single_pass=True, max_block_seconds=60, top_db=80.0):
         """
         Initialize the feature extractor.
         
@@ -18,12 +51,19 @@ class FeatureExtractor:
             n_mels (int): Number of Mel bands to generate
             n_fft (int): Length of the FFT window
             hop_length (int): Number of samples between successive frames
+            single_pass (bool): Compute the spectrogram once over the recording and
+                slice it per segment, instead of running librosa per segment
+            max_block_seconds (float): Longest span of audio transformed at once in single-pass mode
+            top_db (float): Dynamic range kept below each segment's loudest mel bin
         """
         self.sample_rate = sample_rate
         self.n_mfcc = n_mfcc
         self.n_mels = n_mels
         self.n_fft = n_fft
         self.hop_length = hop_length
+        self.single_pass = single_pass
+        self.max_block_frames = int(max_block_seconds * sample_rate / hop_length)
+        self.top_db = top_db
         
         logger.debug(f"Initialized feature extractor with {n_mfcc} MFCCs, "
                      f"{n_mels} Mel bands, FFT window {n_fft}, hop length {hop_length}")
@@ -72,7 +112,7 @@ class FeatureExtractor:
         Extract features from voice segments in audio data.
         
         Args:
-            audio_data (numpy.ndarray): Audio time series
+            audio_data (numpy.ndarray): Audio time series, float or int16 PCM (memory-mapped is fine)
             segments (list): List of (start_time, end_time) tuples
             sample_rate (int): Sample rate of the audio data
             
@@ -82,6 +122,12 @@ class FeatureExtractor:
         if sample_rate is None:
             sample_rate = self.sample_rate
             
+        if self.single_pass:
+            return self._extract_features_single_pass(audio_data, segments, sample_rate)
+        
+        if np.issubdtype(audio_data.dtype, np.integer):
+            audio_data = audio_data.astype(np.float32) / 32768.0
+            
         features_list = []
         
         for start_time, end_time in segments:
@@ -109,4 +155,148 @@ class FeatureExtractor:
                 logger.error(f"Error extracting features for segment {start_time}-{end_time}: {str(e)}")
                 
         logger.info(f"Extracted features from {len(features_list)} segments")
-        return features_list 
\ No newline at end of file
+        return features_list
+    
+    def _block_samples(self, audio_data, first_frame, last_frame):
+        """
+        Samples covering frames [first_frame, last_frame) as float32, zero-padded
+        past either end of the recording, so frame i is centred on sample
+        i * hop_length exactly as a centred STFT would be. Only the block is
+        copied, so audio_data may be int16 PCM or a memory map of it.
+        """
+        half = self.n_fft // 2
+        start = first_frame * self.hop_length - half
+        stop = (last_frame - 1) * self.hop_length + half
+        block = np.zeros(stop - start, dtype=np.float32)
+        lo, hi = max(start, 0), min(stop, len(audio_data))
+        if hi > lo:
+            block[lo - start:hi - start] = audio_data[lo:hi]
+            if np.issubdtype(audio_data.dtype, np.integer):
+                block /= 32768.0
+        return block
+    
+    def _log_mel_frames(self, audio_data, first_frame, last_frame):
+        """
+        Log-power mel spectrogram of frames [first_frame, last_frame) of the recording.
+        """
+        block = self._block_samples(audio_data, first_frame, last_frame)
+        power = np.abs(librosa.stft(block, n_fft=self.n_fft,
+                                    hop_length=self.hop_length, center=False)) ** 2
+        mel = _mel_basis(self.sample_rate, self.n_fft, self.n_mels) @ power
+        return 10.0 * np.log10(np.maximum(1e-10, mel))
+    
+    def _delta(self, mfccs, starts, lengths, order, width=9):
+        """
+        Deltas of several segments stored back to back in `mfccs`, equal to
+        librosa.feature.delta applied to each segment separately.
+        """
+        operator = _delta_operator(width, order)
+        half = width // 2
+        out = np.empty_like(mfccs)
+        if mfccs.shape[1] >= width:
+            windows = np.lib.stride_tricks.sliding_window_view(mfccs, width, axis=1)
+            out[:, half:mfccs.shape[1] - half] = windows @ operator[half]
+        
+        long_enough = lengths >= width
+        if long_enough.any():
+            # edge frames of every segment at once: polynomial fits over its first/last `width` frames
+            first = starts[long_enough][:, None]
+            last = (starts + lengths)[long_enough][:, None] - width
+            window = np.arange(width)
+            out[:, first + window[:half]] = mfccs[:, first + window] @ operator[:half].T
+            out[:, last + window[half + 1:]] = mfccs[:, last + window] @ operator[half + 1:].T
+        for start, length in zip(starts[~long_enough], lengths[~long_enough]):
+            # too short for a full window; pad with the edge frames instead
+            out[:, start:start + length] = librosa.feature.delta(
+                mfccs[:, start:start + length], width=width, order=order, mode='nearest')
+        return out
+    
+    def _block_features(self, log_mel, local_ranges):
+        """
+        MFCC + delta + delta-delta for every segment of one block, computed on
+        the segments' frames laid back to back.
+        """
+        lengths = np.array([last - first for first, last in local_ranges])
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        frames = np.concatenate([np.arange(first, last) for first, last in local_ranges])
+        log_mel = log_mel[:, frames]
+        
+        if self.top_db is not None:
+            # dynamic range per segment, relative to its loudest bin; the reference is taken
+            # over frames whose window lies inside the segment, as zero-padded edges would be quieter
+            loudest = log_mel.max(axis=0)
+            edge = self.n_fft // (2 * self.hop_length)
+            floors = np.empty(len(lengths))
+            for i, (start, length) in enumerate(zip(starts, lengths)):
+                inner = loudest[start + edge:start + length - edge] if length > 2 * edge else loudest[start:start + length]
+                floors[i] = inner.max() - self.top_db
+            log_mel = np.maximum(log_mel, np.repeat(floors, lengths)[None, :])
+        
+        mfccs = _dct_basis(self.n_mels, self.n_mfcc) @ log_mel
+        features = np.vstack([mfccs,
+                              self._delta(mfccs, starts, lengths, order=1),
+                              self._delta(mfccs, starts, lengths, order=2)])
+        return [features[:, start:start + length] for start, length in zip(starts, lengths)]
+    
+    def _extract_features_single_pass(self, audio_data, segments, sample_rate):
+        """
+        Single-pass counterpart of extract_features_from_segments.
+        
+        Nearby segments are grouped into blocks of at most max_block_seconds, and
+        each block gets one STFT and one mel projection with the cached filterbank.
+        Segments are then sliced out by frame range starting at the frame nearest
+        their first sample. For a segment starting on the hop grid, frames whose
+        analysis window lies inside it are identical to the per-segment result and
+        only the zero-padded edge frames differ; otherwise frames are offset by
+        less than half a hop. Segments shorter than n_fft are kept.
+        """
+        if sample_rate != self.sample_rate:
+            logger.info(f"Resampling from {sample_rate}Hz to {self.sample_rate}Hz")
+            if np.issubdtype(audio_data.dtype, np.integer):
+                audio_data = audio_data.astype(np.float32) / 32768.0
+            audio_data = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=self.sample_rate)
+            sample_rate = self.sample_rate
+        
+        hop = self.hop_length
+        total_frames = 1 + len(audio_data) // hop
+        
+        # frame range of each segment, as a centred STFT of the segment alone would produce
+        ranges = []
+        for start_time, end_time in sorted(segments):
+            start_sample = int(start_time * sample_rate)
+            end_sample = min(int(end_time * sample_rate), len(audio_data))
+            if end_sample <= start_sample:
+                continue
+            first = int(round(start_sample / hop))
+            last = min(first + 1 + (end_sample - start_sample) // hop, total_frames)
+            ranges.append((start_time, end_time, first, last))
+        
+        features_list = []
+        i = 0
+        while i < len(ranges):
+            # grow a block of consecutive segments up to max_block_frames
+            block_first, block_last = ranges[i][2], ranges[i][3]
+            j = i + 1
+            while j < len(ranges) and max(block_last, ranges[j][3]) - block_first <= self.max_block_frames:
+                block_last = max(block_last, ranges[j][3])
+                j += 1
+            
+            try:
+                log_mel = self._log_mel_frames(audio_data, block_first, block_last)
+            except Exception as e:
+                logger.error(f"Error extracting features for frames {block_first}-{block_last}: {str(e)}")
+                i = j
+                continue
+            
+            block = ranges[i:j]
+            local_ranges = [(first - block_first, last - block_first) for _, _, first, last in block]
+            for (start_time, end_time, _, _), features in zip(block, self._block_features(log_mel, local_ranges)):
+                features_list.append({
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'features': features
+                })
+            i = j
+        
+        logger.info(f"Extracted features from {len(features_list)} segments")
+        return features_list
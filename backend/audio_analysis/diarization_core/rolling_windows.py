@@ -0,0 +1,146 @@
+import numpy as np
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class RollingSpeakerWindows:
+    """
+    Speaker count, speech ratio and speaker changes over a rolling window of a
+    recording, computed while it is being decoded.
+
+    The audio is cut into hops (15 s by default). When a hop is complete, its
+    voice segments from a streaming VAD are turned into MFCCs and pooled into
+    window embeddings, once. Only the embeddings of the last window_seconds
+    are kept, and each hop ends with a summary of the window ending there,
+    clustered from those embeddings alone. The work per hop is therefore
+    bounded by the window length however long the recording runs, and the
+    PCM held is at most one hop.
+    """
+    def __init__(self, voice_detector, feature_extractor, speaker_diarizer,
+                 window_seconds=30.0, hop_seconds=15.0, start_seconds=0.0):
+        """
+        Initialize the rolling windows.
+
+        Args:
+            voice_detector (VoiceDetector): VAD for this recording alone (the WebRTC VAD adapts to its input)
+            feature_extractor (FeatureExtractor): MFCC extractor, may be shared
+            speaker_diarizer (SpeakerDiarization): Pools embeddings and estimates speaker counts, may be shared
+            window_seconds (float): Audio each summary covers
+            hop_seconds (float): Audio between summaries
+            start_seconds (float): Resume point; audio before the hop boundary at or below it is skipped
+        """
+        self.sample_rate = voice_detector.sample_rate
+        self.voice_detector = voice_detector
+        self.feature_extractor = feature_extractor
+        self.speaker_diarizer = speaker_diarizer
+        self.hop_samples = int(hop_seconds * self.sample_rate)
+        self.hops = deque(maxlen=max(1, round(window_seconds / hop_seconds)))
+
+        # samples are counted from the start of the recording; VAD times from `origin`
+        self.origin = int(start_seconds * self.sample_rate) // self.hop_samples * self.hop_samples
+        self.samples_seen = 0
+        self.hop_start = self.origin
+        self.vad = voice_detector.stream()
+        self._segments = []
+        self._pieces = []
+
+    def _seconds(self, sample):
+        return sample / self.sample_rate
+
+    def feed(self, chunk):
+        """
+        Process the next decoded audio.
+
+        Args:
+            chunk (numpy.ndarray): int16 PCM following the audio fed so far
+
+        Returns:
+            list: Summaries of the windows that ended in this chunk
+        """
+        summaries = []
+        if self.samples_seen < self.origin:
+            skipped = min(len(chunk), self.origin - self.samples_seen)
+            self.samples_seen += skipped
+            chunk = chunk[skipped:]
+
+        while len(chunk):
+            room = self.hop_start + self.hop_samples - self.samples_seen
+            piece, chunk = chunk[:room], chunk[room:]
+            self._segments.extend(self.vad.feed(piece))
+            self._pieces.append(piece)
+            self.samples_seen += len(piece)
+            if self.samples_seen == self.hop_start + self.hop_samples:
+                summaries.append(self._close_hop())
+        return summaries
+
+    def close(self):
+        """
+        Finish the recording.
+
+        Returns:
+            list: The summary of the window ending with the last (partial) hop, if any audio is left
+        """
+        self._segments.extend(self.vad.close())
+        if self.samples_seen <= self.hop_start:
+            return []
+        return [self._close_hop()]
+
+    def _hop_segments(self):
+        """Voice segments of the current hop, clipped to it, in seconds from its start."""
+        hop_start = self._seconds(self.hop_start - self.origin)
+        hop_end = self._seconds(self.samples_seen - self.origin)
+        segments = list(self._segments)
+        if self.vad.in_speech:
+            # still talking at the end of the hop: the rest of the segment goes to the next one
+            segments.append((self.vad.speech_start, hop_end))
+        self._segments = []
+
+        clipped = []
+        for start, end in segments:
+            start, end = max(start, hop_start), min(end, hop_end)
+            if end > start:
+                clipped.append((start - hop_start, end - hop_start))
+        return clipped
+
+    def _close_hop(self):
+        audio = np.concatenate(self._pieces)
+        self._pieces = []
+        segments = self._hop_segments()
+        features_list = self.feature_extractor.extract_features_from_segments(audio, segments, self.sample_rate)
+        embeddings, _, weights = self.speaker_diarizer.pool_windows(features_list)
+        self.hops.append({
+            "start": self._seconds(self.hop_start),
+            "end": self._seconds(self.samples_seen),
+            "voiced": sum(end - start for start, end in segments),
+            "embeddings": embeddings,
+            "weights": weights,
+        })
+        self.hop_start = self.samples_seen
+        return self._summarize()
+
+    def _summarize(self):
+        """Speakers in the window made of the kept hops, and turns taken in its newest hop."""
+        start, end = self.hops[0]["start"], self.hops[-1]["end"]
+        voiced = sum(hop["voiced"] for hop in self.hops)
+        pooled = [hop for hop in self.hops if len(hop["embeddings"])]
+
+        speakers, changes = 0, 0
+        if pooled:
+            embeddings = self.speaker_diarizer.standardize(np.vstack([hop["embeddings"] for hop in pooled]))
+            weights = np.concatenate([hop["weights"] for hop in pooled])
+            speakers, _ = self.speaker_diarizer.estimate_num_speakers(embeddings, weights)
+            newest = len(self.hops[-1]["embeddings"])
+            if speakers > 1 and newest:
+                labels = self.speaker_diarizer.window_labels(embeddings, weights, speakers)
+                # embeddings are in time order; count label switches reaching into the newest hop
+                recent = labels[max(len(labels) - newest - 1, 0):]
+                changes = int(np.count_nonzero(np.diff(recent)))
+
+        return {
+            "start": round(start, 2),
+            "end": round(end, 2),
+            "speechRatio": round(voiced / (end - start), 3) if end > start else 0.0,
+            "speakers": int(speakers),
+            "speakerChanges": changes,
+        }
@@ -1,87 +1,231 @@
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances, silhouette_score
 import logging
-from collections import Counter
 
 logger = logging.getLogger(__name__)
 
 class SpeakerDiarization:
     """
     Class for performing speaker diarization using MFCC features.
+    
+    Frames are not clustered one by one: each segment is cut into windows of
+    about a second, every window is summarized by the mean and standard
+    deviation of its frames, and the windows are clustered. A segment takes
+    the speaker holding most of its frames. Memory and time grow with the
+    number of windows, roughly one per second of speech.
+    
+    With num_speakers=None the number of speakers is estimated for each
+    recording (see estimate_num_speakers).
     """
-    def __init__(self, num_speakers=2, method='kmeans'):
+    def __init__(self, num_speakers=2, method='kmeans', window_frames=100, batch_size=1024,
+                 max_speakers=4, min_silhouette=0.5, max_estimation_windows=1000, min_speech_frames=100):
         """
         Initialize the speaker diarization system.
         
         Args:
-            num_speakers (int): Number of speakers to identify
-            method (str): Clustering method ('kmeans', 'agglomerative', etc.)
+            num_speakers (int): Number of speakers to identify, or None to estimate it
+            method (str): Clustering method ('kmeans', fitted as mini-batch k-means)
+            window_frames (int): Frames pooled into one embedding (100 frames = 1 s at a 10 ms hop)
+            batch_size (int): Embeddings per mini-batch
+            max_speakers (int): Largest speaker count considered when estimating
+            min_silhouette (float): Silhouette the best split must reach to report more than one speaker
+            max_estimation_windows (int): Windows sampled for the estimate, bounding its cost
+            min_speech_frames (int): Voiced frames needed before any speaker is reported when estimating
         """
         self.num_speakers = num_speakers
         self.method = method
+        self.window_frames = window_frames
+        self.batch_size = batch_size
+        self.max_speakers = max_speakers
+        self.min_silhouette = min_silhouette
+        self.max_estimation_windows = max_estimation_windows
+        self.min_speech_frames = min_speech_frames
+        self.speaker_count_scores = {}
         
         if method == 'kmeans':
-            self.model = KMeans(n_clusters=num_speakers, random_state=42)
+            self.model = self._make_model(num_speakers or 1)
         else:
             raise ValueError(f"Unsupported diarization method: {method}")
             
         logger.debug(f"Initialized speaker diarization with {num_speakers} speakers using {method}")
     
-    def _prepare_features_for_clustering(self, features_list):
+    def _make_model(self, n_clusters):
+        return MiniBatchKMeans(n_clusters=n_clusters, batch_size=self.batch_size,
+                               n_init=3, random_state=42)
+    
+    def pool_windows(self, features_list):
         """
-        Prepare features for clustering.
+        Pool each segment's frames into window embeddings: the mean and standard
+        deviation of every coefficient over window_frames frames.
         
         Args:
             features_list (list): List of feature dictionaries
             
         Returns:
-            tuple: (feature matrix, segment indices)
+            tuple: (embedding matrix, segment index of each window, frames in each window)
         """
-        # Extract segment indices and flatten features
-        segment_indices = []
-        all_features = []
+        embeddings, owners, weights = [], [], []
         
         for i, feature_dict in enumerate(features_list):
-            # Transpose to get frames as rows, features as columns
-            frames = feature_dict['features'].T
+            features = feature_dict['features']
+            n_frames = features.shape[1]
+            if n_frames == 0:
+                continue
             
-            # Add to the feature matrix
-            all_features.append(frames)
+            # window boundaries; a short tail is folded into the window before it
+            bounds = np.arange(0, n_frames, self.window_frames)
+            if len(bounds) > 1 and n_frames - bounds[-1] < self.window_frames // 2:
+                bounds = bounds[:-1]
+            counts = np.diff(np.append(bounds, n_frames))
             
-            # Keep track of which segment each frame belongs to
-            segment_indices.extend([i] * frames.shape[0])
+            mean = np.add.reduceat(features, bounds, axis=1) / counts
+            variance = np.add.reduceat(features ** 2, bounds, axis=1) / counts - mean ** 2
+            embeddings.append(np.vstack([mean, np.sqrt(np.maximum(variance, 0))]).T)
+            owners.append(np.full(len(bounds), i))
+            weights.append(counts)
+        
+        if not embeddings:
+            return np.empty((0, 0)), np.empty(0, dtype=int), np.empty(0, dtype=int)
+        return np.vstack(embeddings), np.concatenate(owners), np.concatenate(weights)
+    
+    @staticmethod
+    def standardize(embeddings):
+        """Put the means and spreads of every coefficient on the same scale."""
+        scale = embeddings.std(axis=0)
+        scale[scale == 0] = 1.0
+        return (embeddings - embeddings.mean(axis=0)) / scale
+    
+    def _prepare_features_for_clustering(self, features_list):
+        """
+        Pool each segment's frames into standardized window embeddings.
+        
+        Args:
+            features_list (list): List of feature dictionaries
             
-        # Combine all features
-        feature_matrix = np.vstack(all_features)
-        segment_indices = np.array(segment_indices)
+        Returns:
+            tuple: (embedding matrix, segment index of each window, frames in each window)
+        """
+        embedding_matrix, owners, weights = self.pool_windows(features_list)
+        return self.standardize(embedding_matrix), owners, weights
+    
+    @staticmethod
+    def _timbre(embeddings):
+        """
+        Columns of the window embeddings that describe the voice rather than the
+        loudness or the rhythm: the means of MFCCs 1..n_mfcc-1. Each embedding
+        holds the means then the deviations of n_mfcc coefficients and their two
+        deltas, so n_mfcc is a sixth of its width.
+        """
+        n_mfcc = embeddings.shape[1] // 6
+        return embeddings[:, 1:n_mfcc]
+    
+    @staticmethod
+    def _split_widest(points, labels, centers):
+        """
+        Initial centres for k + 1 clusters from a k-cluster fit: the cluster with
+        the largest spread is replaced by two centres one standard deviation either
+        side of its mean, along its principal axis.
+        """
+        spread = [((points[labels == j] - center) ** 2).sum() for j, center in enumerate(centers)]
+        widest = int(np.argmax(spread))
+        members = points[labels == widest]
+        _, singular_values, axes = np.linalg.svd(members - centers[widest], full_matrices=False)
+        step = axes[0] * singular_values[0] / np.sqrt(len(members))
+        return np.vstack([np.delete(centers, widest, axis=0),
+                          centers[widest] - step, centers[widest] + step])
+    
+    def estimate_num_speakers(self, embeddings, window_weights=None):
+        """
+        Estimate how many speakers a set of window embeddings holds.
+        
+        k-means is fitted for k = 2..max_speakers, each fit starting from the
+        previous one with its widest cluster split in two, and scored by its
+        silhouette against one pairwise distance matrix computed up front. The
+        best k is kept if its silhouette reaches min_silhouette; otherwise a
+        single speaker is assumed. At most max_estimation_windows windows are
+        used, so the cost does not grow with the recording length, and windows
+        shorter than half window_frames are left out. Less than min_speech_frames
+        of speech counts as nobody speaking.
         
-        return feature_matrix, segment_indices
+        Args:
+            embeddings (numpy.ndarray): Window embeddings from _prepare_features_for_clustering
+            window_weights (numpy.ndarray): Frames in each window, if known
+            
+        Returns:
+            tuple: (estimated speaker count, dict of silhouette per k)
+        """
+        speech_frames = len(embeddings) * self.window_frames if window_weights is None else window_weights.sum()
+        if len(embeddings) == 0 or speech_frames < self.min_speech_frames:
+            return 0, {}
+        
+        points = self._timbre(embeddings)
+        if window_weights is not None:
+            # windows from very short segments are too noisy to stand for a voice
+            points = points[window_weights >= self.window_frames // 2]
+        if len(points) > self.max_estimation_windows:
+            sample = np.random.default_rng(42).choice(len(points), self.max_estimation_windows, replace=False)
+            points = points[sample]
+        max_k = min(self.max_speakers, len(points) - 1)
+        if max_k < 2:
+            return 1, {}
+        
+        distances = pairwise_distances(points)
+        labels = np.zeros(len(points), dtype=int)
+        centers = points.mean(axis=0, keepdims=True)
+        scores = {}
+        for k in range(2, max_k + 1):
+            init = self._split_widest(points, labels, centers)
+            model = KMeans(n_clusters=k, init=init, n_init=1).fit(points)
+            centers, labels = model.cluster_centers_, model.labels_
+            if len(np.unique(labels)) < 2:
+                break
+            scores[k] = float(silhouette_score(distances, labels, metric='precomputed'))
+        
+        if not scores:
+            return 1, scores
+        best = max(scores, key=scores.get)
+        return (best if scores[best] >= self.min_silhouette else 1), scores
     
-    def _assign_speakers_to_segments(self, cluster_labels, segment_indices, features_list):
+    def window_labels(self, embeddings, window_weights, num_speakers):
+        """
+        Cluster window embeddings into speakers, weighting each window by its frame count.
+        
+        Args:
+            embeddings (numpy.ndarray): Standardized window embeddings
+            window_weights (numpy.ndarray): Frames in each window
+            num_speakers (int): Number of clusters (capped at the number of windows)
+            
+        Returns:
+            numpy.ndarray: Cluster label of each window
+        """
+        n_clusters = min(num_speakers, len(embeddings))
+        if n_clusters != self.model.n_clusters:
+            self.model = self._make_model(n_clusters)
+        self.model.fit(embeddings, sample_weight=window_weights)
+        return self.model.labels_
+    
+    def _assign_speakers_to_segments(self, cluster_labels, window_owners, window_weights, features_list):
         """
         Assign speakers to segments based on clustering.
         
         Args:
-            cluster_labels (numpy.ndarray): Cluster assignments for each frame
-            segment_indices (numpy.ndarray): Segment index for each frame
+            cluster_labels (numpy.ndarray): Cluster assignment of each window
+            window_owners (numpy.ndarray): Segment index of each window
+            window_weights (numpy.ndarray): Number of frames in each window
             features_list (list): Original feature list
             
         Returns:
             list: Feature list with speaker labels added
         """
-        # Count speaker occurrences for each segment
-        for i in range(len(features_list)):
-            # Find all frames belonging to this segment
-            segment_frames = (segment_indices == i)
-            
-            # Count occurrences of each speaker in this segment
-            speaker_counts = Counter(cluster_labels[segment_frames])
-            
-            # Assign the most common speaker
-            most_common_speaker = speaker_counts.most_common(1)[0][0]
-            
-            # Add to the feature dictionary
-            features_list[i]['speaker'] = most_common_speaker
+        # frames per (segment, speaker) in one pass, then the majority speaker of each segment
+        n_clusters = int(cluster_labels.max()) + 1
+        votes = np.bincount(window_owners * n_clusters + cluster_labels, weights=window_weights,
+                            minlength=len(features_list) * n_clusters)
+        speakers = votes.reshape(len(features_list), n_clusters).argmax(axis=1)
+        
+        for feature_dict, speaker in zip(features_list, speakers.tolist()):
+            feature_dict['speaker'] = speaker
             
         return features_list
     
@@ -95,24 +239,30 @@ class SpeakerDiarization:
         Returns:
             list: Segments with speaker labels
         """
+        self.speaker_count_scores = {}
         if not features_list:
             logger.warning("No features provided for diarization")
             return []
             
         try:
             # Prepare features for clustering
-            feature_matrix, segment_indices = self._prepare_features_for_clustering(features_list)
-            
-            # Fit the clustering model
-            logger.info(f"Clustering {feature_matrix.shape[0]} frames with {self.num_speakers} speakers")
-            self.model.fit(feature_matrix)
+            embeddings, window_owners, window_weights = self._prepare_features_for_clustering(features_list)
             
-            # Get cluster labels for each frame
-            cluster_labels = self.model.labels_
+            # Fit the clustering model, weighting each window by its frame count
+            num_speakers = self.num_speakers
+            if num_speakers is None:
+                num_speakers, self.speaker_count_scores = self.estimate_num_speakers(embeddings, window_weights)
+                logger.info(f"Estimated {num_speakers} speakers (silhouette by k: {self.speaker_count_scores})")
+                if num_speakers == 0:
+                    logger.info("Too little speech to attribute to a speaker")
+                    return []
+            logger.info(f"Clustering {len(embeddings)} windows ({int(window_weights.sum())} frames) "
+                        f"with {min(num_speakers, len(embeddings))} speakers")
+            cluster_labels = self.window_labels(embeddings, window_weights, num_speakers)
             
             # Assign speakers to segments
             labeled_segments = self._assign_speakers_to_segments(
-                cluster_labels, segment_indices, features_list
+                cluster_labels, window_owners, window_weights, features_list
             )
             
             logger.info(f"Successfully diarized {len(labeled_segments)} segments")
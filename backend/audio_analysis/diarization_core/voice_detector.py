@@ -1,7 +1,6 @@
 import numpy as np
 import librosa
 import webrtcvad
-import struct
 import logging
 from collections import deque
 
@@ -22,6 +21,7 @@ class VoiceDetector:
         """
         self.sample_rate = sample_rate
         self.frame_duration_ms = frame_duration_ms
+        self.aggressiveness = aggressiveness
         
         # Initialize WebRTC VAD
         self.vad = webrtcvad.Vad(aggressiveness)
@@ -57,11 +57,7 @@ class VoiceDetector:
             else:
                 frame = frame[:self.frame_size]
         
-        # Ensure the values are within the valid range for int16
-        frame = np.clip(frame, -32768, 32767)
-        
-        # Convert to int16 bytes
-        return struct.pack("%dh" % len(frame), *frame.astype(np.int16))
+        return self.to_pcm16(frame)
     
     def is_speech(self, frame):
         """
@@ -93,12 +89,56 @@ class VoiceDetector:
             logger.error(f"Error in speech detection: {str(e)}")
             return False
     
+    def to_pcm16(self, audio_data):
+        """
+        Convert a whole signal to 16-bit PCM bytes in one vectorized step.
+        
+        The scale is chosen from the dtype: floats are taken to be normalized
+        to [-1, 1] (what librosa.load returns) and scaled up, and unsigned PCM
+        is re-centred. Wider integers are taken as 16-bit samples in a wider
+        container unless some value is out of the int16 range, in which case
+        they are shifted down to 16 bits; narrower ones are shifted up.
+        
+        Args:
+            audio_data: Audio data as numpy array, or bytes already in 16-bit PCM
+            
+        Returns:
+            bytes: Little-endian int16 samples
+        """
+        if isinstance(audio_data, (bytes, bytearray, memoryview)):
+            return bytes(audio_data)
+        audio_data = np.asarray(audio_data)
+        kind, bits = audio_data.dtype.kind, audio_data.dtype.itemsize * 8
+        
+        if kind == 'f':
+            pcm = np.clip(audio_data, -1.0, 1.0) * 32767
+        elif kind == 'i' and bits > 16:
+            in_range = audio_data.size == 0 or (audio_data.min() >= -32768 and audio_data.max() <= 32767)
+            pcm = audio_data if in_range else audio_data >> (bits - 16)
+        elif kind == 'i':
+            pcm = audio_data if bits == 16 else audio_data.astype(np.int16) << (16 - bits)
+        elif kind == 'u':
+            centred = audio_data.astype(np.int64) - (1 << (bits - 1))
+            pcm = centred >> (bits - 16) if bits > 16 else centred << (16 - bits)
+        else:
+            raise TypeError(f"Unsupported audio dtype {audio_data.dtype}")
+        return pcm.astype('<i2').tobytes()
+    
+    def stream(self):
+        """
+        Start an incremental VAD pass.
+        
+        Returns:
+            VoiceActivityStream: Accepts audio chunks as they arrive
+        """
+        return VoiceActivityStream(self)
+    
     def detect_voice_segments(self, audio_data, sample_rate=None):
         """
         Detect voice segments in an audio file.
         
         Args:
-            audio_data: Audio data as numpy array
+            audio_data: Audio data as numpy array (float in [-1, 1] or integer PCM)
             sample_rate: Sample rate of the audio data, uses default if None
             
         Returns:
@@ -110,36 +150,110 @@ class VoiceDetector:
         # Resample if necessary
         if sample_rate != self.sample_rate:
             logger.info(f"Resampling from {sample_rate}Hz to {self.sample_rate}Hz")
+            audio_data = np.asarray(audio_data)
+            if audio_data.dtype.kind != 'f':
+                # librosa resamples floats only; go through normalized PCM
+                audio_data = np.frombuffer(self.to_pcm16(audio_data), dtype='<i2') / 32768.0
             audio_data = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=self.sample_rate)
             sample_rate = self.sample_rate
         
-        # Split into frames
-        num_frames = len(audio_data) // self.frame_size
-        voice_segments = []
-        in_speech = False
-        speech_start = 0
+        stream = self.stream()
+        voice_segments = stream.feed(audio_data)
+        voice_segments.extend(stream.close())
         
-        for i in range(num_frames):
-            frame = audio_data[i * self.frame_size:(i + 1) * self.frame_size]
-            frame_bytes = self._prepare_frame(frame)
-            
-            is_speech = self.is_speech(frame_bytes)
-            
-            # State transition: non-speech to speech
-            if is_speech and not in_speech:
-                speech_start = i * self.frame_duration_ms / 1000.0  # Convert to seconds
-                in_speech = True
-                
-            # State transition: speech to non-speech
-            elif not is_speech and in_speech:
-                speech_end = i * self.frame_duration_ms / 1000.0
-                voice_segments.append((speech_start, speech_end))
-                in_speech = False
-        
-        # Handle case where we end while still in speech
-        if in_speech:
-            speech_end = num_frames * self.frame_duration_ms / 1000.0
-            voice_segments.append((speech_start, speech_end))
-            
         logger.info(f"Detected {len(voice_segments)} voice segments")
-        return voice_segments 
\ No newline at end of file
+        return voice_segments
+
+
+class VoiceActivityStream:
+    """
+    Incremental voice activity detection over 16-bit PCM.
+    
+    Each chunk is converted to PCM once and walked with zero-copy memoryview
+    slices, one VAD frame at a time. A partial frame at the end of a chunk is
+    carried over to the next one, so chunks may be of any length, and
+    segment times are measured from the start of the stream.
+    """
+    def __init__(self, detector):
+        """
+        Args:
+            detector (VoiceDetector): Supplies the VAD, sample rate and frame size
+        """
+        self.detector = detector
+        self.frame_bytes = detector.frame_size * 2
+        self.frames_seen = 0
+        self.in_speech = False
+        self.speech_start = 0.0
+        self.decisions = deque(maxlen=detector.buffer_size)
+        self._remainder = b""
+    
+    def _decide(self, frame):
+        try:
+            speech = self.detector.vad.is_speech(frame, self.detector.sample_rate)
+        except Exception as e:
+            logger.error(f"Error in speech detection: {str(e)}")
+            speech = False
+        self.decisions.append(speech)
+        # Smoothed decision (majority vote)
+        return sum(self.decisions) > len(self.decisions) / 2
+    
+    def _time(self, frame_index):
+        return frame_index * self.detector.frame_duration_ms / 1000.0  # Convert to seconds
+    
+    def _step(self, frame, segments):
+        is_speech = self._decide(frame)
+        now = self._time(self.frames_seen)
+        
+        # State transition: non-speech to speech
+        if is_speech and not self.in_speech:
+            self.speech_start = now
+            self.in_speech = True
+        # State transition: speech to non-speech
+        elif not is_speech and self.in_speech:
+            segments.append((self.speech_start, now))
+            self.in_speech = False
+        self.frames_seen += 1
+    
+    def feed(self, chunk):
+        """
+        Process the next piece of audio.
+        
+        Args:
+            chunk: numpy array of samples at the detector's sample rate, or int16 PCM bytes
+            
+        Returns:
+            list: (start_time, end_time) tuples of the voice segments that ended in this chunk
+        """
+        pcm = memoryview(self.detector.to_pcm16(chunk))
+        segments = []
+        offset = 0
+        
+        if self._remainder:
+            needed = self.frame_bytes - len(self._remainder)
+            if len(pcm) < needed:
+                self._remainder += pcm.tobytes()
+                return segments
+            self._step(self._remainder + pcm[:needed].tobytes(), segments)
+            self._remainder = b""
+            offset = needed
+        
+        frame_bytes = self.frame_bytes
+        end = offset + (len(pcm) - offset) // frame_bytes * frame_bytes
+        for start in range(offset, end, frame_bytes):
+            self._step(pcm[start:start + frame_bytes], segments)
+        
+        self._remainder = pcm[end:].tobytes()
+        return segments
+    
+    def close(self):
+        """
+        Finish the stream. A trailing partial frame is dropped, as in a one-shot pass.
+        
+        Returns:
+            list: The segment still open at the end of the audio, if any
+        """
+        self._remainder = b""
+        if not self.in_speech:
+            return []
+        self.in_speech = False
+        return [(self.speech_start, self._time(self.frames_seen))]
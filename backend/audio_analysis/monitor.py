@@ -0,0 +1,334 @@
+"""
+Live audio monitoring: rolling-window speaker summaries of every recording
+while the exam is still running.
+
+Start one per machine, from the backend directory:
+    python -m audio_analysis.monitor --shards 8
+
+Recordings reach the server as chunked uploads (upload/recordings.py). The
+monitor polls audio_recordings for the ones that grew, and hands each to the
+shard process that owns it (by a hash of its id). A shard keeps an ffmpeg
+decoder and a RollingSpeakerWindows per recording, reads only the bytes that
+are new and sends back a summary (speaker count, speech ratio, speaker
+changes) every hop. The monitor writes the summaries to the attempts in bulk,
+once per poll. Shards default to one per core.
+"""
+import os
+import time
+import queue
+import signal
+import logging
+import zlib
+import argparse
+import datetime
+import threading
+import multiprocessing
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+BYTES_PER_PUMP = 256 * 1024       # encoded audio (about a minute of opus) handed to ffmpeg per pass
+SAMPLES_PER_PUMP = 16000 * 60     # decoded audio analyzed per pass, so one recording cannot starve the others
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class MonitoredRecording:
+    """Shard-side state of one recording: where it has been read to, its decoder and its windows."""
+    def __init__(self, update, diarizer, reader, settings):
+        self.recording_id = update["recordingId"]
+        self.exam_id = update["examId"]
+        self.username = update["username"]
+        self.file = update["file"]
+        self.size = 0
+        self.complete = False
+        self.offset = 0
+        self.last_growth = time.monotonic()
+        self.done = False
+        self.reader = reader
+        self.pcm = diarizer.decoder.open_stream()
+        self.windows = diarizer.rolling_windows(settings["window_seconds"], settings["hop_seconds"],
+                                                start_seconds=update.get("resumeSeconds", 0.0))
+
+    def update(self, update):
+        if update["size"] > self.size:
+            self.size = update["size"]
+            self.last_growth = time.monotonic()
+        self.complete = update["complete"]
+
+    def pump(self):
+        """Move new bytes into ffmpeg and decoded audio into the windows; returns finished summaries."""
+        if self.offset < self.size:
+            recording = {"file": self.file, "size": min(self.size, self.offset + BYTES_PER_PUMP)}
+            for piece in self.reader.read(recording, start=self.offset):
+                self.pcm.write(piece)
+                self.offset += len(piece)
+        if self.complete and self.offset >= self.size:
+            self.pcm.close_input()
+
+        summaries = self.windows.feed(self.pcm.read(SAMPLES_PER_PUMP))
+        if self.pcm.finished:
+            summaries.extend(self.windows.close())
+            self.done = True
+        return summaries
+
+    def close(self):
+        self.pcm.kill()
+
+
+def run_shard(inbox, outbox, settings):
+    """
+    Body of a shard process: apply recording updates from `inbox`, pump every
+    recording it holds, and put {recordingId, examId, username, windows, done}
+    results on `outbox`. A None message stops it.
+    """
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # per-hop progress of hundreds of recordings would drown everything else
+    logging.getLogger("audio_analysis.diarization_core").setLevel(logging.WARNING)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the monitor stops its shards itself
+
+    from audio_analysis.diarization import ExamAudioDiarizer
+    from audio_analysis.diarization_core.audio_decoder import AudioDecodeError
+    from upload.recordings import AudioRecordings
+
+    diarizer = ExamAudioDiarizer(sample_rate=settings["sample_rate"], max_speakers=settings["max_speakers"])
+    reader = AudioRecordings(settings["root"], None)
+    recordings = {}
+    stopping = False
+
+    while not stopping:
+        updates = []
+        try:
+            updates.append(inbox.get(timeout=settings["tick"]))
+            while True:
+                updates.append(inbox.get_nowait())
+        except queue.Empty:
+            pass
+
+        for update in updates:
+            if update is None:
+                stopping = True
+                break
+            recording = recordings.get(update["recordingId"])
+            if recording is None:
+                try:
+                    recording = MonitoredRecording(update, diarizer, reader, settings)
+                except AudioDecodeError as e:
+                    logger.error(f"Cannot monitor recording {update['recordingId']}: {e}")
+                    continue
+                recordings[recording.recording_id] = recording
+            recording.update(update)
+
+        for recording_id, recording in list(recordings.items()):
+            result = {"recordingId": recording_id, "examId": recording.exam_id,
+                      "username": recording.username, "windows": [], "done": False}
+            try:
+                result["windows"] = recording.pump()
+            except (AudioDecodeError, OSError) as e:
+                logger.error(f"Stopped monitoring recording {recording_id}: {e}")
+                result["error"] = str(e)
+                recording.done = True
+            result["done"] = recording.done
+
+            if result["windows"] or result["done"]:
+                outbox.put(result)
+            if recording.done:
+                recording.close()
+                del recordings[recording_id]
+            elif not recording.complete and time.monotonic() - recording.last_growth > settings["idle_seconds"]:
+                # the candidate went quiet; if the recording grows again it resumes from its last window
+                logger.info(f"Recording {recording_id} idle; releasing it")
+                recording.close()
+                del recordings[recording_id]
+
+    for recording in recordings.values():
+        recording.close()
+
+
+class LiveAudioMonitor:
+    """
+    Polls audio_recordings for recordings that grew, routes them to shard
+    processes and records the window summaries the shards return.
+
+    A recording always goes to the same shard, which holds its decoder and
+    windows. How far each recording has been summarized is kept on its
+    document (`monitor.seconds`), so after a restart, or once a stalled
+    recording grows again, it is decoded from the start but only windows
+    after that point are summarized again. A window already on the attempt
+    (same recording, same end) is never pushed twice.
+    """
+    def __init__(self, recordings_collection, attempts_collection, root, shards=None, poll_interval=1.0,
+                 idle_seconds=120.0, window_seconds=30.0, hop_seconds=15.0, sample_rate=16000, max_speakers=4):
+        """
+        Args:
+            recordings_collection: `audio_recordings`, as maintained by AudioRecordings
+            attempts_collection: `attempted_exams`, where summaries are appended to `audioWindows`
+            root (str): Directory holding the recording files
+            shards (int): Shard processes; defaults to the number of cores
+            poll_interval (float): Seconds between polls of audio_recordings
+            idle_seconds (float): A recording that stops growing for this long is released
+        """
+        self.recordings = recordings_collection
+        self.attempts = attempts_collection
+        self.shards = shards or os.cpu_count() or 1
+        self.poll_interval = poll_interval
+        self.idle_seconds = idle_seconds
+        self.settings = {
+            "root": root,
+            "window_seconds": window_seconds,
+            "hop_seconds": hop_seconds,
+            "idle_seconds": idle_seconds,
+            "sample_rate": sample_rate,
+            "max_speakers": max_speakers,
+            "tick": min(poll_interval, 0.5),
+        }
+        self._context = multiprocessing.get_context("spawn")
+        self._outbox = None
+        self._inboxes = []
+        self._processes = []
+        self._routed = {}
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _start_shard(self, index):
+        inbox = self._context.Queue()
+        process = self._context.Process(target=run_shard, args=(inbox, self._outbox, self.settings),
+                                        name=f"audio-monitor-{index}", daemon=True)
+        process.start()
+        return inbox, process
+
+    def _shard_of(self, recording_id):
+        return zlib.crc32(recording_id.encode()) % self.shards
+
+    def _poll(self, since):
+        """Route every recording updated since `since` to its shard, unless the shard already has that update."""
+        cursor = self.recordings.find(
+            {"updatedAt": {"$gte": since}, "monitor.done": {"$ne": True}},
+            {"examId": 1, "username": 1, "file": 1, "size": 1, "status": 1, "monitor.seconds": 1},
+        )
+        routed = {}
+        for recording in cursor:
+            update = (recording.get("size", 0), recording["status"])
+            routed[recording["_id"]] = update
+            # polls overlap, so most recordings were already routed by the previous one
+            if not update[0] or self._routed.get(recording["_id"]) == update:
+                continue
+            self._inboxes[self._shard_of(recording["_id"])].put({
+                "recordingId": recording["_id"],
+                "examId": recording["examId"],
+                "username": recording["username"],
+                "file": recording["file"],
+                "size": recording["size"],
+                "complete": recording["status"] == "complete",
+                "resumeSeconds": recording.get("monitor", {}).get("seconds", 0.0),
+            })
+        self._routed = routed
+
+    def _record(self):
+        """Write the results the shards have sent since the last call."""
+        attempt_ops, recording_ops = [], []
+        now = _now()
+        while True:
+            try:
+                result = self._outbox.get_nowait()
+            except queue.Empty:
+                break
+            progress = {"monitor.done": result["done"], "monitor.updatedAt": now}
+            if result.get("error"):
+                progress["monitor.error"] = result["error"]
+            windows = result["windows"]
+            if windows:
+                progress["monitor.seconds"] = windows[-1]["end"]
+            for window in windows:
+                # a window is pushed only if the attempt lacks it: after a failed progress write or
+                # a restart, the recording resumes from an older monitor.seconds and repeats windows
+                attempt_ops.append(UpdateOne(
+                    {"examId": result["examId"], "username": result["username"],
+                     "audioWindows": {"$not": {"$elemMatch": {"recordingId": result["recordingId"],
+                                                              "end": window["end"]}}}},
+                    {
+                        "$push": {"audioWindows": {"recordingId": result["recordingId"], **window}},
+                        "$max": {"audioMaxSpeakers": window["speakers"]},
+                        "$set": {"audioMonitoredAt": now},
+                    },
+                ))
+            recording_ops.append(UpdateOne({"_id": result["recordingId"]}, {"$set": progress}))
+
+        try:
+            if attempt_ops:
+                self.attempts.bulk_write(attempt_ops, ordered=False)
+            if recording_ops:
+                self.recordings.bulk_write(recording_ops, ordered=False)
+        except PyMongoError as e:
+            logger.error(f"Could not store audio window summaries: {e}")
+        return len(attempt_ops)
+
+    def _check_shards(self):
+        for index, process in enumerate(self._processes):
+            if not process.is_alive():
+                logger.error(f"Audio monitor shard {index} exited with {process.exitcode}; restarting it")
+                self._inboxes[index], self._processes[index] = self._start_shard(index)
+
+    def run(self):
+        self._outbox = self._context.Queue()
+        for index in range(self.shards):
+            inbox, process = self._start_shard(index)
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+        logger.info(f"Audio monitor started with {self.shards} shards")
+
+        # recordings that were growing just before a restart are picked up again
+        since = _now() - datetime.timedelta(seconds=self.idle_seconds)
+        try:
+            while not self._stop.is_set():
+                # updatedAt comes from the web servers' clocks; overlapping polls tolerate some skew
+                polled_at = _now()
+                try:
+                    self._poll(since)
+                    since = polled_at - datetime.timedelta(seconds=5)
+                except PyMongoError as e:
+                    logger.error(f"Could not poll audio recordings: {e}")
+                self._record()
+                self._check_shards()
+                self._stop.wait(self.poll_interval)
+        finally:
+            for inbox in self._inboxes:
+                inbox.put(None)
+            # keep draining results: a shard cannot exit while its last puts are unread
+            deadline = time.monotonic() + 10
+            for process in self._processes:
+                while process.is_alive() and time.monotonic() < deadline:
+                    self._record()
+                    process.join(timeout=0.2)
+            self._record()
+            logger.info("Audio monitor stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=Config.AUDIO_MONITOR_SHARDS or None,
+                        help="shard processes (default: AUDIO_MONITOR_SHARDS, else one per core)")
+    parser.add_argument("--poll-interval", type=float, default=Config.AUDIO_MONITOR_POLL_SECONDS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from database import init_db
+    db = init_db()["db"]
+    monitor = LiveAudioMonitor(db["audio_recordings"], db["attempted_exams"], Config.AUDIO_UPLOAD_FOLDER,
+                               shards=args.shards, poll_interval=args.poll_interval,
+                               idle_seconds=Config.AUDIO_MONITOR_IDLE_SECONDS,
+                               window_seconds=Config.AUDIO_MONITOR_WINDOW_SECONDS,
+                               hop_seconds=Config.AUDIO_MONITOR_HOP_SECONDS)
+    signal.signal(signal.SIGTERM, lambda *_: monitor.stop())
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        monitor.stop()
@@ -0,0 +1,166 @@
+"""
+Re-diarize every recording of an exam, e.g. after a tuning change.
+
+Run from the backend directory:
+    python -m audio_analysis.reanalyze --exam EXAM_ID [--workers N] [--windows]
+
+Finished recordings of the exam's attempts (in AUDIO_UPLOAD_FOLDER) are
+diarized in a pool with one process per core, and the results are written
+back to the attempts in bulk: `recordings.$.diarization` always, and with
+--windows also the rolling-window summaries (`recordings.$.analysis`,
+`recordings.$.maxSpeakers`) the speaker_analysis job stores. Features come
+from the feature cache when the recording was analyzed before (see
+audio_analysis/cache.py), so re-clustering skips decoding, VAD and MFCCs.
+Prints the time of every file and the throughput in audio hours per wall
+hour.
+"""
+import os
+import time
+import logging
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from config import Config
+from audio_analysis.cache import exam_recordings
+
+logger = logging.getLogger(__name__)
+
+# one process per core already keeps every core busy; BLAS threads on top would only contend
+SINGLE_THREADED = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def reanalyze_recording(path, windows=False):
+    """
+    Body of a pool process: diarize one recording.
+
+    Returns:
+        dict: The fields to store on the recording's entry, with the audio duration and timings
+    """
+    from jobs.tasks import get_diarizer
+    diarizer = get_diarizer()
+    cache = diarizer.feature_cache
+    hits = cache.hits if cache is not None else 0
+    started = time.perf_counter()
+
+    results = diarizer.process_exam_audio(path)
+    if not results.get("success"):
+        raise RuntimeError(results.get("error", "diarization failed"))
+    fields = {
+        "diarization": {
+            "numSpeakers": results["num_speakers"],
+            "speakerCountScores": results["speaker_count_scores"],
+            "segments": [{"speaker": segment["speaker"], "start": segment["start"], "end": segment["end"]}
+                         for segment in results["segments"]],
+            "analyzedAt": datetime.datetime.now(datetime.timezone.utc),
+        },
+    }
+    if windows:
+        from audio_analysis.speaker_diarization import analyze_speakers_in_windows
+        fields["analysis"] = analyze_speakers_in_windows(path, diarizer)
+        fields["maxSpeakers"] = max((window["speakers"] for window in fields["analysis"]), default=0)
+
+    return {
+        "fields": fields,
+        "duration": results["audio_duration"] or 0.0,
+        "seconds": time.perf_counter() - started,
+        "cached": cache is not None and cache.hits > hits,
+    }
+
+
+class ExamReanalysis:
+    """Fans the recordings of an exam out over a process pool and writes the results back in bulk."""
+    def __init__(self, attempts_collection, root, workers=None, windows=False, batch_size=50):
+        """
+        Args:
+            attempts_collection: `attempted_exams`
+            root (str): Directory holding the recording files
+            workers (int): Pool processes; defaults to the number of cores
+            windows (bool): Also recompute the rolling-window summaries
+            batch_size (int): Results per bulk write
+        """
+        self.attempts = attempts_collection
+        self.root = root
+        self.workers = workers or os.cpu_count() or 1
+        self.windows = windows
+        self.batch_size = batch_size
+        self._pending = []
+
+    def _store(self, exam_id, recording, fields):
+        self._pending.append(UpdateOne(
+            {"examId": exam_id, "username": recording["username"], "recordings.file": recording["file"]},
+            {"$set": {f"recordings.$.{name}": value for name, value in fields.items()}},
+        ))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        try:
+            self.attempts.bulk_write(self._pending, ordered=False)
+        except PyMongoError as e:
+            logger.error(f"Could not store {len(self._pending)} re-analyzed recordings: {e}")
+        self._pending = []
+
+    def run(self, exam_id):
+        """
+        Returns:
+            dict: Files analyzed and failed, audio and wall seconds
+        """
+        recordings = exam_recordings(self.attempts, exam_id, self.root)
+        summary = {"files": 0, "failed": 0, "cached": 0, "audio_seconds": 0.0, "wall_seconds": 0.0}
+        if not recordings:
+            print(f"No finished recordings for exam {exam_id}")
+            return summary
+        workers = min(self.workers, len(recordings))
+        print(f"Re-analyzing {len(recordings)} recordings of exam {exam_id} with {workers} processes")
+
+        for name in SINGLE_THREADED:
+            os.environ.setdefault(name, "1")  # inherited by the spawned workers
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(reanalyze_recording, recording["path"], self.windows): recording
+                       for recording in recordings}
+            for future in as_completed(futures):
+                recording = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    print(f"  {recording['file']}: failed ({type(e).__name__}: {e})")
+                    continue
+                self._store(exam_id, recording, result["fields"])
+                summary["files"] += 1
+                summary["cached"] += result["cached"]
+                summary["audio_seconds"] += result["duration"]
+                print(f"  {recording['file']}: {result['duration'] / 60:.1f} min of audio in "
+                      f"{result['seconds']:.2f} s ({'cached features' if result['cached'] else 'decoded'}), "
+                      f"{result['fields']['diarization']['numSpeakers']} speakers")
+        self._flush()
+        summary["wall_seconds"] = time.perf_counter() - started
+
+        audio_hours = summary["audio_seconds"] / 3600
+        wall_hours = summary["wall_seconds"] / 3600
+        print(f"{summary['files']} recordings ({summary['cached']} from cached features, {summary['failed']} failed), "
+              f"{audio_hours:.2f} h of audio in {summary['wall_seconds']:.1f} s: "
+              f"{audio_hours / wall_hours if wall_hours else 0:.0f} audio hours per wall hour")
+        return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exam", required=True, help="exam id")
+    parser.add_argument("--workers", type=int, help="pool processes (default: one per core)")
+    parser.add_argument("--windows", action="store_true", help="also recompute the rolling-window summaries")
+    parser.add_argument("--batch-size", type=int, default=50, help="results per bulk write")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from database import init_db
+    ExamReanalysis(init_db()["db_collection"], Config.AUDIO_UPLOAD_FOLDER, workers=args.workers,
+                   windows=args.windows, batch_size=args.batch_size).run(args.exam)
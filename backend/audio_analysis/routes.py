@@ -1,18 +1,22 @@
 from flask import Blueprint, request, jsonify
-from .diarization import ExamAudioDiarizer
+from werkzeug.utils import secure_filename
+from jobs.store import job_store
+from config import Config
 import os
+import uuid
 import logging
-from pydub import AudioSegment
 
 logger = logging.getLogger(__name__)
 
 audio_analysis = Blueprint('audio_analysis', __name__)
-diarizer = ExamAudioDiarizer()
 
 @audio_analysis.route('/analyze-exam-audio', methods=['POST'])
 def analyze_exam_audio():
     """
-    Analyze exam audio file for speaker diarization
+    Queue an exam audio file for speaker diarization.
+    
+    Diarization runs in the job worker; the response carries the job id, and
+    GET /jobs/<jobId> returns the diarization results once the job is done.
     """
     try:
         if 'audio_file' not in request.files:
@@ -28,31 +32,22 @@ def analyze_exam_audio():
                 'error': 'No selected file'
             }), 400
             
-        # Save the uploaded file temporarily
-        temp_dir = 'temp'
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_path = os.path.join(temp_dir, audio_file.filename)
-        audio_file.save(temp_path)
+        # Save the upload under a unique name until the job has analyzed it
+        filename = f"{uuid.uuid4().hex}_{secure_filename(audio_file.filename)}"
+        audio_path = os.path.join(Config.AUDIO_SCRATCH_FOLDER, filename)
+        audio_file.save(audio_path)
         
-        # If the file is .webm, convert to .wav for processing
-        if temp_path.endswith('.webm'):
-            wav_path = temp_path.rsplit('.', 1)[0] + '.wav'
-            audio = AudioSegment.from_file(temp_path, format='webm')
-            audio.export(wav_path, format='wav')
-            os.remove(temp_path)  # Remove the .webm temp file
-            temp_path = wav_path
+        job_id = job_store.enqueue("diarize_audio", {"audio_path": audio_path})
         
-        # Process the audio file (now always .wav)
-        results = diarizer.process_exam_audio(temp_path)
-        
-        # Clean up temporary file
-        os.remove(temp_path)
-        
-        return jsonify(results)
+        return jsonify({
+            'success': True,
+            'jobId': job_id,
+            'statusUrl': f"/jobs/{job_id}"
+        }), 202
         
     except Exception as e:
-        logger.error(f"Error processing exam audio: {str(e)}")
+        logger.error(f"Error queueing exam audio: {str(e)}")
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500 
\ No newline at end of file
+        }), 500
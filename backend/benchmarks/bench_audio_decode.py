@@ -0,0 +1,123 @@
+"""
+Decoding for audio analysis: pydub -> wav on disk -> librosa.load vs ffmpeg piped to PCM.
+
+Synthesizes a conversation, encodes it to webm/opus as MediaRecorder would
+upload it, then runs decode + voice activity detection + feature extraction
+both ways, each in a fresh interpreter (so neither inherits the other's
+memory), and reports wall time and the analysis process's peak RSS. Needs
+ffmpeg on the PATH.
+Run from the backend directory:
+    python -m benchmarks.bench_audio_decode --minutes 30
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+
+def old_path(webm_path, scratch_dir):
+    """What analyze_exam_audio used to do: convert to a wav file, reload it, then analyze."""
+    import librosa
+    from pydub import AudioSegment
+    from audio_analysis.diarization import ExamAudioDiarizer
+
+    diarizer = ExamAudioDiarizer()
+    wav_path = os.path.join(scratch_dir, "converted.wav")
+    AudioSegment.from_file(webm_path, format="webm").export(wav_path, format="wav")
+    audio_data, _ = librosa.load(wav_path, sr=diarizer.sample_rate)
+    os.remove(wav_path)
+    segments = diarizer.voice_detector.detect_voice_segments(audio_data)
+    return diarizer.feature_extractor.extract_features_from_segments(audio_data, segments)
+
+
+def new_path(webm_path, scratch_dir):
+    """ffmpeg decodes to int16 PCM on a pipe while the VAD streams over it."""
+    from audio_analysis.diarization import ExamAudioDiarizer
+
+    diarizer = ExamAudioDiarizer(scratch_dir=scratch_dir)
+    decoded, segments = diarizer.load_audio(webm_path)
+    with decoded:
+        return diarizer.feature_extractor.extract_features_from_segments(decoded.samples, segments)
+
+
+PATHS = {"pydub + wav + librosa.load": old_path, "ffmpeg pipe to PCM": new_path}
+
+
+def run_one(name, webm_path):
+    """Run one path in this process and print its measurements as JSON."""
+    scratch_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        features = PATHS[name](webm_path, scratch_dir)
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    print(json.dumps({
+        "seconds": seconds,
+        "rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "segments": len(features),
+        "frames": int(sum(f["features"].shape[1] for f in features)),
+    }))
+
+
+def encode_webm(minutes, sample_rate, seed, directory):
+    import soundfile
+    from benchmarks.bench_diarization import synthetic_conversation
+
+    audio, _ = synthetic_conversation(minutes, sample_rate, 2, np.random.default_rng(seed))
+    wav_path, webm_path = os.path.join(directory, "source.wav"), os.path.join(directory, "recording.webm")
+    soundfile.write(wav_path, audio, sample_rate)
+    # 48 kHz opus, as browsers record it
+    subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", wav_path,
+                    "-ar", "48000", "-c:a", "libopus", "-b:a", "32k", webm_path], check=True)
+    os.remove(wav_path)
+    return webm_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--run", choices=list(PATHS), help=argparse.SUPPRESS)
+    parser.add_argument("--encode-to", help=argparse.SUPPRESS)
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(args.run, args.file)
+        return
+    if args.encode_to:
+        print(encode_webm(args.minutes, args.sample_rate, args.seed, args.encode_to))
+        return
+    if shutil.which("ffmpeg") is None:
+        sys.exit("ffmpeg not found on the PATH")
+
+    def child(*extra):
+        # this process stays small: a forked child's peak RSS starts from its parent's
+        out = subprocess.run([sys.executable, "-m", "benchmarks.bench_audio_decode", "--minutes", str(args.minutes),
+                              "--sample-rate", str(args.sample_rate), "--seed", str(args.seed), *extra],
+                             check=True, capture_output=True, text=True).stdout
+        return out.strip().splitlines()[-1]
+
+    directory = tempfile.mkdtemp()
+    try:
+        webm_path = child("--encode-to", directory)
+        print(f"{args.minutes:g} min webm/opus, {os.path.getsize(webm_path) / 2 ** 20:.1f} MiB")
+        print(f"{'decoder':<28}  {'seconds':>8}  {'peak RSS MiB':>12}  {'segments':>8}  {'frames':>8}")
+        for name in PATHS:
+            r = json.loads(child("--run", name, "--file", webm_path))
+            print(f"{name:<28}  {r['seconds']:>8.2f}  {r['rss_mib']:>12.0f}  {r['segments']:>8}  {r['frames']:>8}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
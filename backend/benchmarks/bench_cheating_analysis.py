@@ -0,0 +1,144 @@
+"""
+Cheating analysis of a whole exam: the original per-attempt path vs one batch
+pass, and the same batch again once results are cached.
+
+The original get_cheating_analysis fetched an attempt with all its frames,
+mobile logs and audio logs, scored them in Python and wrote the result back,
+once per attempt. Its scoring raised before returning anything, so the
+"original per attempt" row does that same I/O but scores with today's
+CheatingAnalyzer; it is the baseline the batch pass replaced.
+Seeds a throwaway database on a local MongoDB with synthetic attempts, frames,
+mobile logs and audio logs, then scores every attempt both ways and checks
+that the results agree.
+Run from the backend directory:
+    python -m benchmarks.bench_cheating_analysis --attempts 500
+"""
+import argparse
+import datetime
+import random
+import statistics
+import time
+import uuid
+
+from pymongo import MongoClient
+
+from benchmarks.bench_exam_attempts import CommandCounter
+from exam.cheating_analysis import CheatingAnalyzer, analyze_exam_attempts
+
+
+def seed(db, exam_id, attempts, frames, mobile_logs, audio_logs, rng):
+    for name in ("attempted_exams", "frames", "mobile_activity_logs", "audio_logs"):
+        db[name].drop()
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    object_choices = [["person"], ["person", "person"], [], ["person", "cell phone"]]
+    docs, frame_docs, mobile_docs, audio_docs = [], [], [], []
+    for i in range(attempts):
+        username = f"student{i}"
+        tab_times = sorted(rng.uniform(0, 3600) for _ in range(rng.randint(0, 20)))
+        docs.append({
+            "examId": exam_id,
+            "username": username,
+            "suspiciousKeylogs": {"copy": {"ctrl+c": rng.randint(0, 5)}, "meta": {"meta": rng.randint(0, 5)}},
+            "tabEvents": [{"timestamp": (start + datetime.timedelta(seconds=t)).isoformat()} for t in tab_times],
+            "resizeEvents": [{"screenWidth": rng.choice([1280, 1920]), "screenHeight": 1080,
+                              "baselineWidth": 1920, "baselineHeight": 1080} for _ in range(rng.randint(0, 5))],
+        })
+        frame_docs += [{"exam_id": exam_id, "username": username, "objects": rng.choice(object_choices)}
+                       for _ in range(frames)]
+        mobile_docs += [{"examId": exam_id, "username": username,
+                         "event": rng.choice(["heartbeat", "blur", "focus", "visibilitychange", "resize"])}
+                        for _ in range(mobile_logs)]
+        audio_docs += [{"examId": exam_id, "username": username, "isAbnormal": rng.random() < 0.2}
+                       for _ in range(audio_logs)]
+    db.attempted_exams.insert_many(docs)
+    for name, batch in (("frames", frame_docs), ("mobile_activity_logs", mobile_docs), ("audio_logs", audio_docs)):
+        if batch:
+            db[name].insert_many(batch)
+    db.attempted_exams.create_index([("examId", 1), ("username", 1)], unique=True)
+    db.frames.create_index([("exam_id", 1), ("username", 1), ("timestamp", 1)])
+    db.mobile_activity_logs.create_index([("examId", 1), ("username", 1), ("timestamp", 1)])
+    db.audio_logs.create_index([("examId", 1), ("username", 1)])
+
+
+def original_per_attempt(db, exam_id, usernames):
+    """The reads and writes of get_cheating_analysis before the batch pass, for every attempt."""
+    analyses = {}
+    for username in usernames:
+        attempt = db.attempted_exams.find_one({"examId": exam_id, "username": username})
+        exam_data = {
+            "suspiciousKeylogs": attempt.get("suspiciousKeylogs", {}),
+            "tabEvents": attempt.get("tabEvents", []),
+            "resizeEvents": attempt.get("resizeEvents", []),
+            "frames": list(db.frames.find({"exam_id": exam_id, "username": username})),
+            "mobileEvents": list(db.mobile_activity_logs.find({"examId": exam_id, "username": username})),
+            "audioEvents": list(db.audio_logs.find({"examId": exam_id, "username": username})),
+        }
+        analyses[username] = CheatingAnalyzer().calculate_cheating_probability(exam_data)
+        db.attempted_exams.update_one({"_id": attempt["_id"]}, {"$set": {"cheating_analysis": analyses[username]}})
+    return analyses
+
+
+def batch(db, exam_id):
+    return analyze_exam_attempts(exam_id, db)["analyses"]
+
+
+def drop_cached(db, exam_id):
+    db.attempted_exams.update_many({"examId": exam_id}, {"$unset": {"cheating_analysis_version": ""}})
+
+
+def measure(fn, counter, repeats, reset=None):
+    timings, trips = [], []
+    result = None
+    for _ in range(repeats):
+        if reset:
+            reset()
+        before = counter.count
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+        trips.append(counter.count - before)
+    return result, statistics.median(timings), statistics.median(trips)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--attempts", type=int, default=500)
+    parser.add_argument("--frames", type=int, default=30, help="frames per attempt")
+    parser.add_argument("--mobile-logs", type=int, default=100, help="mobile logs per attempt")
+    parser.add_argument("--audio-logs", type=int, default=10, help="audio logs per attempt")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = MongoClient(args.uri, event_listeners=[counter])
+    db = client["beproject_bench"]
+    exam_id = str(uuid.uuid4())
+    try:
+        seed(db, exam_id, args.attempts, args.frames, args.mobile_logs, args.audio_logs, random.Random(args.seed))
+        usernames = [f"student{i}" for i in range(args.attempts)]
+
+        print(f"{args.attempts} attempts x ({args.frames} frames, {args.mobile_logs} mobile logs, "
+              f"{args.audio_logs} audio logs)")
+        print(f"{'strategy':<26}  {'round trips':>11}  {'median ms':>10}")
+        results = {}
+        reset = lambda: drop_cached(db, exam_id)
+        for name, fn, reset_fn in (
+                ("original per attempt", lambda: original_per_attempt(db, exam_id, usernames), None),
+                ("analyze_exam_attempts", lambda: batch(db, exam_id), reset),
+                ("cached, no new evidence", lambda: batch(db, exam_id), None)):
+            results[name], latency, trips = measure(fn, counter, args.repeats, reset_fn)
+            print(f"{name:<26}  {trips:>11.0f}  {latency:>10.1f}")
+
+        looped, batched, _ = results.values()
+        mismatched = [u for u in usernames
+                      if looped[u]["detailed_scores"] != batched[u]["detailed_scores"]
+                      or looped[u]["total_score"] != batched[u]["total_score"]]
+        print(f"results agree for {len(usernames) - len(mismatched)}/{len(usernames)} attempts")
+    finally:
+        client.drop_database("beproject_bench")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Speaker clustering: frame-level KMeans vs pooled window embeddings.
+
+Synthesizes a conversation between speakers with distinct pitch and formants,
+runs VAD and feature extraction once, then clusters the segments both ways
+and reports time, peak memory allocated during clustering (tracemalloc) and
+the fraction of voiced time given the right speaker (best label mapping).
+Run from the backend directory:
+    python -m benchmarks.bench_diarization --minutes 60
+"""
+import argparse
+import itertools
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+from audio_analysis.diarization_core.voice_detector import VoiceDetector
+from audio_analysis.diarization_core.feature_extractor import FeatureExtractor
+from audio_analysis.diarization_core.speaker_diarization import SpeakerDiarization
+
+# (pitch Hz, first formant Hz, second formant Hz) per synthetic speaker
+VOICES = [(110, 500, 1500), (210, 850, 2300), (150, 350, 2900), (260, 650, 1100)]
+
+
+def synthetic_conversation(minutes, sample_rate, num_speakers, rng):
+    """
+    Turns of voiced speech from `num_speakers` synthetic talkers separated by
+    pauses. Each talker has a pitch range and a formant envelope of their own.
+
+    Returns:
+        tuple: (float32 signal in [-1, 1], list of (start, end, speaker) turns)
+    """
+    n = int(minutes * 60 * sample_rate)
+    signal = rng.normal(0, 0.003, n)
+    turns = []
+    position = rng.uniform(0.5, 2.0)
+    while num_speakers and position < n / sample_rate - 1:
+        speaker = int(rng.integers(num_speakers))
+        pitch0, f1, f2 = VOICES[speaker % len(VOICES)]
+        length = rng.uniform(0.8, 6.0)
+        start, end = int(position * sample_rate), min(int((position + length) * sample_rate), n)
+        t = np.arange(end - start) / sample_rate
+        pitch = pitch0 * rng.uniform(0.9, 1.1) * (1 + 0.08 * np.sin(2 * np.pi * 0.5 * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+        voiced = np.zeros(len(t))
+        for k in range(1, 30):
+            harmonic = k * pitch
+            envelope = np.exp(-((harmonic - f1) / 150) ** 2) + 0.6 * np.exp(-((harmonic - f2) / 250) ** 2) + 0.02
+            voiced += envelope * np.sin(k * phase)
+        syllables = 0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(3, 5) * t)
+        signal[start:end] += rng.uniform(0.05, 0.2) * voiced * syllables
+        turns.append((start / sample_rate, end / sample_rate, speaker))
+        position += length + rng.uniform(0.3, 2.0)
+    return np.clip(signal, -1, 1).astype(np.float32), turns
+
+
+def speaker_at(turns, times):
+    """True speaker at each time, or -1 in a pause."""
+    starts = np.array([start for start, _, _ in turns])
+    index = np.searchsorted(starts, times, side="right") - 1
+    speakers = np.full(len(times), -1)
+    for i, (turn, t) in enumerate(zip(index, times)):
+        if turn >= 0 and t < turns[turn][1]:
+            speakers[i] = turns[turn][2]
+    return speakers
+
+
+def accuracy(labeled, turns):
+    """Share of voiced segment time whose label maps to the true speaker, under the best mapping."""
+    midpoints = np.array([(s["start_time"] + s["end_time"]) / 2 for s in labeled])
+    durations = np.array([s["end_time"] - s["start_time"] for s in labeled])
+    truth = speaker_at(turns, midpoints)
+    predicted = np.array([s["speaker"] for s in labeled])
+    voiced = truth >= 0
+    true_ids, predicted_ids = sorted(set(truth[voiced])), sorted(set(predicted))
+    # surplus clusters map to no speaker
+    true_ids += [-1] * max(len(predicted_ids) - len(true_ids), 0)
+    best = 0.0
+    for mapping in itertools.permutations(true_ids, len(predicted_ids)):
+        lookup = dict(zip(predicted_ids, mapping))
+        hits = np.array([lookup.get(p, -2) for p in predicted]) == truth
+        best = max(best, durations[hits & voiced].sum())
+    return best / max(durations[voiced].sum(), 1e-9)
+
+
+def frame_kmeans(features_list, num_speakers):
+    """The previous diarize: every frame stacked into one matrix, full KMeans, Counter vote per segment."""
+    frames = np.vstack([f["features"].T for f in features_list])
+    segment_indices = np.concatenate([[i] * f["features"].shape[1] for i, f in enumerate(features_list)])
+    labels = KMeans(n_clusters=num_speakers, random_state=42).fit(frames).labels_
+    for i, f in enumerate(features_list):
+        f["speaker"] = Counter(labels[segment_indices == i]).most_common(1)[0][0]
+    return features_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=60)
+    parser.add_argument("--speakers", type=int, default=2)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-frame-kmeans", action="store_true", help="only run the window embeddings")
+    args = parser.parse_args()
+
+    audio, turns = synthetic_conversation(args.minutes, args.sample_rate, args.speakers,
+                                          np.random.default_rng(args.seed))
+    segments = VoiceDetector(sample_rate=args.sample_rate).detect_voice_segments(audio)
+    features_list = FeatureExtractor(sample_rate=args.sample_rate).extract_features_from_segments(audio, segments)
+    n_frames = sum(f["features"].shape[1] for f in features_list)
+    print(f"{args.minutes:g} min, {args.speakers} speakers, {len(features_list)} segments, {n_frames} frames")
+
+    runs = [("window embeddings", lambda fl: SpeakerDiarization(num_speakers=args.speakers).diarize(fl))]
+    if not args.skip_frame_kmeans:
+        runs.insert(0, ("frame-level KMeans", lambda fl: frame_kmeans(fl, args.speakers)))
+
+    print(f"{'clustering':<20}  {'seconds':>8}  {'peak MiB':>8}  {'accuracy':>8}")
+    for name, fn in runs:
+        fresh = [{**f} for f in features_list]
+        tracemalloc.start()
+        start = time.perf_counter()
+        labeled = fn(fresh)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        print(f"{name:<20}  {seconds:>8.2f}  {peak:>8.1f}  {accuracy(labeled, turns):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Round trips and latency of /exam/attempts: per-student queries vs one aggregation.
+
+Seeds a throwaway database on a local MongoDB, then runs both query strategies.
+Run from the backend directory:
+    python -m benchmarks.bench_exam_attempts --students 300 --frames 10
+"""
+import argparse
+import datetime
+import statistics
+import time
+import uuid
+
+from pymongo import MongoClient, monitoring
+
+from exam.queries import FRAME_LIST_PROJECTION, serialize_frame, fetch_exam_attempts
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts every command (find, getMore, aggregate...) the client sends."""
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def seed(db, exam_id, students, frames_per_student):
+    db.attempted_exams.drop()
+    db.frames.drop()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    db.attempted_exams.insert_many([{
+        "examId": exam_id,
+        "username": f"student{i}",
+        "startedAt": now,
+        "submittedAt": now,
+        "score": i % 10,
+        "maxScore": 10,
+        "answers": {str(q): "a) option" for q in range(20)},
+        "cheatingScore": i % 100,
+        "cheatingFactors": {"suspicious_frames": frames_per_student},
+        "suspiciousKeylogs": {"copy": {"ctrl+c": 2}},
+    } for i in range(students)])
+    frames = []
+    for i in range(students):
+        for j in range(frames_per_student):
+            key = uuid.uuid4().hex * 2
+            frames.append({
+                "timestamp": now + datetime.timedelta(seconds=2 * j),
+                "exam_id": exam_id,
+                "username": f"student{i}",
+                "objects": ["person", "person"],
+                "image_key": key,
+                "thumb_key": key[::-1],
+                "width": 640,
+                "height": 480,
+            })
+    if frames:
+        db.frames.insert_many(frames)
+    db.attempted_exams.create_index([("examId", 1), ("username", 1)])
+    db.frames.create_index([("exam_id", 1), ("username", 1), ("timestamp", 1)])
+
+
+def per_student_queries(db, exam_id, frames_limit):
+    """The previous /exam/attempts implementation: one find + count per attempt."""
+    attempts = []
+    for a in db.attempted_exams.find({"examId": exam_id}):
+        frames_filter = {"exam_id": exam_id, "username": a.get("username")}
+        cursor = db.frames.find(frames_filter, FRAME_LIST_PROJECTION).sort("timestamp", 1).limit(frames_limit)
+        a["cheatingFrames"] = [serialize_frame(f) for f in cursor]
+        a["cheatingFramesTotal"] = db.frames.count_documents(frames_filter)
+        attempts.append(a)
+    return attempts
+
+
+def measure(fn, counter, repeats):
+    timings, trips = [], []
+    for _ in range(repeats):
+        before = counter.count
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+        trips.append(counter.count - before)
+    return statistics.median(timings), statistics.median(trips)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--frames", type=int, default=10, help="flagged frames per student")
+    parser.add_argument("--frames-limit", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = MongoClient(args.uri, event_listeners=[counter])
+    db = client["beproject_bench"]
+    exam_id = str(uuid.uuid4())
+    try:
+        seed(db, exam_id, args.students, args.frames)
+        runs = {
+            "per-student queries": lambda: per_student_queries(db, exam_id, args.frames_limit),
+            "single aggregation": lambda: fetch_exam_attempts(db.attempted_exams, exam_id, args.frames_limit),
+        }
+        print(f"{args.students} students x {args.frames} frames, {args.frames_limit} frames inlined per attempt")
+        print(f"{'strategy':<22}  {'round trips':>11}  {'median ms':>10}")
+        for name, fn in runs.items():
+            fn()  # warm up
+            latency, trips = measure(fn, counter, args.repeats)
+            print(f"{name:<22}  {trips:>11.0f}  {latency:>10.1f}")
+    finally:
+        client.drop_database("beproject_bench")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Feature cache: analyzing a recording again once its features are cached.
+
+Encodes a synthetic conversation as webm/opus, then runs process_exam_audio
+three times with one cache directory: cold (decode, VAD, MFCCs, clustering),
+again with the same settings, and with other clustering settings (at most
+two speakers), as a re-scoring after a tuning change would. Reports the time
+of each run, the size of the cache entry and whether the cached run found the
+same speakers. Needs ffmpeg on the PATH.
+Run from the backend directory:
+    python -m benchmarks.bench_feature_cache --minutes 30
+"""
+import os
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+from audio_analysis.diarization import ExamAudioDiarizer
+from audio_analysis.diarization_core.feature_cache import FeatureCache
+from benchmarks.bench_audio_decode import encode_webm
+
+
+def timed(diarizer, path):
+    start = time.perf_counter()
+    results = diarizer.process_exam_audio(path)
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    args = parser.parse_args()
+    logging.getLogger("audio_analysis").setLevel(logging.ERROR)
+
+    directory = tempfile.mkdtemp()
+    try:
+        webm_path = encode_webm(args.minutes, args.sample_rate, 0, directory)
+        cache = FeatureCache(os.path.join(directory, "cache"))
+
+        diarizer = ExamAudioDiarizer(sample_rate=args.sample_rate, feature_cache=cache)
+        cold, cold_results = timed(diarizer, webm_path)
+        warm, warm_results = timed(diarizer, webm_path)
+        retuned, retuned_results = timed(
+            ExamAudioDiarizer(sample_rate=args.sample_rate, max_speakers=2, feature_cache=cache), webm_path)
+
+        same = [s["speaker"] for s in cold_results["segments"]] == [s["speaker"] for s in warm_results["segments"]]
+        stats = cache.stats()
+        print(f"{args.minutes:g} min recording, {os.path.getsize(webm_path) / 2 ** 20:.1f} MiB webm; "
+              f"cache entry {stats['bytes'] / 2 ** 20:.1f} MiB")
+        print(f"  cold:                  {cold:6.2f} s  ({cold_results['num_speakers']} speakers)")
+        print(f"  cached:                {warm:6.2f} s  ({warm_results['num_speakers']} speakers, "
+              f"{'same' if same else 'DIFFERENT'} segments)")
+        print(f"  cached, max 2 speakers: {retuned:5.2f} s  ({retuned_results['num_speakers']} speakers)")
+        print(f"  hits {cache.hits}, misses {cache.misses}; re-analysis {cold / warm:.1f}x faster")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Frames/second of the webcam YOLO path at different micro-batch sizes.
+
+Run from the backend directory:
+    python -m benchmarks.bench_inference_batching --frames 256 --batch-sizes 1 8 32
+"""
+import argparse
+import time
+from concurrent.futures import wait
+
+import numpy as np
+
+from upload.inference import BatchInferenceWorker
+from upload.utils import detect_objects_batch
+
+
+def make_frames(count, size=416, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def run(frames, batch_size, max_wait_ms):
+    worker = BatchInferenceWorker(
+        detect_objects_batch,
+        max_batch_size=batch_size,
+        max_wait_ms=max_wait_ms,
+        max_queue_size=len(frames) + 1,
+    )
+    # warm up the dispatcher thread and the model at this batch size
+    wait([worker.submit(f) for f in frames[:batch_size]])
+
+    start = time.perf_counter()
+    futures = [worker.submit(f) for f in frames]
+    wait(futures)
+    elapsed = time.perf_counter() - start
+    return len(frames) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=256)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--frame-size", type=int, default=416)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.frame_size)
+    print(f"{args.frames} frames of {args.frame_size}x{args.frame_size}, max wait {args.max_wait_ms}ms")
+    print(f"{'batch size':>10}  {'frames/s':>10}")
+    for batch_size in args.batch_sizes:
+        fps = run(frames, batch_size, args.max_wait_ms)
+        print(f"{batch_size:>10}  {fps:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
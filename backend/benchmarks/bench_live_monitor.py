@@ -0,0 +1,147 @@
+"""
+Live audio monitoring: window accuracy, cost per hop, and streams per core.
+
+1. Accuracy: synthetic conversations with 0 to 3 talkers go through
+   RollingSpeakerWindows in 5 s fragments; each window's speaker count is
+   compared with the talkers who spoke more than a second in it.
+2. Bounded cost: analysis time of the hops at the start and at the end of a
+   long recording.
+3. Throughput: --streams recordings encoded as webm/opus are fed in 5 s
+   fragments, round robin, through one ffmpeg PCMStream each, as a monitor
+   shard does. Reports the CPU spent in this process (VAD, MFCC, clustering)
+   and in ffmpeg per hour of audio, and the real-time streams one core keeps
+   up with. Needs ffmpeg on the PATH.
+Run from the backend directory:
+    python -m benchmarks.bench_live_monitor --streams 50 --minutes 10
+"""
+import time
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+
+import numpy as np
+
+from audio_analysis.diarization import ExamAudioDiarizer
+from benchmarks.bench_diarization import synthetic_conversation
+from benchmarks.bench_audio_decode import encode_webm
+
+FRAGMENT_SECONDS = 5
+
+
+def to_pcm(audio):
+    return (audio * 32767).astype(np.int16)
+
+
+def fragments(pcm, sample_rate):
+    step = FRAGMENT_SECONDS * sample_rate
+    return [pcm[i:i + step] for i in range(0, len(pcm), step)]
+
+
+def window_accuracy(diarizer, minutes, seeds, sample_rate):
+    print(f"{'talkers':>7}  {'windows':>7}  {'correct':>7}  counts (heard -> reported: windows)")
+    for num_speakers in range(4):
+        confusion = {}
+        for seed in range(seeds):
+            audio, turns = synthetic_conversation(minutes, sample_rate, num_speakers, np.random.default_rng(seed))
+            windows = diarizer.rolling_windows()
+            summaries = []
+            for fragment in fragments(to_pcm(audio), sample_rate):
+                summaries.extend(windows.feed(fragment))
+            summaries.extend(windows.close())
+            for summary in summaries:
+                heard = len({speaker for start, end, speaker in turns
+                             if min(end, summary["end"]) - max(start, summary["start"]) > 1.0})
+                key = (heard, summary["speakers"])
+                confusion[key] = confusion.get(key, 0) + 1
+        total = sum(confusion.values())
+        correct = sum(count for (heard, reported), count in confusion.items() if heard == reported)
+        detail = ", ".join(f"{h}->{r}: {c}" for (h, r), c in sorted(confusion.items()))
+        print(f"{num_speakers:>7}  {total:>7}  {correct / total:>7.1%}  {detail}")
+
+
+def hop_cost(diarizer, minutes, sample_rate):
+    audio, _ = synthetic_conversation(minutes, sample_rate, 2, np.random.default_rng(0))
+    windows = diarizer.rolling_windows()
+    timings = []
+    for fragment in fragments(to_pcm(audio), sample_rate):
+        start = time.perf_counter()
+        if windows.feed(fragment):
+            timings.append(time.perf_counter() - start)
+    first, last = timings[:10], timings[-10:]
+    print(f"{minutes:g} min recording, {len(timings)} hops: first 10 hops {1000 * np.mean(first):.1f} ms, "
+          f"last 10 hops {1000 * np.mean(last):.1f} ms (max {1000 * max(timings):.1f} ms)")
+
+
+def throughput(diarizer, streams, minutes, sample_rate, directory):
+    webm = open(encode_webm(minutes, sample_rate, 0, directory), "rb").read()
+    rounds = int(np.ceil(minutes * 60 / FRAGMENT_SECONDS))
+    step = int(np.ceil(len(webm) / rounds))
+
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+
+    live = [(diarizer.decoder.open_stream(), diarizer.rolling_windows()) for _ in range(streams)]
+    summaries = 0
+    for i in range(rounds + 1):
+        for pcm, windows in live:
+            if i < rounds:
+                pcm.write(webm[i * step:(i + 1) * step])
+            else:
+                pcm.close_input()
+            summaries += len(windows.feed(pcm.read()))
+        time.sleep(0.05)  # let ffmpeg decode the fragment, as the shard's poll tick would
+    while live:
+        for pcm, windows in list(live):
+            summaries += len(windows.feed(pcm.read()))
+            if pcm.finished:
+                summaries += len(windows.close())
+                live.remove((pcm, windows))
+        time.sleep(0.01)
+
+    wall = time.perf_counter() - started
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    analysis = (self_after.ru_utime + self_after.ru_stime) - (self_before.ru_utime + self_before.ru_stime)
+    decoding = (children_after.ru_utime + children_after.ru_stime) - \
+        (children_before.ru_utime + children_before.ru_stime)
+    audio_hours = streams * minutes / 60
+
+    print(f"{streams} streams x {minutes:g} min ({audio_hours:.1f} h of audio) in {wall:.1f} s, "
+          f"{summaries} window summaries")
+    print(f"  CPU per hour of audio: analysis {analysis / audio_hours:.1f} s, "
+          f"ffmpeg {decoding / audio_hours:.1f} s")
+    print(f"  real-time streams per core: {3600 / ((analysis + decoding) / audio_hours):.0f} "
+          f"(analysis alone {3600 / (analysis / audio_hours):.0f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--seeds", type=int, default=4, help="recordings per talker count for the accuracy table")
+    parser.add_argument("--accuracy-minutes", type=float, default=4)
+    parser.add_argument("--long-minutes", type=float, default=60)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    args = parser.parse_args()
+    logging.getLogger("audio_analysis").setLevel(logging.ERROR)
+
+    diarizer = ExamAudioDiarizer(sample_rate=args.sample_rate)
+    window_accuracy(diarizer, args.accuracy_minutes, args.seeds, args.sample_rate)
+    print()
+    hop_cost(diarizer, args.long_minutes, args.sample_rate)
+    print()
+    if shutil.which(diarizer.decoder.ffmpeg) is None:
+        print("ffmpeg not found on the PATH; skipping the throughput run")
+        return
+    directory = tempfile.mkdtemp()
+    try:
+        throughput(diarizer, args.streams, args.minutes, args.sample_rate, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
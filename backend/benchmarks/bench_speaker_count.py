@@ -0,0 +1,70 @@
+"""
+Speaker-count estimation: accuracy and cost of the silhouette sweep.
+
+Synthesizes conversations with 0 to --max-speakers talkers, runs VAD and
+feature extraction, and compares SpeakerDiarization.estimate_num_speakers
+with the number of talkers heard (a short recording may not include all). Then times the sweep alone on recordings of growing
+length, where the window sample cap keeps its cost flat.
+Run from the backend directory:
+    python -m benchmarks.bench_speaker_count --minutes 5 --seeds 3
+"""
+import argparse
+import time
+
+import numpy as np
+
+from audio_analysis.diarization_core.voice_detector import VoiceDetector
+from audio_analysis.diarization_core.feature_extractor import FeatureExtractor
+from audio_analysis.diarization_core.speaker_diarization import SpeakerDiarization
+from benchmarks.bench_diarization import synthetic_conversation, VOICES
+
+
+def window_embeddings(minutes, sample_rate, num_speakers, seed, diarizer):
+    """Window embeddings of a synthetic conversation, and how many of its talkers actually spoke."""
+    audio, turns = synthetic_conversation(minutes, sample_rate, num_speakers, np.random.default_rng(seed))
+    heard = len({speaker for _, _, speaker in turns})
+    segments = VoiceDetector(sample_rate=sample_rate).detect_voice_segments(audio)
+    features_list = FeatureExtractor(sample_rate=sample_rate).extract_features_from_segments(audio, segments)
+    if not features_list:
+        return np.empty((0, 0)), np.empty(0), heard
+    embeddings, _, weights = diarizer._prepare_features_for_clustering(features_list)
+    return embeddings, weights, heard
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=5, help="length of each accuracy recording")
+    parser.add_argument("--seeds", type=int, default=3)
+    parser.add_argument("--max-speakers", type=int, default=len(VOICES))
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--sweep-minutes", type=float, nargs="+", default=[1, 10, 60])
+    args = parser.parse_args()
+
+    diarizer = SpeakerDiarization(num_speakers=None, max_speakers=args.max_speakers)
+
+    print(f"{'speakers':>8}  {'estimates':<24}  {'correct':>7}  {'sweep ms':>8}")
+    correct = total = 0
+    for num_speakers in range(args.max_speakers + 1):
+        estimates, seconds, hits = [], 0.0, 0
+        for seed in range(args.seeds):
+            embeddings, weights, heard = window_embeddings(args.minutes, args.sample_rate, num_speakers, seed, diarizer)
+            start = time.perf_counter()
+            estimates.append(diarizer.estimate_num_speakers(embeddings, weights)[0])
+            seconds += time.perf_counter() - start
+            hits += estimates[-1] == heard
+        correct, total = correct + hits, total + len(estimates)
+        print(f"{num_speakers:>8}  {str(estimates):<24}  {hits:>3}/{len(estimates):<3}  "
+              f"{1000 * seconds / len(estimates):>8.1f}")
+    print(f"overall {correct}/{total} correct")
+
+    print()
+    print(f"{'minutes':>8}  {'windows':>8}  {'sweep ms':>8}  {'estimate':>8}")
+    for minutes in args.sweep_minutes:
+        embeddings, weights, _ = window_embeddings(minutes, args.sample_rate, 2, 0, diarizer)
+        start = time.perf_counter()
+        estimate, _ = diarizer.estimate_num_speakers(embeddings, weights)
+        print(f"{minutes:>8g}  {len(embeddings):>8}  {1000 * (time.perf_counter() - start):>8.1f}  {estimate:>8}")
+
+
+if __name__ == "__main__":
+    main()
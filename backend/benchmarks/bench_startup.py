@@ -0,0 +1,41 @@
+"""
+Cold-start time of the backend: module imports, create_app(), and the first
+Mongo round trip (which is where the shared client actually connects).
+
+Each run is a fresh interpreter. Run from the backend directory:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, time
+import app
+from database import connection
+started = time.perf_counter()
+connection.ping()
+app.STARTUP_TIMINGS["first_query_ms"] = round((time.perf_counter() - started) * 1000, 1)
+print(json.dumps(app.STARTUP_TIMINGS))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"median over {args.runs} cold starts")
+    for key in ("imports_ms", "create_app_ms", "first_query_ms"):
+        print(f"{key:>15}: {statistics.median(s[key] for s in samples):8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Correctness and speed harness for VoiceDetector.
+
+Synthesizes labeled recordings (voiced, speech-like bursts of random length
+on a noise floor) and scores the detected segments against the labels at
+10 ms resolution, for float input as librosa.load returns it and for int16
+PCM. Exits non-zero when accuracy or speed falls below the given limits, so
+it can run as a regression check.
+Run from the backend directory:
+    python -m benchmarks.bench_vad_accuracy --minutes 10
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from audio_analysis.diarization_core.voice_detector import VoiceDetector
+
+RESOLUTION = 0.01  # seconds per scoring cell
+
+
+def synthetic_speech(minutes, sample_rate, rng):
+    """
+    Speech-like bursts: a gliding glottal pitch with harmonics, amplitude
+    modulated at a syllable rate, separated by pauses of noise only.
+
+    Returns:
+        tuple: (float32 signal in [-1, 1], list of labeled (start, end) voiced intervals)
+    """
+    n = int(minutes * 60 * sample_rate)
+    signal = rng.normal(0, 0.003, n)
+    labels = []
+    position = rng.uniform(0.5, 2.0)
+    while position < n / sample_rate - 1:
+        length = rng.uniform(0.4, 4.0)
+        start, end = int(position * sample_rate), min(int((position + length) * sample_rate), n)
+        t = np.arange(end - start) / sample_rate
+        pitch = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * np.pi * 0.7 * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+        syllables = 0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(3, 5) * t)
+        signal[start:end] += rng.uniform(0.05, 0.3) * voiced * syllables
+        labels.append((start / sample_rate, end / sample_rate))
+        position += length + rng.uniform(0.3, 3.0)
+    return np.clip(signal, -1, 1).astype(np.float32), labels
+
+
+def to_cells(segments, duration):
+    cells = np.zeros(int(np.ceil(duration / RESOLUTION)), dtype=bool)
+    for start, end in segments:
+        cells[int(start / RESOLUTION):int(np.ceil(end / RESOLUTION))] = True
+    return cells
+
+
+def score(detected, labels, duration):
+    truth, predicted = to_cells(labels, duration), to_cells(detected, duration)
+    tp = np.count_nonzero(truth & predicted)
+    precision = tp / max(np.count_nonzero(predicted), 1)
+    recall = tp / max(np.count_nonzero(truth), 1)
+    f1 = 2 * precision * recall / max(precision + recall, 1e-9)
+    return precision, recall, f1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--aggressiveness", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-f1", type=float, default=0.8)
+    parser.add_argument("--max-rtf", type=float, default=0.01, help="max processing time / audio duration")
+    args = parser.parse_args()
+
+    signal, labels = synthetic_speech(args.minutes, args.sample_rate, np.random.default_rng(args.seed))
+    duration = len(signal) / args.sample_rate
+    inputs = {
+        "float32 [-1, 1]": signal,
+        "int16 PCM": (signal * 32767).astype(np.int16),
+    }
+
+    print(f"{duration / 60:.1f} min, {len(labels)} labeled voiced segments")
+    print(f"{'input':<16}  {'segments':>8}  {'precision':>9}  {'recall':>6}  {'F1':>5}  {'RTF':>8}")
+    failed = False
+    for name, audio in inputs.items():
+        detector = VoiceDetector(sample_rate=args.sample_rate, aggressiveness=args.aggressiveness)
+        start = time.perf_counter()
+        detected = detector.detect_voice_segments(audio)
+        rtf = (time.perf_counter() - start) / duration
+        precision, recall, f1 = score(detected, labels, duration)
+        print(f"{name:<16}  {len(detected):>8}  {precision:>9.3f}  {recall:>6.3f}  {f1:>5.3f}  {rtf:>8.5f}")
+        failed |= f1 < args.min_f1 or rtf > args.max_rtf
+
+    if failed:
+        print(f"FAILED: F1 below {args.min_f1} or realtime factor above {args.max_rtf}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
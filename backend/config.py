@@ -16,13 +16,68 @@ class Config:
     FRAME_DIR = "assets/received_frames"
     CODE_DIR = "assets/received_codes"
     AUDIO_UPLOAD_FOLDER = "assets/uploaded_audio_fragments"
+    AUDIO_SCRATCH_FOLDER = "assets/audio_analysis_uploads"  # files waiting for a diarize_audio job
+    AUDIO_FEATURE_CACHE_FOLDER = "assets/audio_feature_cache"  # VAD segments and MFCCs, keyed by audio content
     KEYLOG_FOLDER = "assets/received_keylogs"
-    for directory in [UPLOAD_FOLDER, FRAME_DIR, CODE_DIR, AUDIO_UPLOAD_FOLDER, KEYLOG_FOLDER]:
+    for directory in [UPLOAD_FOLDER, FRAME_DIR, CODE_DIR, AUDIO_UPLOAD_FOLDER, AUDIO_SCRATCH_FOLDER,
+                      AUDIO_FEATURE_CACHE_FOLDER, KEYLOG_FOLDER]:
         os.makedirs(directory, exist_ok=True)
         
+    ENSURE_INDEXES_ON_STARTUP = os.getenv('ENSURE_INDEXES_ON_STARTUP', 'true').lower() == 'true'
+
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10 MB
+    AUDIO_CHUNK_MAX_BYTES = int(os.getenv('AUDIO_CHUNK_MAX_BYTES', 4 * 1024 * 1024))  # per append of a chunked recording
     ALLOWED_EXTENSIONS = {'.txt', '.docx'}
 
+    # Webcam frame inference (YOLO micro-batching)
+    INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 8))
+    INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 20))
+    INFERENCE_MAX_QUEUE_SIZE = int(os.getenv('INFERENCE_MAX_QUEUE_SIZE', 1024))
+    INFERENCE_TIMEOUT_SECONDS = float(os.getenv('INFERENCE_TIMEOUT_SECONDS', 10))
+
+    # Frame ingest pipeline (accept -> decode -> detect -> persist)
+    INGEST_MAX_PENDING = int(os.getenv('INGEST_MAX_PENDING', 512))
+    INGEST_DECODE_WORKERS = int(os.getenv('INGEST_DECODE_WORKERS', 2))
+    INGEST_PERSIST_QUEUE_SIZE = int(os.getenv('INGEST_PERSIST_QUEUE_SIZE', 1024))
+
+    # Mobile heartbeat write buffering
+    MOBILE_HEARTBEAT_BATCH_SIZE = int(os.getenv('MOBILE_HEARTBEAT_BATCH_SIZE', 500))
+    MOBILE_HEARTBEAT_FLUSH_SECONDS = float(os.getenv('MOBILE_HEARTBEAT_FLUSH_SECONDS', 1.0))
+    MOBILE_HEARTBEAT_MAX_BUFFER = int(os.getenv('MOBILE_HEARTBEAT_MAX_BUFFER', 20000))
+    MOBILE_HEARTBEAT_SYNC_WRITES = os.getenv('MOBILE_HEARTBEAT_SYNC_WRITES', 'false').lower() == 'true'
+
+    # Flagged frame images: 'local' (FRAME_DIR) or 's3' (AWS_BUCKET_NAME)
+    FRAME_STORE_BACKEND = os.getenv('FRAME_STORE_BACKEND', 'local')
+    FRAME_CACHE_MAX_AGE = int(os.getenv('FRAME_CACHE_MAX_AGE', 7 * 24 * 3600))
+    FRAME_THUMBNAIL_SIZE = int(os.getenv('FRAME_THUMBNAIL_SIZE', 160))
+    FRAMES_PER_ATTEMPT = int(os.getenv('FRAMES_PER_ATTEMPT', 4))     # frames inlined per attempt in /exam/attempts
+    FRAMES_PAGE_MAX = int(os.getenv('FRAMES_PAGE_MAX', 100))
+
+    # Keystroke streams (one append-only NDJSON file per attempt under KEYLOG_FOLDER)
+    KEYLOG_MAX_BATCH_EVENTS = int(os.getenv('KEYLOG_MAX_BATCH_EVENTS', 5000))
+    KEYLOG_PATTERNS_FILE = os.getenv('KEYLOG_PATTERNS_FILE')  # JSON pattern list; built-in patterns if unset
+
+    # Background jobs (audio analysis); run by `python -m jobs.worker`
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 0))                      # pool processes; 0 = one per core
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_DELAY_SECONDS = float(os.getenv('JOB_RETRY_DELAY_SECONDS', 30))  # doubles on each retry
+    JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 900))
+    JOB_POLL_INTERVAL_SECONDS = float(os.getenv('JOB_POLL_INTERVAL_SECONDS', 1.0))
+    JOB_WORKER_EMBEDDED = os.getenv('JOB_WORKER_EMBEDDED', 'false').lower() == 'true'  # run jobs in the web process
+    AUDIO_SCRATCH_MAX_AGE_SECONDS = float(os.getenv('AUDIO_SCRATCH_MAX_AGE_SECONDS', 24 * 3600))  # unclaimed uploads
+
+    # Live audio monitoring of chunked recordings; run by `python -m audio_analysis.monitor`
+    AUDIO_MONITOR_SHARDS = int(os.getenv('AUDIO_MONITOR_SHARDS', 0))              # processes; 0 = one per core
+    AUDIO_MONITOR_WINDOW_SECONDS = float(os.getenv('AUDIO_MONITOR_WINDOW_SECONDS', 30))
+    AUDIO_MONITOR_HOP_SECONDS = float(os.getenv('AUDIO_MONITOR_HOP_SECONDS', 15))    # a summary is written this often
+    AUDIO_MONITOR_IDLE_SECONDS = float(os.getenv('AUDIO_MONITOR_IDLE_SECONDS', 120))  # drop state of stalled recordings
+    AUDIO_MONITOR_POLL_SECONDS = float(os.getenv('AUDIO_MONITOR_POLL_SECONDS', 1.0))
+
+    # Audio feature cache; warmed and trimmed by `python -m audio_analysis.cache`
+    AUDIO_FEATURE_CACHE = os.getenv('AUDIO_FEATURE_CACHE', 'true').lower() == 'true'
+    AUDIO_FEATURE_CACHE_MAX_AGE_DAYS = float(os.getenv('AUDIO_FEATURE_CACHE_MAX_AGE_DAYS', 30))  # since last use
+    AUDIO_FEATURE_CACHE_MAX_BYTES = int(os.getenv('AUDIO_FEATURE_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+
     # S3 configuration
     AWS_BUCKET_NAME = os.getenv('AWS_BUCKET_NAME')
     AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
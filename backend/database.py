@@ -1,36 +1,117 @@
 #backend/database.py
 
 import os
+import threading
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
 
 load_dotenv()
 
+
+class MongoConnection:
+    """
+    Process-wide MongoClient, created on first use.
+
+    Nothing connects at import time, and a process forked from the one that
+    built the client (e.g. a Gunicorn worker) builds its own on first use,
+    because a MongoClient must not be shared across fork().
+    """
+    def __init__(self, uri, db_name, **client_options):
+        self.uri = uri
+        self.db_name = db_name
+        self.client_options = client_options
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._client = MongoClient(self.uri, server_api=ServerApi('1'),
+                                               connect=False, **self.client_options)
+                    self._pid = os.getpid()
+        return self._client
+
+    def database(self):
+        return self.client()[self.db_name]
+
+    def ping(self):
+        self.client().admin.command('ping')
+
+
+class LazyCollection:
+    """Stand-in for a Collection that resolves against the shared client on use."""
+    def __init__(self, connection, name):
+        self._connection = connection
+        self._name = name
+
+    def _collection(self):
+        return self._connection.database()[self._name]
+
+    def __getattr__(self, attr):
+        return getattr(self._collection(), attr)
+
+    def __getitem__(self, name):
+        return self._collection()[name]
+
+    def __repr__(self):
+        return f"LazyCollection({self._connection.db_name}.{self._name})"
+
+
+class LazyDatabase:
+    """Stand-in for a Database; `db["name"]` hands out LazyCollections."""
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getitem__(self, name):
+        return LazyCollection(self._connection, name)
+
+    def __getattr__(self, attr):
+        return getattr(self._connection.database(), attr)
+
+    def __repr__(self):
+        return f"LazyDatabase({self._connection.db_name})"
+
+
+class LazyClient:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, attr):
+        return getattr(self._connection.client(), attr)
+
+
+connection = MongoConnection(
+    os.getenv('USER1'),
+    os.getenv('MONGO_DB_NAME', 'beproject'),
+    maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', 50)),
+    minPoolSize=int(os.getenv('MONGO_MIN_POOL_SIZE', 0)),
+    connectTimeoutMS=int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+    serverSelectionTimeoutMS=int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    socketTimeoutMS=int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 30000)),
+)
+
+
+def get_db():
+    """The shared database handle."""
+    return LazyDatabase(connection)
+
+
 def init_db():
-    URI = os.getenv('USER1')
-    try:
-        client = MongoClient(URI, server_api=ServerApi('1'))
-        client.admin.command('ping')
-        db = client["beproject"]
-        print("You successfully connected to MongoDB!")
-        
-        # Initialize collections
-        db_collection = db["attempted_exams"]
-        db_exams = db["exams"]
-        users_collection = db["users"]
-        mobile_activity_logs = db["mobile_activity_logs"]
-        frames = db["frames"]
-        
-        return {
-            "client": client,
-            "db": db,
-            "db_collection": db_collection,
-            "db_exams": db_exams,
-            "users_collection": users_collection,
-            "mobile_activity_logs": mobile_activity_logs,
-            "frames": frames
-        }
-    except Exception as e:
-        print(e)
-        raise e  # Re-raise the exception to fail fast during app startup
\ No newline at end of file
+    """
+    Handles to the shared client and collections. Cheap to call from every
+    blueprint: all of them share one connection pool per process, and the
+    pool only connects when the first query runs.
+    """
+    db = get_db()
+    return {
+        "client": LazyClient(connection),
+        "db": db,
+        "db_collection": db["attempted_exams"],
+        "db_exams": db["exams"],
+        "users_collection": db["users"],
+        "mobile_activity_logs": db["mobile_activity_logs"],
+        "frames": db["frames"]
+    }
@@ -1,7 +1,57 @@
+import logging
 from datetime import datetime, timezone
 import numpy as np
-from typing import Dict, List, Any
-import re
+from typing import Dict, List, Any, Optional
+from pymongo import UpdateOne
+from exam.evidence import evidence_versions
+from upload.keylogs import keystroke_automaton
+
+# Raw per-attempt features. Every sub-score is a closed-form function of these
+# columns, so a whole exam is scored with a handful of array operations.
+FEATURE_COLUMNS = (
+    'keylog_suspicious', 'keylog_total',
+    'tab_count', 'tab_span',
+    'resize_significant', 'resize_total',
+    'mobile_focus', 'mobile_total',
+    'audio_abnormal', 'audio_total',
+    'frames_suspicious', 'frames_total',
+)
+
+# Labels of the keystroke patterns that count as suspicious (the rest, like
+# Meta presses, only add to the total); the same engine produces the counts.
+SUSPICIOUS_KEY_PATTERNS = keystroke_automaton().suspicious_labels()
+
+FOCUS_EVENTS = ('blur', 'visibilitychange')
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_time(value) -> Optional[float]:
+    """Epoch seconds of an ISO-8601 timestamp, or None if it cannot be parsed."""
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _resize_dims(event) -> Optional[tuple]:
+    """(width, height, baseline width, baseline height) of a resize event, or None if it is malformed."""
+    try:
+        return (float(event['screenWidth']), float(event['screenHeight']),
+                float(event.get('baselineWidth', 0)), float(event.get('baselineHeight', 0)))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _ratio(flagged: np.ndarray, total: np.ndarray) -> np.ndarray:
+    """flagged / total capped at 1, and 0 where there is nothing to count."""
+    return np.where(total > 0, np.minimum(flagged / np.maximum(total, 1), 1.0), 0.0)
+
+
+def _object_class(obj) -> Optional[str]:
+    # frames store YOLO class names; older documents stored {"class": ...} dicts
+    return obj if isinstance(obj, str) else (obj or {}).get('class')
+
 
 class CheatingAnalyzer:
     def __init__(self):
@@ -14,214 +64,300 @@ class CheatingAnalyzer:
             'audio_anomalies': 0.2,      # Audio anomalies
             'face_detection': 0.1        # Face detection issues
         }
+        # detailed score name -> weight key
+        self.score_weights = {
+            'keylog_score': 'keylog_suspicious',
+            'tab_switching_score': 'tab_switching',
+            'window_resize_score': 'window_resize',
+            'mobile_activity_score': 'mobile_activity',
+            'audio_anomalies_score': 'audio_anomalies',
+            'face_detection_score': 'face_detection'
+        }
 
-    def analyze_keylogs(self, keylogs: Dict[str, Dict[str, int]]) -> float:
+    def extract_features(self, exam_data: Dict[str, Any]) -> Dict[str, float]:
         """
-        Analyze keyboard logs for suspicious patterns
-        Returns a score between 0 and 1
+        Reduce one attempt's raw evidence to the FEATURE_COLUMNS counts.
+        Keys that are missing from exam_data contribute zeros.
         """
-        if not keylogs:
-            return 0.0
+        features = dict.fromkeys(FEATURE_COLUMNS, 0.0)
+
+        keylogs = exam_data.get('suspiciousKeylogs') or {}
+        for events in keylogs.values():
+            features['keylog_total'] += sum(events.values())
+            features['keylog_suspicious'] += sum(events.get(p, 0) for p in SUSPICIOUS_KEY_PATTERNS)
+
+        tab_events = exam_data.get('tabEvents') or []
+        tab_times = [_parse_time(e.get('timestamp')) if isinstance(e, dict) else None for e in tab_events]
+        if None in tab_times:
+            # one bad client event must not fail the analysis of the attempt, or of the exam
+            logger.warning(f"Skipping {tab_times.count(None)} tab events without a valid timestamp "
+                           f"for {exam_data.get('username')}")
+            tab_times = [t for t in tab_times if t is not None]
+        features['tab_count'] = len(tab_times)
+        if len(tab_times) > 1:
+            # consecutive gaps telescope: their mean is (last - first) / (n - 1)
+            features['tab_span'] = tab_times[-1] - tab_times[0]
+
+        resize_events = exam_data.get('resizeEvents') or []
+        resize_dims = [_resize_dims(e) for e in resize_events]
+        if None in resize_dims:
+            logger.warning(f"Skipping {resize_dims.count(None)} resize events without valid dimensions "
+                           f"for {exam_data.get('username')}")
+            resize_dims = [d for d in resize_dims if d is not None]
+        if resize_dims:
+            width, height, base_w, base_h = np.array(resize_dims, dtype=float).T
+            significant = (np.abs(width - base_w) > base_w * 0.2) | (np.abs(height - base_h) > base_h * 0.2)
+            features['resize_significant'] = float(significant.sum())
+            features['resize_total'] = len(resize_dims)
+
+        mobile_events = exam_data.get('mobileEvents') or []
+        features['mobile_focus'] = sum(1 for e in mobile_events if e.get('event') in FOCUS_EVENTS)
+        features['mobile_total'] = len(mobile_events)
+
+        audio_events = exam_data.get('audioEvents') or []
+        features['audio_abnormal'] = sum(1 for e in audio_events if e.get('isAbnormal', False))
+        features['audio_total'] = len(audio_events)
+
+        frames = exam_data.get('frames') or []
+        for frame in frames:
+            # multiple faces or no face at all
+            persons = sum(1 for obj in frame.get('objects', []) if _object_class(obj) == 'person')
+            features['frames_suspicious'] += persons != 1
+        features['frames_total'] = len(frames)
 
-        suspicious_patterns = {
-            'copy_paste': ['ctrl+c', 'ctrl+v', 'ctrl+x'],
-            'shortcuts': ['alt+tab', 'win+d', 'win+e'],
-            'browser': ['f5', 'ctrl+r', 'ctrl+l'],
-            'suspicious': ['printscreen', 'screenshot']
-        }
+        return features
 
-        total_events = sum(sum(counts.values()) for counts in keylogs.values())
-        if total_events == 0:
-            return 0.0
+    def score_features(self, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Score any number of attempts at once.
 
-        suspicious_count = 0
-        for pattern_type, patterns in suspicious_patterns.items():
-            for pattern in patterns:
-                for timestamp, events in keylogs.items():
-                    if pattern in events:
-                        suspicious_count += events[pattern]
+        Args:
+            columns (dict): FEATURE_COLUMNS name -> array with one entry per attempt
 
-        return min(suspicious_count / total_events, 1.0)
+        Returns:
+            dict: detailed score name -> array of scores in [0, 1], plus 'total_score'
+        """
+        col = {name: np.asarray(columns[name], dtype=float) for name in FEATURE_COLUMNS}
+
+        # Consider tab switching suspicious if the average time between switches is under 5 seconds
+        tab_gaps = col['tab_count'] - 1
+        avg_gap = col['tab_span'] / np.maximum(tab_gaps, 1)
+        tab_score = np.where(tab_gaps > 0, np.clip(1 - avg_gap / 5, 0.0, 1.0), 0.0)
+
+        scores = {
+            'keylog_score': _ratio(col['keylog_suspicious'], col['keylog_total']),
+            'tab_switching_score': tab_score,
+            'window_resize_score': _ratio(col['resize_significant'], col['resize_total']),
+            'mobile_activity_score': _ratio(col['mobile_focus'], col['mobile_total']),
+            'audio_anomalies_score': _ratio(col['audio_abnormal'], col['audio_total']),
+            'face_detection_score': _ratio(col['frames_suspicious'], col['frames_total'])
+        }
+
+        total = np.zeros_like(tab_score)
+        for name, score in scores.items():
+            total = total + score * self.weights[self.score_weights[name]]
+        scores['total_score'] = total
+        return scores
+
+    def results_from_scores(self, scores: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        """Per-attempt result documents, in the shape stored on attempts."""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        totals = scores['total_score']
+        risk_levels = np.select([totals >= 0.7, totals >= 0.4], ["High", "Medium"], "Low")
+        detailed = [name for name in scores if name != 'total_score']
+        return [{
+            'detailed_scores': {name: float(scores[name][i]) for name in detailed},
+            'total_score': round(float(totals[i]), 3),
+            'risk_level': str(risk_levels[i]),
+            'timestamp': timestamp
+        } for i in range(len(totals))]
+
+    def analyze_batch(self, features: List[Dict[str, float]]) -> List[Dict[str, Any]]:
+        """Score a list of extract_features() rows in one vectorized pass."""
+        columns = {name: np.array([row[name] for row in features], dtype=float) for name in FEATURE_COLUMNS}
+        return self.results_from_scores(self.score_features(columns))
+
+    def _single_score(self, exam_data: Dict[str, Any], name: str) -> float:
+        return self.analyze_batch([self.extract_features(exam_data)])[0]['detailed_scores'][name]
+
+    def analyze_keylogs(self, keylogs: Dict[str, Dict[str, int]]) -> float:
+        """
+        Analyze keyboard logs for suspicious patterns
+        Returns a score between 0 and 1
+        """
+        return self._single_score({'suspiciousKeylogs': keylogs}, 'keylog_score')
 
     def analyze_tab_switching(self, tab_events: List[Dict[str, Any]]) -> float:
         """
         Analyze tab switching frequency and patterns
         Returns a score between 0 and 1
         """
-        if not tab_events:
-            return 0.0
-
-        # Calculate average time between tab switches
-        timestamps = [datetime.fromisoformat(event['timestamp']) for event in tab_events]
-        time_diffs = [(timestamps[i] - timestamps[i-1]).total_seconds() 
-                     for i in range(1, len(timestamps))]
-
-        if not time_diffs:
-            return 0.0
-
-        avg_time_diff = np.mean(time_diffs)
-        # Consider suspicious if average time between switches is less than 5 seconds
-        return min(1.0, max(0.0, 1 - (avg_time_diff / 5)))
+        return self._single_score({'tabEvents': tab_events}, 'tab_switching_score')
 
     def analyze_window_resize(self, resize_events: List[Dict[str, Any]]) -> float:
         """
-        Analyze window resize events for suspicious patterns
+        Analyze window resize events for suspicious patterns (more than 20% change)
         Returns a score between 0 and 1
         """
-        if not resize_events:
-            return 0.0
-
-        # Count significant resize events (more than 20% change)
-        significant_resizes = 0
-        for event in resize_events:
-            width_change = abs(event['screenWidth'] - event.get('baselineWidth', 0))
-            height_change = abs(event['screenHeight'] - event.get('baselineHeight', 0))
-            
-            if width_change > event.get('baselineWidth', 0) * 0.2 or \
-               height_change > event.get('baselineHeight', 0) * 0.2:
-                significant_resizes += 1
-
-        return min(significant_resizes / len(resize_events), 1.0)
+        return self._single_score({'resizeEvents': resize_events}, 'window_resize_score')
 
     def analyze_mobile_activity(self, mobile_events: List[Dict[str, Any]]) -> float:
         """
         Analyze mobile device activity for suspicious patterns
         Returns a score between 0 and 1
         """
-        if not mobile_events:
-            return 0.0
-
-        suspicious_events = 0
-        for event in mobile_events:
-            if event['event'] in ['blur', 'visibilitychange']:
-                suspicious_events += 1
-
-        return min(suspicious_events / len(mobile_events), 1.0)
+        return self._single_score({'mobileEvents': mobile_events}, 'mobile_activity_score')
 
     def analyze_audio_anomalies(self, audio_events: List[Dict[str, Any]]) -> float:
         """
         Analyze audio events for suspicious patterns
         Returns a score between 0 and 1
         """
-        if not audio_events:
-            return 0.0
-
-        # Count events marked as abnormal
-        abnormal_count = sum(1 for event in audio_events if event.get('isAbnormal', False))
-        return min(abnormal_count / len(audio_events), 1.0)
+        return self._single_score({'audioEvents': audio_events}, 'audio_anomalies_score')
 
     def analyze_face_detection(self, frames: List[Dict[str, Any]]) -> float:
         """
         Analyze face detection results for suspicious patterns
         Returns a score between 0 and 1
         """
-        if not frames:
-            return 0.0
-
-        suspicious_frames = 0
-        for frame in frames:
-            # Check for multiple faces or no face detected
-            faces = [obj for obj in frame.get('objects', []) if obj.get('class') == 'person']
-            if len(faces) > 1 or len(faces) == 0:
-                suspicious_frames += 1
-
-        return min(suspicious_frames / len(frames), 1.0)
+        return self._single_score({'frames': frames}, 'face_detection_score')
 
     def calculate_cheating_probability(self, exam_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Calculate overall cheating probability based on all available data
         Returns a dictionary with detailed analysis and final score
         """
-        analysis = {
-            'keylog_score': self.analyze_keylogs(exam_data.get('suspiciousKeylogs', {})),
-            'tab_switching_score': self.analyze_tab_switching(exam_data.get('tabEvents', [])),
-            'window_resize_score': self.analyze_window_resize(exam_data.get('resizeEvents', [])),
-            'mobile_activity_score': self.analyze_mobile_activity(exam_data.get('mobileEvents', [])),
-            'audio_anomalies_score': self.analyze_audio_anomalies(exam_data.get('audioEvents', [])),
-            'face_detection_score': self.analyze_face_detection(exam_data.get('frames', []))
-        }
+        return self.analyze_batch([self.extract_features(exam_data)])[0]
 
-        # Calculate weighted average
-        total_score = sum(
-            score * self.weights[category]
-            for category, score in analysis.items()
-        )
 
-        # Determine risk level
-        if total_score >= 0.7:
-            risk_level = "High"
-        elif total_score >= 0.4:
-            risk_level = "Medium"
-        else:
-            risk_level = "Low"
+def _grouped_counts(collection, match: Dict[str, Any], flag) -> Dict[str, tuple]:
+    """{username: (flagged, total)} counted by the server in one aggregation."""
+    cursor = collection.aggregate([
+        {'$match': match},
+        {'$group': {
+            '_id': '$username',
+            'flagged': {'$sum': {'$cond': [flag, 1, 0]}},
+            'total': {'$sum': 1}
+        }}
+    ])
+    return {doc['_id']: (doc['flagged'], doc['total']) for doc in cursor}
 
-        return {
-            'detailed_scores': analysis,
-            'total_score': round(total_score, 3),
-            'risk_level': risk_level,
-            'timestamp': datetime.now(timezone.utc).isoformat()
-        }
 
-def get_cheating_analysis(exam_id: str, username: str, db) -> Dict[str, Any]:
+def load_exam_features(db, exam_id: str, usernames: Optional[List[str]] = None):
     """
-    Main function to get cheating analysis for a specific exam attempt
+    Load the features of every attempt of an exam (or only `usernames`).
+    Frames, mobile logs and audio logs are reduced to counts server-side,
+    so one aggregation per evidence collection covers the whole exam.
+
+    Returns:
+        tuple: (attempts, features) where attempts are {_id, username} documents
+               and features the matching extract_features()-style rows
     """
-    try:
-        # Get exam attempt data
-        attempt = db['attempted_exams'].find_one({
-            'examId': exam_id,
-            'username': username
-        })
+    attempt_filter = {'examId': exam_id}
+    frame_filter = {'exam_id': exam_id}
+    log_filter = {'examId': exam_id}
+    if usernames is not None:
+        attempt_filter['username'] = frame_filter['username'] = log_filter['username'] = {'$in': list(usernames)}
+
+    attempts = list(db['attempted_exams'].find(
+        attempt_filter,
+        {'username': 1, 'suspiciousKeylogs': 1, 'tabEvents': 1, 'resizeEvents': 1}
+    ))
+    if not attempts:
+        return [], []
+
+    person_count = {'$size': {'$filter': {
+        'input': {'$ifNull': ['$objects', []]},
+        'as': 'o',
+        'cond': {'$or': [{'$eq': ['$$o', 'person']}, {'$eq': ['$$o.class', 'person']}]}
+    }}}
+    frames = _grouped_counts(db['frames'], frame_filter, {'$ne': [person_count, 1]})
+    mobile = _grouped_counts(db['mobile_activity_logs'], log_filter, {'$in': ['$event', list(FOCUS_EVENTS)]})
+    audio = _grouped_counts(db['audio_logs'], log_filter, {'$ifNull': ['$isAbnormal', False]})
+
+    analyzer = CheatingAnalyzer()
+    features = []
+    for attempt in attempts:
+        username = attempt.get('username')
+        row = analyzer.extract_features(attempt)
+        row['frames_suspicious'], row['frames_total'] = frames.get(username, (0, 0))
+        row['mobile_focus'], row['mobile_total'] = mobile.get(username, (0, 0))
+        row['audio_abnormal'], row['audio_total'] = audio.get(username, (0, 0))
+        features.append(row)
+    return attempts, features
+
+
+def analyze_exam_attempts(exam_id: str, db, usernames: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Cheating analysis for every attempt of an exam (or only `usernames`).
 
-        if not attempt:
+    Results are cached on the attempt together with the evidence version they
+    were computed from (see exam.evidence). Attempts whose evidence has not
+    changed are served from that cache without reading frames or logs; the
+    rest are recomputed in one vectorized pass and stored with a single bulk write.
+    """
+    try:
+        attempt_filter = {'examId': exam_id}
+        if usernames is not None:
+            attempt_filter['username'] = {'$in': list(usernames)}
+        attempts = list(db['attempted_exams'].find(
+            attempt_filter,
+            {'username': 1, 'cheating_analysis': 1, 'cheating_analysis_version': 1}
+        ))
+        if not attempts:
             return {
                 'success': False,
                 'message': 'Exam attempt not found'
             }
 
-        # Get additional monitoring data
-        frames = list(db['frames'].find({
-            'exam_id': exam_id,
-            'username': username
-        }))
-
-        mobile_events = list(db['mobile_activity_logs'].find({
-            'examId': exam_id,
-            'username': username
-        }))
-
-        audio_events = list(db['audio_logs'].find({
-            'examId': exam_id,
-            'username': username
-        }))
-
-        # Prepare data for analysis
-        exam_data = {
-            'suspiciousKeylogs': attempt.get('suspiciousKeylogs', {}),
-            'tabEvents': attempt.get('tabEvents', []),
-            'resizeEvents': attempt.get('resizeEvents', []),
-            'mobileEvents': mobile_events,
-            'audioEvents': audio_events,
-            'frames': frames
-        }
-
-        # Perform analysis
-        analyzer = CheatingAnalyzer()
-        analysis_result = analyzer.calculate_cheating_probability(exam_data)
-
-        # Update the attempt with analysis results
-        db['attempted_exams'].update_one(
-            {'_id': attempt['_id']},
-            {'$set': {'cheating_analysis': analysis_result}}
-        )
+        # read versions before the evidence: anything ingested meanwhile
+        # leaves the stored version behind and is picked up next time
+        versions = evidence_versions(db, exam_id, [a.get('username') for a in attempts])
+        analyses = {}
+        stale = []
+        for attempt in attempts:
+            username = attempt.get('username')
+            cached = attempt.get('cheating_analysis')
+            if cached is not None and attempt.get('cheating_analysis_version') == versions[username]:
+                analyses[username] = cached
+            else:
+                stale.append(username)
+
+        if stale:
+            stale_attempts, features = load_exam_features(db, exam_id, stale)
+            results = CheatingAnalyzer().analyze_batch(features)
+            db['attempted_exams'].bulk_write([
+                UpdateOne({'_id': attempt['_id']}, {'$set': {
+                    'cheating_analysis': result,
+                    'cheating_analysis_version': versions[attempt.get('username')]
+                }})
+                for attempt, result in zip(stale_attempts, results)
+            ], ordered=False)
+            for attempt, result in zip(stale_attempts, results):
+                analyses[attempt.get('username')] = result
 
         return {
             'success': True,
-            'analysis': analysis_result
+            'analyses': analyses,
+            'recomputed': len(stale)
         }
 
     except Exception as e:
         return {
             'success': False,
             'message': f'Error analyzing exam data: {str(e)}'
-        } 
\ No newline at end of file
+        }
+
+
+def get_cheating_analysis(exam_id: str, username: str, db) -> Dict[str, Any]:
+    """
+    Main function to get cheating analysis for a specific exam attempt
+    """
+    result = analyze_exam_attempts(exam_id, db, usernames=[username])
+    if not result['success']:
+        return result
+    return {
+        'success': True,
+        'analysis': result['analyses'][username],
+        'cached': result['recomputed'] == 0
+    }
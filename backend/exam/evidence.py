@@ -0,0 +1,142 @@
+import datetime
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+# One small document per (examId, username), bumped with $inc as evidence is
+# ingested, so scoring a submission never has to scan frames or mobile logs.
+# `evidence_version` goes up with every write of any evidence for the attempt,
+# and is what cached analysis results are checked against.
+COUNTER_FIELDS = (
+    "suspicious_frames",
+    "focus_violations",
+    "screen_changes",
+    "network_changes",
+    "battery_issues",
+)
+
+
+def _increment(increments):
+    return {
+        "$inc": {**increments, "evidence_version": 1},
+        "$set": {"updatedAt": datetime.datetime.now(datetime.timezone.utc)},
+    }
+
+
+def counter_update(exam_id, username, increments):
+    """UpdateOne that adds `increments` to the attempt's counters, for bulk writes."""
+    return UpdateOne({"examId": exam_id, "username": username}, _increment(increments), upsert=True)
+
+
+def counter_stage(increments):
+    """The same change as counter_update, as an update-pipeline stage."""
+    return {"$set": {
+        **{field: {"$add": [{"$ifNull": [f"${field}", 0]}, n]}
+           for field, n in {**increments, "evidence_version": 1}.items()},
+        "updatedAt": {"$literal": datetime.datetime.now(datetime.timezone.utc)},
+    }}
+
+
+def record_evidence(counters_collection, exam_id, username, **increments):
+    """Atomically add to an attempt's counters, creating the document if needed."""
+    counters_collection.update_one({"examId": exam_id, "username": username},
+                                   _increment(increments), upsert=True)
+
+
+def start_counters(counters_collection, exam_id, username):
+    """
+    Mark the counters of an attempt that starts now as `rebuilt`: all of its
+    evidence arrives through the increments, so there is nothing to recount.
+    """
+    counters_collection.update_one({"examId": exam_id, "username": username},
+                                   {"$setOnInsert": {"rebuilt": True}}, upsert=True)
+
+
+def bump_evidence_version(counters_collection, exam_id, username):
+    """Mark the attempt's evidence as changed without touching any counter."""
+    record_evidence(counters_collection, exam_id, username)
+
+
+def evidence_versions(db, exam_id, usernames):
+    """{username: evidence_version} for the given attempts; 0 when nothing was ingested."""
+    cursor = db["attempt_counters"].find(
+        {"examId": exam_id, "username": {"$in": list(usernames)}},
+        {"username": 1, "evidence_version": 1}
+    )
+    versions = dict.fromkeys(usernames, 0)
+    versions.update({doc["username"]: doc.get("evidence_version", 0) for doc in cursor})
+    return versions
+
+
+def is_low_battery_event(log):
+    level = log.get("batteryLevel")
+    # clients send whatever they have (mobile_monitor.html has sent `{}`); only numbers count
+    return (log.get("event") == "battery" and isinstance(level, (int, float))
+            and not isinstance(level, bool) and level < 0.2)
+
+
+def mobile_log_increments(log):
+    """Counter increments contributed by one mobile heartbeat."""
+    event = log.get("event")
+    increments = {}
+    if event in ("blur", "visibilitychange"):
+        increments["focus_violations"] = 1
+    if event == "resize":
+        increments["screen_changes"] = 1
+    if event == "networkchange":
+        increments["network_changes"] = 1
+    if is_low_battery_event(log):
+        increments["battery_issues"] = 1
+    return increments
+
+
+REBUILD_ATTEMPTS = 3
+
+
+def rebuild_counters(db, exam_id, username):
+    """
+    Recount an attempt's evidence server-side and mark the counters
+    `rebuilt`. A one-off migration path for attempts started before the
+    counters existed (attempts started since are marked by start_counters):
+    increments since then created the document, but only count what came
+    after.
+    """
+    counters = db["attempt_counters"]
+    key = {"examId": exam_id, "username": username}
+    logs = db["mobile_activity_logs"]
+    log_filter = {"examId": exam_id, "username": username}
+    for _ in range(REBUILD_ATTEMPTS):
+        current = counters.find_one(key, {"evidence_version": 1, "rebuilt": 1})
+        if current is not None and current.get("rebuilt"):
+            break
+        counts = {
+            "suspicious_frames": db["frames"].count_documents(
+                {"exam_id": exam_id, "username": username, "objects.0": {"$exists": True}}),
+            "focus_violations": logs.count_documents({**log_filter, "event": {"$in": ["blur", "visibilitychange"]}}),
+            "screen_changes": logs.count_documents({**log_filter, "event": "resize"}),
+            "network_changes": logs.count_documents({**log_filter, "event": "networkchange"}),
+            "battery_issues": logs.count_documents({**log_filter, "event": "battery", "batteryLevel": {"$lt": 0.2}}),
+        }
+        if current is None:
+            try:
+                result = counters.update_one(key, {"$setOnInsert": {**counts, "rebuilt": True}}, upsert=True)
+            except DuplicateKeyError:
+                continue  # created by an increment meanwhile
+            if result.upserted_id is not None:
+                break
+        else:
+            # replace the counts only if no evidence was counted in between, else count again
+            result = counters.update_one(
+                {**key, "evidence_version": current.get("evidence_version"), "rebuilt": {"$ne": True}},
+                {"$set": {**counts, "rebuilt": True}, "$inc": {"evidence_version": 1}}
+            )
+            if result.matched_count:
+                break
+    return counters.find_one(key)
+
+
+def load_counters(db, exam_id, username):
+    """The attempt's counters, with every field present; legacy attempts are recounted once."""
+    doc = db["attempt_counters"].find_one({"examId": exam_id, "username": username})
+    if doc is None or not doc.get("rebuilt"):
+        doc = rebuild_counters(db, exam_id, username) or {}
+    return {field: doc.get(field, 0) for field in COUNTER_FIELDS}
@@ -0,0 +1,88 @@
+import datetime
+from upload.frame_store import frame_url
+
+# Only what the instructor attempts page renders; answers, code submissions
+# and detailed scores stay in Mongo.
+ATTEMPT_LIST_PROJECTION = {
+    "examId": 1, "username": 1, "startedAt": 1, "submittedAt": 1, "status": 1,
+    "score": 1, "maxScore": 1, "cheatingScore": 1, "cheatingFactors": 1,
+    "suspiciousKeylogs": 1, "cursorWarningCount": 1,
+    # window-by-window audio analysis stays behind; the page shows the peak speaker count
+    "recordings.file": 1, "recordings.timestamp": 1, "recordings.status": 1, "recordings.maxSpeakers": 1,
+    "audioMaxSpeakers": 1,
+}
+
+FRAME_LIST_PROJECTION = {"_id": 0, "timestamp": 1, "objects": 1, "image_key": 1, "width": 1,
+                         "height": 1, "thumb_key": 1, "image": 1}
+
+
+def serialize_frame(f):
+    """Frame metadata for the instructor UI; images are fetched separately by URL."""
+    frame = {
+        "timestamp": f["timestamp"],
+        "objects":   f["objects"],
+    }
+    if f.get("image_key"):
+        frame["imageUrl"] = frame_url(f["image_key"])
+        frame["width"]    = f.get("width")
+        frame["height"]   = f.get("height")
+        # frames stored before thumbnails existed fall back to the full image
+        frame["thumbnailUrl"] = frame_url(f.get("thumb_key") or f["image_key"])
+    else:
+        # frames stored before the frame store existed still carry inline base64
+        frame["image"] = f.get("image")
+    return frame
+
+
+def exam_attempts_pipeline(exam_id, frames_limit):
+    """
+    Aggregation returning every attempt of an exam joined with the first
+    `frames_limit` flagged frames and the total frame count of each candidate,
+    in a single round trip.
+    """
+    frame_facets = {"total": [{"$count": "count"}]}
+    if frames_limit > 0:
+        frame_facets["page"] = [{"$limit": frames_limit}, {"$project": FRAME_LIST_PROJECTION}]
+
+    return [
+        {"$match": {"examId": exam_id}},
+        {"$project": ATTEMPT_LIST_PROJECTION},
+        {"$lookup": {
+            "from": "frames",
+            "let": {"username": "$username"},
+            "pipeline": [
+                # exam_id is a literal so the (exam_id, username) index prefix applies
+                {"$match": {"exam_id": exam_id, "$expr": {"$eq": ["$username", "$$username"]}}},
+                {"$sort": {"timestamp": 1}},
+                {"$facet": frame_facets},
+            ],
+            "as": "frameSummary",
+        }},
+    ]
+
+
+def shape_attempt(a):
+    """Make an aggregated attempt JSON-safe and derive the UI fields."""
+    a["_id"] = str(a["_id"])
+    for field in ("submittedAt", "startedAt"):
+        if isinstance(a.get(field), datetime.datetime):
+            a[field] = a[field].isoformat()
+
+    # build cheatingActivities from suspiciousKeylogs
+    cheating_list = []
+    for action_hits in (a.get("suspiciousKeylogs") or {}).values():
+        for keystroke, count in action_hits.items():
+            cheating_list.append(f"{keystroke} ({count})")
+    a["cheatingActivities"] = cheating_list
+
+    summary = (a.pop("frameSummary", None) or [{}])[0]
+    total = summary.get("total") or [{}]
+    a["cheatingFrames"] = [serialize_frame(f) for f in summary.get("page", [])]
+    a["cheatingFramesTotal"] = total[0].get("count", 0)
+    return a
+
+
+def fetch_exam_attempts(attempts_collection, exam_id, frames_limit):
+    """All attempts of an exam with their first frames, via one aggregation."""
+    cursor = attempts_collection.aggregate(exam_attempts_pipeline(exam_id, frames_limit))
+    return [shape_attempt(a) for a in cursor]
@@ -15,7 +15,9 @@ from werkzeug.utils import secure_filename
 import os, uuid, jwt
 from flask_mail import Mail, Message
 from bson.objectid import ObjectId
-from exam.cheating_analysis import get_cheating_analysis
+from exam.cheating_analysis import get_cheating_analysis, analyze_exam_attempts
+from exam.queries import FRAME_LIST_PROJECTION, serialize_frame, fetch_exam_attempts
+from exam.evidence import load_counters, bump_evidence_version, start_counters
 
 db_data = init_db()
 db = db_data['db']
@@ -208,6 +210,17 @@ def exam_assigned():
     except Exception as e:
         print("Error in /exam/assigned:", e)
         return jsonify({"success": False, "message": str(e)}), 500
+
+def page_args(default_limit):
+    """Read offset/limit query params, clamped to sane bounds."""
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit  = int(request.args.get("limit", default_limit))
+    except ValueError:
+        offset, limit = 0, default_limit
+    # pymongo treats limit(0) as "no limit", so never hand it a zero
+    return offset, min(max(limit, 1), Config.FRAMES_PAGE_MAX)
+
 @exam_bp.route('/attempts', methods=['GET'])
 @cross_origin(origins=[""], supports_credentials=True)
 def exam_attempts():
@@ -216,42 +229,39 @@ def exam_attempts():
     if not exam_id:
         return jsonify({"success": False, "message": "Missing examId"}), 400
 
-    # 2) load all attempt documents for this exam
-    cursor = db_collection.find({ "examId": exam_id })
-    attempts = []
-
-    for a in cursor:
-        # make IDs/datetimes JSON-safe
-        a["_id"] = str(a["_id"])
-        sub = a.get("submittedAt")
-        if isinstance(sub, datetime.datetime):
-            a["submittedAt"] = sub.isoformat()
-
-        # 3) build cheatingActivities from suspiciousKeylogs
-        suspicious = a.get("suspiciousKeylogs", {})
-        cheating_list = []
-        for action_hits in suspicious.values():
-            for keystroke, count in action_hits.items():
-                cheating_list.append(f"{keystroke} ({count})")
-        a["cheatingActivities"] = cheating_list
-
-        # 4) fetch flagged frames for this user+exam
-        user = a.get("username")
-        frames_cursor = db_frames.find({
-            "exam_id":  exam_id,  # snake_case in your frames collection
-            "username": user
-        })
-        frames = [{
-            "timestamp": f["timestamp"],
-            "objects":   f["objects"],
-            "image":     f["image"]
-        } for f in frames_cursor]
-        a["cheatingFrames"] = frames
+    # only the first few frames per attempt are inlined; the rest are paged
+    # through /exam/attempts/frames when the instructor opens them
+    try:
+        frames_limit = min(max(int(request.args.get("framesLimit", Config.FRAMES_PER_ATTEMPT)), 0),
+                           Config.FRAMES_PAGE_MAX)
+    except ValueError:
+        frames_limit = Config.FRAMES_PER_ATTEMPT
 
-        attempts.append(a)
+    # 2) attempts and their first frames come back from a single aggregation
+    attempts = fetch_exam_attempts(db_collection, exam_id, frames_limit)
 
     return jsonify({"success": True, "attempts": attempts}), 200
 
+@exam_bp.route('/attempts/frames', methods=['GET'])
+def exam_attempt_frames():
+    """One page of a candidate's flagged frames, oldest first."""
+    exam_id  = request.args.get("examId")
+    username = request.args.get("username")
+    if not exam_id or not username:
+        return jsonify({"success": False, "message": "Missing examId or username"}), 400
+
+    offset, limit = page_args(Config.FRAMES_PER_ATTEMPT * 3)
+    frames_filter = {"exam_id": exam_id, "username": username}
+    frames_cursor = db_frames.find(frames_filter, FRAME_LIST_PROJECTION) \
+                             .sort("timestamp", 1).skip(offset).limit(limit)
+    return jsonify({
+        "success": True,
+        "frames":  [serialize_frame(f) for f in frames_cursor],
+        "total":   db_frames.count_documents(frames_filter),
+        "offset":  offset,
+        "limit":   limit
+    }), 200
+
 @exam_bp.route('/submit', methods=['POST'])
 def exam_submit():
     data = request.get_json()
@@ -287,13 +297,12 @@ def exam_submit():
         "mobile_battery_issues": 0
     }
 
+    # Evidence counters are kept up to date at ingest (exam.evidence)
+    counters = load_counters(db, exam_id, username)
+
     # Get suspicious frames count
-    frames_cursor = db_frames.find({
-        "exam_id": exam_id,
-        "username": username
-    })
-    suspicious_frames = [f for f in frames_cursor if f.get("objects", [])]
-    cheating_factors["suspicious_frames"] = len(suspicious_frames)
+    suspicious_frames = counters["suspicious_frames"]
+    cheating_factors["suspicious_frames"] = suspicious_frames
 
     # Calculate cursor warning impact
     cheating_factors["cursor_warnings"] = cursor_warning_count
@@ -305,11 +314,11 @@ def exam_submit():
         cheating_score += 3
 
     # Calculate suspicious frames impact
-    if len(suspicious_frames) > 5:
+    if suspicious_frames > 5:
         cheating_score += 20
-    elif len(suspicious_frames) > 2:
+    elif suspicious_frames > 2:
         cheating_score += 10
-    elif len(suspicious_frames) > 0:
+    elif suspicious_frames > 0:
         cheating_score += 5
 
     # Calculate abnormal audio impact
@@ -321,14 +330,8 @@ def exam_submit():
     elif len(abnormal_audios) > 0:
         cheating_score += 3
 
-    # Get mobile monitoring data
-    mobile_logs = list(db["mobile_activity_logs"].find({
-        "examId": exam_id,
-        "username": username
-    }))
-
     # Calculate mobile focus violations
-    focus_violations = len([log for log in mobile_logs if log.get("event") in ["blur", "visibilitychange"]])
+    focus_violations = counters["focus_violations"]
     cheating_factors["mobile_focus_violations"] = focus_violations
     if focus_violations > 5:
         cheating_score += 15
@@ -338,7 +341,7 @@ def exam_submit():
         cheating_score += 3
 
     # Calculate mobile screen changes
-    screen_changes = len([log for log in mobile_logs if log.get("event") == "resize"])
+    screen_changes = counters["screen_changes"]
     cheating_factors["mobile_screen_changes"] = screen_changes
     if screen_changes > 5:
         cheating_score += 10
@@ -348,7 +351,7 @@ def exam_submit():
         cheating_score += 2
 
     # Calculate mobile network changes
-    network_changes = len([log for log in mobile_logs if log.get("event") == "networkchange"])
+    network_changes = counters["network_changes"]
     cheating_factors["mobile_network_changes"] = network_changes
     if network_changes > 3:
         cheating_score += 10
@@ -358,7 +361,7 @@ def exam_submit():
         cheating_score += 2
 
     # Calculate mobile battery issues
-    battery_issues = len([log for log in mobile_logs if log.get("event") == "battery" and log.get("batteryLevel", 1) < 0.2])
+    battery_issues = counters["battery_issues"]
     cheating_factors["mobile_battery_issues"] = battery_issues
     if battery_issues > 2:
         cheating_score += 5
@@ -613,18 +616,21 @@ def exam_connect():
     except Exception as e:
         return jsonify({"success": False, "message": "Invalid login token"}), 401
     username = decoded.get("username")
-    existing_attempt = db_collection.find_one({"examId": exam_id, "username": username})
-    if not existing_attempt:
-        new_attempt = {
-            "examId": exam_id,
-            "username": username,
+    # upsert so two concurrent connects can't race past the unique (examId, username) index
+    result = db_collection.update_one(
+        {"examId": exam_id, "username": username},
+        {"$setOnInsert": {
             "startedAt": datetime.datetime.now(datetime.timezone.utc),
             "submittedAt": None,
             "score": None,
             "answers": {},
             "abnormalAudios": []
-        }
-        db_collection.insert_one(new_attempt)
+        }},
+        upsert=True
+    )
+    if result.upserted_id is not None:
+        # a new attempt: its counters count all of its evidence, no recount at submit
+        start_counters(db["attempt_counters"], exam_id, username)
     new_payload = {
         "username": username,
         "email": decoded.get("email"),
@@ -697,6 +703,7 @@ def upload_audio():
             "status": "pending_analysis"
         }
         db["audio_logs"].insert_one(audio_doc)
+        bump_evidence_version(db["attempt_counters"], exam_id, username)
         
         return jsonify({
             "success": True,
@@ -752,18 +759,22 @@ def analyze_audio():
 @exam_bp.route('/cheating-analysis', methods=['GET'])
 def get_exam_cheating_analysis():
     """
-    Get cheating analysis for a specific exam attempt
+    Get cheating analysis for a specific exam attempt,
+    or for every attempt of the exam when no username is given
     """
     exam_id = request.args.get('examId')
     username = request.args.get('username')
     
-    if not exam_id or not username:
+    if not exam_id:
         return jsonify({
             'success': False,
-            'message': 'Missing examId or username'
+            'message': 'Missing examId'
         }), 400
         
-    analysis_result = get_cheating_analysis(exam_id, username, db)
+    if username:
+        analysis_result = get_cheating_analysis(exam_id, username, db)
+    else:
+        analysis_result = analyze_exam_attempts(exam_id, db)
     
     if not analysis_result['success']:
         return jsonify(analysis_result), 404
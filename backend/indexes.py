@@ -0,0 +1,185 @@
+#backend/indexes.py
+"""
+Declarative registry of every MongoDB index the backend relies on.
+
+Indexes are applied idempotently at startup (see app.create_app) or by hand:
+
+    python indexes.py ensure     # create missing indexes
+    python indexes.py check      # explain() the hot queries and report collection scans
+"""
+import sys
+import logging
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+    "exams": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("invited", ASCENDING)], name="invited"),
+        IndexModel([("instructor", ASCENDING)], name="instructor"),
+    ],
+    "attempted_exams": [
+        # one attempt per candidate per exam: connect/submit look it up with find_one
+        IndexModel([("examId", ASCENDING), ("username", ASCENDING)], name="exam_user_unique", unique=True),
+        # /attempted and /attempted/latest
+        IndexModel([("username", ASCENDING), ("_id", DESCENDING)], name="user_latest"),
+    ],
+    "frames": [
+        IndexModel([("exam_id", ASCENDING), ("username", ASCENDING), ("timestamp", ASCENDING)],
+                   name="exam_user_timestamp"),
+    ],
+    "mobile_activity_logs": [
+        IndexModel([("examId", ASCENDING), ("username", ASCENDING), ("timestamp", ASCENDING)],
+                   name="exam_user_timestamp"),
+    ],
+    "exam_sessions": [
+        # heartbeat/confirm/status address a session by (username, examId); analysis by examId
+        IndexModel([("examId", ASCENDING), ("username", ASCENDING)], name="exam_user_unique", unique=True),
+    ],
+    "audio_logs": [
+        IndexModel([("examId", ASCENDING), ("username", ASCENDING)], name="exam_user"),
+    ],
+    "keylog_streams": [
+        # batch sequencing relies on this being unique
+        IndexModel([("examId", ASCENDING), ("username", ASCENDING)], name="exam_user_unique", unique=True),
+    ],
+    "audio_recordings": [
+        IndexModel([("examId", ASCENDING), ("username", ASCENDING)], name="exam_user"),
+        # the live monitor polls for recordings that grew since its last look
+        IndexModel([("updatedAt", ASCENDING)], name="updated_at"),
+    ],
+    "analysis_jobs": [
+        # workers claim the oldest due job of a status
+        IndexModel([("status", ASCENDING), ("runAfter", ASCENDING)], name="status_run_after"),
+        IndexModel([("examId", ASCENDING), ("username", ASCENDING)], name="exam_user"),
+    ],
+    "attempt_counters": [
+        # $inc upserts at ingest and the single read in /exam/submit
+        IndexModel([("examId", ASCENDING), ("username", ASCENDING)], name="exam_user_unique", unique=True),
+    ],
+}
+
+# Representative shapes of the hot queries, checked with explain().
+HOT_QUERIES = [
+    ("users",                {"username": "x"}, None),
+    ("exams",                {"id": "x"}, None),
+    ("exams",                {"invited": "x"}, None),
+    ("exams",                {"instructor": "x"}, None),
+    ("attempted_exams",      {"examId": "x", "username": "x"}, None),
+    ("attempted_exams",      {"examId": "x"}, None),
+    ("attempted_exams",      {"username": "x"}, [("_id", DESCENDING)]),
+    ("frames",               {"exam_id": "x", "username": "x"}, [("timestamp", ASCENDING)]),
+    ("mobile_activity_logs", {"examId": "x", "username": "x"}, [("timestamp", ASCENDING)]),
+    ("exam_sessions",        {"username": "x", "examId": "x"}, None),
+    ("exam_sessions",        {"examId": "x"}, None),
+    ("audio_logs",           {"examId": "x", "username": "x"}, None),
+    ("attempt_counters",     {"examId": "x", "username": "x"}, None),
+    ("keylog_streams",       {"examId": "x", "username": "x"}, None),
+    ("audio_recordings",     {"examId": "x", "username": "x"}, None),
+    ("audio_recordings",     {"updatedAt": {"$gte": 0}, "monitor.done": {"$ne": True}}, None),
+    ("analysis_jobs",        {"status": "pending", "runAfter": {"$lte": 0}}, [("runAfter", ASCENDING)]),
+]
+
+
+def ensure_indexes(db, registry=None):
+    """
+    Create every registered index that is missing. Existing indexes with the
+    same spec are left alone, so this is safe to run on every startup.
+
+    Returns:
+        dict: {collection: [created index names]} plus an "errors" list
+    """
+    registry = INDEXES if registry is None else registry
+    report = {"errors": []}
+    for collection, models in registry.items():
+        for model in models:
+            # one index at a time so a duplicate-key failure on a unique
+            # index does not stop the others from being built
+            try:
+                report.setdefault(collection, []).extend(db[collection].create_indexes([model]))
+            except OperationFailure as e:
+                name = model.document.get("name")
+                logger.error(f"Could not create index {collection}.{name}: {e}")
+                report["errors"].append({"collection": collection, "index": name, "error": str(e)})
+    return report
+
+
+def _plan_stages(plan):
+    """Yield every stage name in a (possibly nested) explain plan."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def check_hot_queries(db, queries=None):
+    """
+    Explain each registered hot query and report those whose winning plan
+    scans the whole collection or sorts in memory.
+    """
+    queries = HOT_QUERIES if queries is None else queries
+    problems = []
+    for collection, filter_, sort in queries:
+        cursor = db[collection].find(filter_)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = set(_plan_stages(plan))
+        if "COLLSCAN" in stages or "SORT" in stages:
+            problems.append({"collection": collection, "filter": filter_, "sort": sort,
+                             "stages": sorted(stages)})
+    return problems
+
+
+def check_profiled_queries(db, slow_ms=100, limit=50):
+    """
+    Report slow operations recorded by the database profiler that ran as a
+    collection scan. Needs profiling enabled (db.setProfilingLevel) and is
+    skipped where the deployment does not allow reading system.profile.
+    """
+    try:
+        ops = db["system.profile"].find(
+            {"millis": {"$gte": slow_ms}, "planSummary": "COLLSCAN"},
+            {"ns": 1, "millis": 1, "command": 1, "planSummary": 1}
+        ).sort("millis", DESCENDING).limit(limit)
+        return [{"ns": op.get("ns"), "millis": op.get("millis"), "command": op.get("command")} for op in ops]
+    except PyMongoError as e:
+        logger.warning(f"Profiler data unavailable: {e}")
+        return []
+
+
+if __name__ == "__main__":
+    from database import init_db
+    logging.basicConfig(level=logging.INFO)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "ensure"
+    db = init_db()["db"]
+    if command == "ensure":
+        report = ensure_indexes(db)
+        for collection, names in report.items():
+            if collection != "errors":
+                print(f"{collection}: {', '.join(names)}")
+        for error in report["errors"]:
+            print(f"FAILED {error['collection']}.{error['index']}: {error['error']}")
+        sys.exit(1 if report["errors"] else 0)
+    elif command == "check":
+        problems = check_hot_queries(db)
+        for p in problems:
+            print(f"{p['collection']} {p['filter']} sort={p['sort']}: {', '.join(p['stages'])}")
+        for op in check_profiled_queries(db):
+            print(f"slow COLLSCAN {op['ns']} ({op['millis']} ms): {op['command']}")
+        if not problems:
+            print("All hot queries are served by an index")
+        sys.exit(1 if problems else 0)
+    else:
+        print(f"Unknown command {command!r}; use 'ensure' or 'check'")
+        sys.exit(2)
@@ -0,0 +1,19 @@
+from flask import Blueprint, jsonify
+from jobs.store import job_store, public_view
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+@jobs_bp.route('/metrics', methods=['GET'])
+def job_metrics():
+    """Number of jobs in each status."""
+    return jsonify(success=True, jobs=job_store.counts()), 200
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status of a background job, with its result once done."""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify(success=False, message="Job not found"), 404
+    return jsonify(success=True, job=public_view(job)), 200
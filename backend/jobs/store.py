@@ -0,0 +1,190 @@
+"""
+Persistent job table for background analysis work.
+
+The web process only enqueues: a job is a document in `analysis_jobs` that
+moves pending -> running -> done | failed. Workers (jobs.worker) claim jobs
+atomically with find_one_and_update and hold a lease while a job runs, so a
+job whose worker died is picked up again once its lease expires. A failed
+run goes back to pending with an exponential backoff until max_attempts runs
+have been made.
+"""
+import datetime
+import logging
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, ReturnDocument
+
+from config import Config
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+STATUSES = (PENDING, RUNNING, DONE, FAILED)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class JobStore:
+    def __init__(self, collection, max_attempts=3, retry_delay=30, lease_seconds=900):
+        """
+        Args:
+            collection: Collection holding one document per job
+            max_attempts (int): Runs allowed before a job is marked failed
+            retry_delay (float): Seconds before the first retry; doubles with each further one
+            lease_seconds (float): How long a claim lasts without being renewed
+        """
+        self.collection = collection
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = datetime.timedelta(seconds=lease_seconds)
+
+    def enqueue(self, task, args, max_attempts=None, **meta):
+        """
+        Queue a job. `meta` (e.g. examId, username) is stored alongside for lookups.
+
+        Returns:
+            str: The job id
+        """
+        now = _now()
+        doc = {
+            **meta,
+            "task": task,
+            "args": args,
+            "status": PENDING,
+            "attempts": 0,
+            "maxAttempts": max_attempts or self.max_attempts,
+            "runAfter": now,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        return str(self.collection.insert_one(doc).inserted_id)
+
+    def claim(self, worker_id):
+        """
+        Take the oldest runnable job: a pending one that is due, or a running one
+        whose worker let the lease lapse and that has runs left.
+        """
+        now = _now()
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"status": PENDING, "runAfter": {"$lte": now}},
+                {"status": RUNNING, "leaseUntil": {"$lt": now},
+                 "$expr": {"$lt": ["$attempts", "$maxAttempts"]}},
+            ]},
+            {"$set": {"status": RUNNING, "workerId": worker_id, "startedAt": now,
+                      "leaseUntil": now + self.lease, "updatedAt": now},
+             "$inc": {"attempts": 1}},
+            sort=[("runAfter", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def renew(self, jobs):
+        """Extend the leases of jobs this worker is still running."""
+        if not jobs:
+            return
+        now = _now()
+        self.collection.update_many(
+            {"_id": {"$in": [job["_id"] for job in jobs]}, "status": RUNNING,
+             "workerId": jobs[0]["workerId"]},
+            {"$set": {"leaseUntil": now + self.lease, "updatedAt": now}},
+        )
+
+    def reap(self):
+        """
+        Fail running jobs whose lease lapsed on their last allowed run.
+
+        Returns:
+            list: The jobs failed
+        """
+        now = _now()
+        reaped = []
+        for job in self.collection.find({"status": RUNNING, "leaseUntil": {"$lt": now},
+                                         "$expr": {"$gte": ["$attempts", "$maxAttempts"]}}):
+            result = self.collection.update_one(
+                {"_id": job["_id"], "status": RUNNING, "leaseUntil": job["leaseUntil"]},
+                {"$set": {"status": FAILED, "error": "worker lost while running the job",
+                          "finishedAt": now, "updatedAt": now},
+                 "$unset": {"leaseUntil": ""}},
+            )
+            if result.modified_count:
+                reaped.append(job)
+        return reaped
+
+    def _owned(self, job):
+        # a worker whose lease lapsed must not overwrite the run that replaced it
+        return {"_id": job["_id"], "status": RUNNING, "workerId": job["workerId"],
+                "attempts": job["attempts"]}
+
+    def complete(self, job, result):
+        now = _now()
+        self.collection.update_one(
+            self._owned(job),
+            {"$set": {"status": DONE, "result": result, "finishedAt": now, "updatedAt": now},
+             "$unset": {"leaseUntil": "", "error": ""}},
+        )
+
+    def fail(self, job, error, retry=True):
+        """
+        Record a failed run; the job is retried later unless it is out of attempts.
+
+        Returns:
+            bool: True if the job failed for good
+        """
+        now = _now()
+        if retry and job["attempts"] < job["maxAttempts"]:
+            delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+            update = {"$set": {"status": PENDING, "error": error, "updatedAt": now,
+                               "runAfter": now + datetime.timedelta(seconds=delay)},
+                      "$unset": {"leaseUntil": ""}}
+            logger.warning(f"Job {job['_id']} ({job['task']}) failed, retrying in {delay:g}s: {error}")
+        else:
+            update = {"$set": {"status": FAILED, "error": error, "finishedAt": now, "updatedAt": now},
+                      "$unset": {"leaseUntil": ""}}
+            logger.error(f"Job {job['_id']} ({job['task']}) failed for good: {error}")
+        result = self.collection.update_one(self._owned(job), update)
+        return update["$set"]["status"] == FAILED and result.modified_count > 0
+
+    def get(self, job_id):
+        try:
+            return self.collection.find_one({"_id": ObjectId(job_id)})
+        except (InvalidId, TypeError):
+            return None
+
+    def active_args(self, name):
+        """Values of argument `name` over the jobs still pending or running."""
+        return self.collection.distinct(f"args.{name}", {"status": {"$in": [PENDING, RUNNING]}})
+
+    def counts(self):
+        """Number of jobs in each status."""
+        counts = dict.fromkeys(STATUSES, 0)
+        for row in self.collection.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["n"]
+        return counts
+
+
+def public_view(job):
+    """The parts of a job document a client polling for it may see."""
+    return {
+        "id": str(job["_id"]),
+        "task": job["task"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "maxAttempts": job["maxAttempts"],
+        "createdAt": job["createdAt"],
+        "startedAt": job.get("startedAt"),
+        "finishedAt": job.get("finishedAt"),
+        "result": job.get("result"),
+        "error": job.get("error"),
+    }
+
+
+job_store = JobStore(
+    get_db()["analysis_jobs"],
+    max_attempts=Config.JOB_MAX_ATTEMPTS,
+    retry_delay=Config.JOB_RETRY_DELAY_SECONDS,
+    lease_seconds=Config.JOB_LEASE_SECONDS,
+)
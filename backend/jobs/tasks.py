@@ -0,0 +1,113 @@
+"""
+Functions the job worker runs in its process pool, looked up by task name.
+
+A task takes the job's `args` as keyword arguments and returns something JSON
+serializable, which becomes the job's result; raising marks the run failed.
+A task may register a cleanup, run by the worker with the same arguments once
+a job has failed for good.
+Tasks run in pool processes, so heavy imports (librosa, sklearn)
+happen there, never in the web workers.
+"""
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+CLEANUPS = {}
+
+
+def task(name, cleanup=None):
+    def register(fn):
+        TASKS[name] = fn
+        if cleanup is not None:
+            CLEANUPS[name] = cleanup
+        return fn
+    return register
+
+
+def run_task(name, args):
+    """Entry point inside a pool process."""
+    return TASKS[name](**args)
+
+
+def run_cleanup(job):
+    """Undo what a job that failed for good leaves behind (in the worker process)."""
+    cleanup = CLEANUPS.get(job["task"])
+    if cleanup is None:
+        return
+    try:
+        cleanup(**job.get("args", {}))
+    except Exception as e:
+        logger.error(f"Cleanup of job {job['_id']} ({job['task']}) failed: {e}")
+
+
+def remove_upload(audio_path):
+    try:
+        os.remove(audio_path)
+    except FileNotFoundError:
+        pass
+
+
+def sweep_audio_scratch(active_paths, max_age_seconds):
+    """
+    Remove files in AUDIO_SCRATCH_FOLDER older than max_age_seconds that no
+    pending or running job will read, e.g. those of jobs a worker without
+    their task failed.
+
+    Returns:
+        int: Files removed
+    """
+    from config import Config
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    active = {os.path.abspath(path) for path in active_paths}
+    try:
+        entries = list(os.scandir(Config.AUDIO_SCRATCH_FOLDER))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff and os.path.abspath(entry.path) not in active:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+_diarizer = None
+
+
+def get_diarizer():
+    """One ExamAudioDiarizer per pool process, built on its first job."""
+    global _diarizer
+    if _diarizer is None:
+        from audio_analysis.cache import default_feature_cache
+        from audio_analysis.diarization import ExamAudioDiarizer
+        _diarizer = ExamAudioDiarizer(feature_cache=default_feature_cache())
+    return _diarizer
+
+
+@task("speaker_analysis")
+def speaker_analysis(audio_path, exam_id, username, filename):
+    """Rolling-window speaker analysis of a finished recording, stored on its entry in the attempt."""
+    from audio_analysis.speaker_diarization import run_speaker_analysis_and_store
+    windows = run_speaker_analysis_and_store(audio_path, exam_id, username, filename, diarizer=get_diarizer())
+    return {"file": filename, "windows": len(windows),
+            "maxSpeakers": max((window["speakers"] for window in windows), default=0)}
+
+
+@task("diarize_audio", cleanup=remove_upload)
+def diarize_audio(audio_path):
+    """
+    Diarize a file saved by /api/audio-analysis/analyze-exam-audio. The file is
+    removed once analyzed or once the job has failed for good, and kept while
+    the job may still be retried.
+    """
+    results = get_diarizer().process_exam_audio(audio_path)
+    if not results.get("success"):
+        raise RuntimeError(results.get("error", "diarization failed"))
+    os.remove(audio_path)
+    return results
@@ -0,0 +1,153 @@
+"""
+Runs queued jobs in a pool of worker processes.
+
+Start one per machine, from the backend directory:
+    python -m jobs.worker --workers 4
+
+The pool defaults to one process per core, so librosa/sklearn work runs
+outside the web workers instead of contending for their GIL. For local
+development the web process can host the worker itself (JOB_WORKER_EMBEDDED).
+"""
+import os
+import time
+import socket
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from config import Config
+from jobs.store import job_store
+from jobs.tasks import TASKS, run_task, run_cleanup, sweep_audio_scratch
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorker:
+    """
+    Claims jobs from a JobStore and runs them in a process pool.
+
+    At most `max_workers` jobs are claimed at a time, so queued jobs stay in
+    the table (where other machines can claim them) rather than in memory.
+    Leases of running jobs are renewed while they run.
+    """
+    def __init__(self, store, max_workers=None, poll_interval=1.0):
+        """
+        Args:
+            store (JobStore): Where jobs are claimed from and results recorded
+            max_workers (int): Pool processes; defaults to the number of cores
+            poll_interval (float): Seconds between looks at the table when idle
+        """
+        self.store = store
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.poll_interval = poll_interval
+        self.worker_id = None
+        self._running = {}
+        self._stop = threading.Event()
+
+    def _make_pool(self):
+        # spawned children start clean: no inherited Mongo client, locks or BLAS threads
+        return ProcessPoolExecutor(max_workers=self.max_workers,
+                                   mp_context=multiprocessing.get_context("spawn"))
+
+    def stop(self):
+        self._stop.set()
+
+    def _collect(self):
+        """Record finished jobs. Returns False if the pool died and must be replaced."""
+        healthy = True
+        for future in [f for f in self._running if f.done()]:
+            job = self._running.pop(future)
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                healthy = False
+                if self.store.fail(job, "worker process died while running the job"):
+                    run_cleanup(job)
+            except Exception as e:
+                if self.store.fail(job, f"{type(e).__name__}: {e}"):
+                    run_cleanup(job)
+            else:
+                self.store.complete(job, result)
+        return healthy
+
+    def _fill(self, pool):
+        while len(self._running) < self.max_workers and not self._stop.is_set():
+            job = self.store.claim(self.worker_id)
+            if job is None:
+                return
+            if job["task"] not in TASKS:
+                self.store.fail(job, f"unknown task {job['task']!r}", retry=False)
+                run_cleanup(job)  # nothing unless registered; sweep_audio_scratch gets the rest
+                continue
+            logger.info(f"Running job {job['_id']} ({job['task']}, attempt {job['attempts']})")
+            self._running[pool.submit(run_task, job["task"], job.get("args", {}))] = job
+
+    def run(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        renew_every = self.store.lease.total_seconds() / 3
+        last_renewal = time.monotonic()
+        pool = self._make_pool()
+        logger.info(f"Job worker {self.worker_id} started with {self.max_workers} processes")
+        try:
+            while not self._stop.is_set():
+                if not self._collect():
+                    logger.error("Worker pool broke; starting a new one")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._make_pool()
+                self._fill(pool)
+
+                if time.monotonic() - last_renewal >= renew_every:
+                    self.store.renew(list(self._running.values()))
+                    reaped = self.store.reap()
+                    if reaped:
+                        logger.warning(f"Marked {len(reaped)} abandoned jobs as failed")
+                    for job in reaped:
+                        run_cleanup(job)
+                    swept = sweep_audio_scratch(self.store.active_args("audio_path"),
+                                                Config.AUDIO_SCRATCH_MAX_AGE_SECONDS)
+                    if swept:
+                        logger.warning(f"Removed {swept} audio uploads no job will analyze")
+                    last_renewal = time.monotonic()
+
+                if self._running:
+                    wait(list(self._running), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            # let jobs in flight finish so they are recorded rather than left to their leases
+            pool.shutdown(wait=True)
+            self._collect()
+            logger.info(f"Job worker {self.worker_id} stopped")
+
+
+_embedded = None
+
+
+def start_embedded_worker():
+    """Run a JobWorker on a daemon thread of the current (web) process."""
+    global _embedded
+    if _embedded is None:
+        _embedded = JobWorker(job_store, max_workers=Config.JOB_WORKERS or None,
+                              poll_interval=Config.JOB_POLL_INTERVAL_SECONDS)
+        threading.Thread(target=_embedded.run, name="job-worker", daemon=True).start()
+    return _embedded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=Config.JOB_WORKERS or None,
+                        help="pool processes (default: JOB_WORKERS, else one per core)")
+    parser.add_argument("--poll-interval", type=float, default=Config.JOB_POLL_INTERVAL_SECONDS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    worker = JobWorker(job_store, max_workers=args.workers, poll_interval=args.poll_interval)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
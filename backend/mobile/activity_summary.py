@@ -0,0 +1,188 @@
+"""
+Running per-session summary of mobile activity, stored on `exam_sessions`
+under `activity` and advanced as heartbeats are flushed.
+
+The state machine mirrors the original full-scan analysis:
+  • blur opens a focus violation, the next focus closes it; closed violations
+    longer than VIOLATION_SECONDS are counted and kept as suspicious periods
+  • every resize event is a screen change
+  • a beat whose networkType differs from the previous beat's is a network change
+  • a batteryLevel below LOW_BATTERY is a battery issue
+
+Each beat becomes one `$set` stage of an update pipeline, so concurrent
+flushes from different workers never lose each other's updates.
+"""
+import datetime
+
+VIOLATION_SECONDS = 5
+LOW_BATTERY = 0.2
+MAX_STAGES_PER_UPDATE = 200  # stay well under the server's pipeline stage limit
+
+SUMMARY_FIELDS = ("total_events", "focus_violations", "screen_changes",
+                  "network_changes", "battery_issues")
+
+
+def parse_timestamp(value):
+    """ISO-8601 client timestamp to epoch seconds, or None if unparseable."""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def is_low_battery(log):
+    level = log.get("batteryLevel")
+    try:
+        return bool(level) and float(level) < LOW_BATTERY
+    except (TypeError, ValueError):
+        return False
+
+
+def empty_summary():
+    return {
+        "total_events": 0,
+        "focus_violations": 0,
+        "screen_changes": 0,
+        "network_changes": 0,
+        "battery_issues": 0,
+        "suspicious_periods": [],
+        "open_violation": None,
+        "last_network_type": None,
+    }
+
+
+def sort_logs(logs):
+    """Order a batch of beats the way the full scan did: by client timestamp."""
+    return sorted(logs, key=lambda log: (parse_timestamp(log.get("timestamp")) is None,
+                                         parse_timestamp(log.get("timestamp")) or 0))
+
+
+def apply_event(summary, log):
+    """Advance `summary` by one beat in Python (used to rebuild from stored logs)."""
+    event = log.get("event")
+    ts = log.get("timestamp")
+
+    if event == "blur" and not summary["open_violation"]:
+        summary["open_violation"] = {"start": ts, "start_epoch": parse_timestamp(ts)}
+    elif event == "focus" and summary["open_violation"]:
+        opened = summary["open_violation"]
+        end_epoch = parse_timestamp(ts)
+        if opened.get("start_epoch") is not None and end_epoch is not None:
+            duration = end_epoch - opened["start_epoch"]
+            if duration > VIOLATION_SECONDS:
+                summary["focus_violations"] += 1
+                summary["suspicious_periods"].append({"start": opened["start"], "end": ts,
+                                                      "duration": duration})
+        summary["open_violation"] = None
+
+    if event == "resize":
+        summary["screen_changes"] += 1
+
+    network_type = log.get("networkType")
+    if network_type and summary["total_events"] > 0 and summary["last_network_type"] != network_type:
+        summary["network_changes"] += 1
+    summary["last_network_type"] = network_type
+
+    if is_low_battery(log):
+        summary["battery_issues"] += 1
+
+    summary["total_events"] += 1
+    return summary
+
+
+def _field(name, default):
+    return {"$ifNull": [f"$activity.{name}", default]}
+
+
+def _incremented(name):
+    return {"$add": [_field(name, 0), 1]}
+
+
+def event_stage(log):
+    """The same transition as apply_event, as one update-pipeline stage."""
+    event = log.get("event")
+    ts = log.get("timestamp")
+    ts_epoch = parse_timestamp(ts)
+    network_type = log.get("networkType")
+
+    changes = {
+        "activity.total_events": _incremented("total_events"),
+        "activity.last_network_type": {"$literal": network_type},
+    }
+
+    if event == "blur":
+        changes["activity.open_violation"] = {
+            "$ifNull": ["$activity.open_violation", {"$literal": {"start": ts, "start_epoch": ts_epoch}}]
+        }
+    elif event == "focus":
+        opened = {"$ne": [_field("open_violation", None), None]}
+        duration = {"$subtract": [{"$literal": ts_epoch}, "$activity.open_violation.start_epoch"]}
+        long_enough = {"$and": [opened, {"$gt": [{"$ifNull": [duration, 0]}, VIOLATION_SECONDS]}]}
+        changes["activity.focus_violations"] = {
+            "$cond": [long_enough, _incremented("focus_violations"), _field("focus_violations", 0)]
+        }
+        changes["activity.suspicious_periods"] = {
+            "$cond": [
+                long_enough,
+                {"$concatArrays": [_field("suspicious_periods", []), [{
+                    "start": "$activity.open_violation.start",
+                    "end": {"$literal": ts},
+                    "duration": duration,
+                }]]},
+                _field("suspicious_periods", []),
+            ]
+        }
+        changes["activity.open_violation"] = None
+
+    if event == "resize":
+        changes["activity.screen_changes"] = _incremented("screen_changes")
+
+    if network_type:
+        changed = {"$and": [
+            {"$gt": [_field("total_events", 0), 0]},
+            {"$ne": [_field("last_network_type", None), {"$literal": network_type}]},
+        ]}
+        changes["activity.network_changes"] = {
+            "$cond": [changed, _incremented("network_changes"), _field("network_changes", 0)]
+        }
+
+    if is_low_battery(log):
+        changes["activity.battery_issues"] = _incremented("battery_issues")
+
+    return {"$set": changes}
+
+
+def session_update_pipelines(logs, last_activity):
+    """
+    Update pipelines that fold a session's beats into its summary and bump
+    `last_activity`. Long batches are split so no pipeline gets too long;
+    apply them in order.
+    """
+    stages = [event_stage(log) for log in sort_logs(logs)]
+    head = {"$set": {
+        "last_activity": {"$max": ["$last_activity", {"$literal": last_activity}]},
+        "is_active": True,
+    }}
+    if not stages:
+        return [[head]]
+    chunks = [stages[i:i + MAX_STAGES_PER_UPDATE] for i in range(0, len(stages), MAX_STAGES_PER_UPDATE)]
+    chunks[0].insert(0, head)
+    return chunks
+
+
+def rebuild_summary(logs):
+    """Replay stored beats from scratch, e.g. for sessions created before summaries existed."""
+    summary = empty_summary()
+    for log in sort_logs(logs):
+        apply_event(summary, log)
+    return summary
+
+
+def summary_to_analysis(summary):
+    """The response shape `/mobile/status` and `/mobile/analysis` have always returned."""
+    summary = summary or empty_summary()
+    analysis = {field: summary.get(field, 0) for field in SUMMARY_FIELDS}
+    analysis["suspicious_periods"] = summary.get("suspicious_periods", [])
+    return analysis
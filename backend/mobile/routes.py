@@ -5,70 +5,53 @@ import jwt
 import os
 import datetime
 from collections import defaultdict
+from bson.objectid import ObjectId
+from mobile.utils import HeartbeatWriteBuffer
+from mobile.activity_summary import rebuild_summary, summary_to_analysis
 
 mobile_bp = Blueprint('mobile', __name__)
 
-def analyze_mobile_activity(username, exam_id):
-    """Analyze mobile activity logs for suspicious behavior"""
-    logs_collection = db["mobile_activity_logs"]
-    logs = list(logs_collection.find({
-        "username": username,
-        "examId": exam_id
-    }).sort("timestamp", 1))
-    
-    analysis = {
-        "total_events": len(logs),
-        "focus_violations": 0,
-        "screen_changes": 0,
-        "network_changes": 0,
-        "battery_issues": 0,
-        "suspicious_periods": []
-    }
-    
-    if not logs:
-        return analysis
-        
-    # Track focus violations
-    focus_violations = []
-    current_violation = None
-    
-    for i, log in enumerate(logs):
-        # Check for focus violations
-        if log.get("event") == "blur":
-            if not current_violation:
-                current_violation = {
-                    "start": log["timestamp"],
-                    "duration": 0
-                }
-        elif log.get("event") == "focus" and current_violation:
-            current_violation["end"] = log["timestamp"]
-            focus_violations.append(current_violation)
-            current_violation = None
-            
-        # Check for screen size changes
-        if log.get("event") == "resize":
-            analysis["screen_changes"] += 1
-            
-        # Check for network changes
-        if log.get("networkType"):
-            if i > 0 and logs[i-1].get("networkType") != log.get("networkType"):
-                analysis["network_changes"] += 1
-                
-        # Check for battery issues
-        if log.get("batteryLevel") and float(log.get("batteryLevel", 1)) < 0.2:
-            analysis["battery_issues"] += 1
-    
-    # Calculate violation durations
-    for violation in focus_violations:
-        start_time = datetime.datetime.fromisoformat(violation["start"].replace('Z', '+00:00'))
-        end_time = datetime.datetime.fromisoformat(violation["end"].replace('Z', '+00:00'))
-        duration = (end_time - start_time).total_seconds()
-        violation["duration"] = duration
-        if duration > 5:  # Consider violations longer than 5 seconds as suspicious
-            analysis["focus_violations"] += 1
-            analysis["suspicious_periods"].append(violation)
-    
-    return analysis
+heartbeat_buffer = HeartbeatWriteBuffer(
+    db["mobile_activity_logs"],
+    db["exam_sessions"],
+    db["attempt_counters"],
+    max_batch=Config.MOBILE_HEARTBEAT_BATCH_SIZE,
+    flush_interval=Config.MOBILE_HEARTBEAT_FLUSH_SECONDS,
+    max_buffer=Config.MOBILE_HEARTBEAT_MAX_BUFFER,
+)
+
+def analyze_mobile_activity(username, exam_id, session=None):
+    """
+    Analyze mobile activity for suspicious behavior.
+
+    Reads the running summary the heartbeat flush keeps on the session, so
+    this is O(1) per student. Each session's summary is rebuilt once from its
+    stored logs (marked `activityRebuilt`): one that predates the summary has
+    none, and one that was live at deploy only has the beats flushed since.
+    """
+    if session is None:
+        session = db["exam_sessions"].find_one({"username": username, "examId": exam_id},
+                                               {"activity": 1, "activityRebuilt": 1, "appliedFlushes": 1})
+    session = session or {}
+    summary = session.get("activity")
+    if summary is None or not session.get("activityRebuilt"):
+        summary = rebuild_session_activity(username, exam_id, session)
+    return summary_to_analysis(summary)
+
+def rebuild_session_activity(username, exam_id, session):
+    logs = db["mobile_activity_logs"].find(
+        {"username": username, "examId": exam_id},
+        {"_id": 0, "timestamp": 1, "event": 1, "networkType": 1, "batteryLevel": 1}
+    )
+    summary = rebuild_summary(logs)
+    # only if no flush landed since `session` was read (each records its id in appliedFlushes);
+    # otherwise the rebuild is tried again on the next read
+    db["exam_sessions"].update_one(
+        {"username": username, "examId": exam_id, "activityRebuilt": {"$ne": True},
+         "appliedFlushes": session.get("appliedFlushes")},
+        {"$set": {"activity": summary, "activityRebuilt": True}}
+    )
+    return summary
 
 @mobile_bp.route('/heartbeat', methods=['POST'])
 def mobile_heartbeat():
@@ -85,6 +68,7 @@ def mobile_heartbeat():
         return jsonify({"success": False, "message": "Invalid token"}), 401
         
     mobile_log = {
+        "_id": ObjectId(),
         "username": decoded.get("username"),
         "examId": decoded.get("examId", "unknown"),
         "timestamp": data.get("timestamp"),
@@ -95,27 +79,16 @@ def mobile_heartbeat():
         "batteryLevel": data.get("batteryLevel"),
         "networkType": data.get("networkType")
     }
-    
-    logs_collection = db["mobile_activity_logs"]
-    result = logs_collection.insert_one(mobile_log)
-    mobile_log["_id"] = str(result.inserted_id)
-    
-    # Update exam session with latest activity
-    sessions_collection = db["exam_sessions"]
-    sessions_collection.update_one(
-        {"username": decoded.get("username"), "examId": decoded.get("examId")},
-        {
-            "$set": {
-                "last_activity": datetime.datetime.now(datetime.timezone.utc),
-                "is_active": True
-            }
-        }
-    )
-    
+
+    # Buffered and bulk-written with the session's last_activity; callers that
+    # need the beat on disk before the response can ask for a durable write
+    durable = Config.MOBILE_HEARTBEAT_SYNC_WRITES or bool(data.get("durable"))
+    heartbeat_buffer.add(mobile_log, durable=durable)
+
     return jsonify({
         "success": True,
         "message": "Mobile activity logged",
-        "log": mobile_log
+        "log": {**mobile_log, "_id": str(mobile_log["_id"])}
     })
 
 @mobile_bp.route('/confirm', methods=['POST'])
@@ -178,7 +151,7 @@ def mobile_status():
         })
     
     # Get activity analysis
-    analysis = analyze_mobile_activity(username, exam_id)
+    analysis = analyze_mobile_activity(username, exam_id, session)
     
     return jsonify({
         "success": True,
@@ -203,7 +176,7 @@ def get_exam_analysis(exam_id):
         analysis_results = {}
         for session in sessions:
             username = session.get("username")
-            analysis = analyze_mobile_activity(username, exam_id)
+            analysis = analyze_mobile_activity(username, exam_id, session)
             analysis_results[username] = {
                 "analysis": analysis,
                 "device_info": session.get("device_info"),
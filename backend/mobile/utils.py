@@ -0,0 +1,196 @@
+import os
+import atexit
+import logging
+import datetime
+import threading
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.write_concern import WriteConcern
+from bson.objectid import ObjectId
+from mobile.activity_summary import session_update_pipelines
+from exam.evidence import counter_stage, mobile_log_increments
+
+logger = logging.getLogger(__name__)
+
+APPLIED_FLUSHES_KEPT = 50  # flush ids remembered per document, far more than retries can be in flight
+
+
+def apply_once(stages, flush_id):
+    """
+    Wrap the `$set` stages of an update pipeline so they change a document
+    only once per `flush_id`. The ids of the last APPLIED_FLUSHES_KEPT flushes
+    are kept on the document (`appliedFlushes`); a retried flush finds its id
+    there and leaves every field as it was.
+    """
+    applied = {"$ifNull": ["$appliedFlushes", []]}
+    guarded = [{"$set": {"_replayed": {"$in": [flush_id, applied]}}}]
+    for stage in stages:
+        guarded.append({"$set": {field: {"$cond": ["$_replayed", f"${field}", value]}
+                                 for field, value in stage["$set"].items()}})
+    guarded.append({"$set": {"appliedFlushes": {"$cond": [
+        "$_replayed", applied, {"$slice": [{"$concatArrays": [applied, [flush_id]]}, -APPLIED_FLUSHES_KEPT]}
+    ]}}})
+    guarded.append({"$unset": "_replayed"})
+    return guarded
+
+
+class HeartbeatWriteBuffer:
+    """
+    Coalesces mobile heartbeats in memory and writes them in bulk.
+
+    Logs go out with one insert_many per flush, and each exam session gets a
+    single update per flush no matter how many beats it sent. That update moves
+    `last_activity` and folds the beats into the session's activity summary;
+    only sessions confirmed through /mobile/confirm have a document to update,
+    beats of unconfirmed devices are only logged.
+    A flush happens when `max_batch` beats are waiting or `flush_interval`
+    seconds have passed, and once more at interpreter shutdown.
+
+    A batch that fails to write is retried as it was, under the same flush
+    id, and the session and counter updates skip documents that already
+    applied that id, so a partly written batch is never counted twice. Logs
+    are skipped by their `_id`.
+    """
+    def __init__(self, logs_collection, sessions_collection, counters_collection=None,
+                 max_batch=500, flush_interval=1.0, max_buffer=20000):
+        """
+        Args:
+            logs_collection: Collection receiving the raw heartbeat logs
+            sessions_collection: Collection holding one document per exam session
+            counters_collection: Optional per-attempt evidence counters (exam.evidence)
+            max_batch (int): Pending beats that trigger an immediate flush
+            flush_interval (float): Longest time a beat waits in memory, in seconds
+            max_buffer (int): Pending beats beyond which add() flushes inline
+        """
+        self.logs = logs_collection
+        self.sessions = sessions_collection
+        self.counters = counters_collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self._pending = []
+        self._failed = []        # (flush id, batch) still to be written, oldest first
+        self._failed_beats = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        atexit.register(self.flush)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pending = []
+            self._failed, self._failed_beats = [], 0
+            self._wake = threading.Event()
+            threading.Thread(target=self._run, name="heartbeat-flush", daemon=True).start()
+            self._pid = os.getpid()
+
+    def add(self, log, durable=False):
+        """
+        Queue a heartbeat log (which must already carry its `_id`).
+        With durable=True the beat is written synchronously with a journaled
+        write concern before this returns.
+        """
+        received_at = datetime.datetime.now(datetime.timezone.utc)
+        if durable:
+            self._write([(log, received_at)], write_concern=WriteConcern(w="majority", j=True))
+            return
+
+        self._ensure_started()
+        with self._lock:
+            self._pending.append((log, received_at))
+            pending = len(self._pending) + self._failed_beats
+        if pending >= self.max_buffer:
+            # the flusher is falling behind; make the caller pay for it
+            self.flush()
+        elif pending >= self.max_batch:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending) + self._failed_beats
+
+    def flush(self):
+        """Write everything buffered so far, failed batches first. Safe to call from any thread."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            batches, self._failed = self._failed + ([(str(ObjectId()), batch)] if batch else []), []
+            written = 0
+            for flush_id, batch in batches:
+                try:
+                    self._write(batch, flush_id)
+                    written += len(batch)
+                except PyMongoError as e:
+                    logger.error(f"Heartbeat flush of {len(batch)} beats failed: {e}")
+                    self._failed.append((flush_id, batch))
+
+            # keep failed batches for the next flush unless that would overflow the buffer
+            failed_beats = sum(len(batch) for _, batch in self._failed)
+            while self._failed and failed_beats > self.max_buffer:
+                _, dropped = self._failed.pop(0)
+                failed_beats -= len(dropped)
+                logger.error(f"Dropped {len(dropped)} heartbeats that could not be written")
+            self._failed_beats = failed_beats
+            return written
+
+    def _write(self, batch, flush_id=None, write_concern=None):
+        flush_id = flush_id or str(ObjectId())
+        logs, sessions, counters = self.logs, self.sessions, self.counters
+        if write_concern is not None:
+            logs = logs.with_options(write_concern=write_concern)
+            sessions = sessions.with_options(write_concern=write_concern)
+            if counters is not None:
+                counters = counters.with_options(write_concern=write_concern)
+
+        try:
+            logs.insert_many([log for log, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            # a retried batch may contain beats that already landed; those are duplicates by _id
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+        session_logs, latest = {}, {}
+        for log, received_at in batch:
+            key = (log.get("username"), log.get("examId"))
+            session_logs.setdefault(key, []).append(log)
+            latest[key] = max(latest.get(key, received_at), received_at)
+
+        # one update per session per flush (more only for very long batches),
+        # folding the beats into the session's running activity summary
+        operations = []
+        for (username, exam_id), logs_for_session in session_logs.items():
+            pipelines = session_update_pipelines(logs_for_session, latest[(username, exam_id)])
+            for part, pipeline in enumerate(pipelines):
+                operations.append(UpdateOne({"username": username, "examId": exam_id},
+                                            apply_once(pipeline, f"{flush_id}/{part}")))
+        # ordered, so split pipelines of one session apply in sequence
+        sessions.bulk_write(operations, ordered=True)
+
+        if counters is not None:
+            counter_ops = []
+            for (username, exam_id), logs_for_session in session_logs.items():
+                increments = {}
+                for log in logs_for_session:
+                    for field, n in mobile_log_increments(log).items():
+                        increments[field] = increments.get(field, 0) + n
+                # every beat is evidence, so each session's version moves even without increments
+                counter_ops.append(UpdateOne({"examId": exam_id, "username": username},
+                                             apply_once([counter_stage(increments)], flush_id), upsert=True))
+            if counter_ops:
+                counters.bulk_write(counter_ops, ordered=False)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # the batch is dropped, but one bad batch must not stop every later flush
+                logger.exception("Heartbeat flush failed")
@@ -0,0 +1,152 @@
+import os
+import re
+import hashlib
+import logging
+import tempfile
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def content_key(data):
+    """Content address of a blob: the hex SHA-256 of its bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_valid_key(key):
+    return bool(KEY_PATTERN.match(key or ""))
+
+
+def guess_content_type(head):
+    """Sniff the image type from the first bytes of a blob."""
+    if head.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def frame_url(key):
+    """Path of the streaming endpoint that serves a stored frame."""
+    return f"/upload/frames/{key}"
+
+
+class LocalFrameStore:
+    """
+    Content-addressed blob store on the local filesystem.
+    Blobs live at <root>/<key[:2]>/<key> and are never rewritten.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, data, content_type="image/jpeg"):
+        """Store `data` once and return its key."""
+        key = content_key(data)
+        path = self.path(key)
+        if os.path.exists(path):
+            return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temp file first so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key
+
+    def open(self, key):
+        """Returns (file object, size in bytes)."""
+        path = self.path(key)
+        return open(path, "rb"), os.path.getsize(path)
+
+
+class S3FrameStore:
+    """Content-addressed blob store in the configured S3 bucket."""
+    def __init__(self, prefix="frames"):
+        from upload import s3utils
+        self.s3utils = s3utils
+        self.prefix = prefix
+
+    def object_key(self, key):
+        return f"{self.prefix}/{key}"
+
+    def exists(self, key):
+        return self.s3utils.object_exists(self.object_key(key))
+
+    def put(self, data, content_type="image/jpeg"):
+        key = content_key(data)
+        if not self.exists(key):
+            self.s3utils.put_object_bytes(self.object_key(key), data, content_type)
+        return key
+
+    def open(self, key):
+        body, size, _ = self.s3utils.get_object_stream(self.object_key(key))
+        return body, size
+
+
+def create_frame_store(backend=None):
+    backend = (backend or Config.FRAME_STORE_BACKEND).lower()
+    if backend == "local":
+        return LocalFrameStore(Config.FRAME_DIR)
+    if backend == "s3":
+        return S3FrameStore()
+    raise ValueError(f"Unsupported frame store backend: {backend}")
+
+
+frame_store = create_frame_store()
+
+
+def migrate_inline_frames(frames_collection, store=None, batch_size=100):
+    """
+    Move base64 images stored inline on `frames` documents into the frame store,
+    replacing the `image` field with `image_key` and dimensions.
+    Returns the number of documents migrated.
+    """
+    import base64
+    from io import BytesIO
+    from PIL import Image
+
+    store = store or frame_store
+    migrated = 0
+    cursor = frames_collection.find({"image": {"$exists": True}, "image_key": {"$exists": False}},
+                                    {"image": 1}, batch_size=batch_size)
+    for doc in cursor:
+        try:
+            raw = base64.b64decode(doc["image"])
+            img = Image.open(BytesIO(raw))
+            content_type = Image.MIME.get(img.format, "image/jpeg")
+            key = store.put(raw, content_type)
+            frames_collection.update_one({"_id": doc["_id"]}, {
+                "$set": {"image_key": key, "content_type": content_type,
+                         "width": img.size[0], "height": img.size[1], "size": len(raw)},
+                "$unset": {"image": ""}
+            })
+            migrated += 1
+        except Exception as e:
+            logger.error(f"Failed to migrate frame {doc['_id']}: {str(e)}")
+    return migrated
+
+
+if __name__ == "__main__":
+    # python -m upload.frame_store  -> move legacy inline images out of Mongo
+    from database import init_db
+    logging.basicConfig(level=logging.INFO)
+    count = migrate_inline_frames(init_db()["frames"])
+    print(f"Migrated {count} frames to the {Config.FRAME_STORE_BACKEND} frame store")
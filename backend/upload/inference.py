@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+from config import Config
+from upload.utils import detect_objects_batch
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference queue cannot take any more frames."""
+
+
+class BatchInferenceWorker:
+    """
+    Collects frames submitted from request threads and runs them through the
+    shared YOLO model in micro-batches.
+
+    A batch is dispatched as soon as it holds `max_batch_size` frames or the
+    oldest frame in it has waited `max_wait_ms`, whichever comes first.
+    """
+    def __init__(self, predict_batch, max_batch_size=8, max_wait_ms=20, max_queue_size=1024):
+        """
+        Args:
+            predict_batch (callable): Takes a list of BGR frames, returns one result per frame
+            max_batch_size (int): Largest number of frames per forward pass
+            max_wait_ms (float): Longest time a frame waits for the batch to fill
+            max_queue_size (int): Frames allowed to wait before submit() refuses new ones
+        """
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue_size = max_queue_size
+
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so a Gunicorn worker that inherited
+        # this object from the master starts its own dispatcher on first use.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue_size)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="yolo-batch-inference", daemon=True)
+            self._thread.start()
+            logger.info(f"Started batch inference worker (max_batch_size={self.max_batch_size}, "
+                        f"max_wait={self.max_wait * 1000:.0f}ms)")
+
+    def submit(self, frame):
+        """
+        Queue a BGR frame for detection.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the list of detected object names
+        """
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((frame, future))
+        except queue.Full:
+            raise InferenceQueueFull(f"Inference queue is full ({self.max_queue_size} frames waiting)")
+        return future
+
+    def infer(self, frame, timeout=None):
+        """Submit a frame and block until its detections are available."""
+        return self.submit(frame).result(timeout=timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _collect_batch(self):
+        frame, future = self._queue.get()
+        batch = [(frame, future)]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Skip frames whose caller already gave up waiting
+            batch = [(frame, future) for frame, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.predict_batch([frame for frame, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Batch inference failed for {len(batch)} frames: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+inference_worker = BatchInferenceWorker(
+    detect_objects_batch,
+    max_batch_size=Config.INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=Config.INFERENCE_MAX_WAIT_MS,
+    max_queue_size=Config.INFERENCE_MAX_QUEUE_SIZE,
+)
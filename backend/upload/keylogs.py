@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import logging
+import datetime
+import threading
+
+from dateutil import parser as date_parser
+from pymongo.errors import DuplicateKeyError
+from werkzeug.utils import secure_filename
+
+from config import Config
+from upload.keystroke_engine import KeystrokeAutomaton, DEFAULT_PATTERNS, load_patterns
+
+logger = logging.getLogger(__name__)
+
+# Lines of the text log useKeyLogger.js used to upload in one piece at submit
+LEGACY_KEY_LINE = re.compile(r"Key pressed:\s*(\w+),\s*Timestamp:\s*([\d\-\:T\.]+Z)")
+
+VISIBILITY_EVENTS = ("unfocus", "refocus")
+
+
+class KeylogBatchError(ValueError):
+    """A batch that cannot be accepted as sent."""
+
+
+class KeylogSequenceGap(Exception):
+    """A batch arrived before an earlier one; the client must resend from `expected`."""
+    def __init__(self, expected):
+        super().__init__(f"expected batch {expected}")
+        self.expected = expected
+
+
+def _to_millis(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(date_parser.isoparse(str(value)).timestamp() * 1000)
+
+
+def normalize_event(raw):
+    """
+    One keystroke-stream event in its stored form:
+        {"t": <epoch ms>, "k": "<key>"}            key press
+        {"t": <epoch ms>, "e": "unfocus"|"refocus"} tab/window visibility
+    """
+    if not isinstance(raw, dict):
+        raise KeylogBatchError("events must be objects")
+    try:
+        t = _to_millis(raw.get("t", raw.get("time")))
+    except (TypeError, ValueError, OverflowError):
+        raise KeylogBatchError(f"bad timestamp in event {raw!r}")
+    key = raw.get("k", raw.get("key"))
+    event = raw.get("e", raw.get("type"))
+    if key is not None:
+        return {"t": t, "k": str(key)}
+    if event in VISIBILITY_EVENTS:
+        return {"t": t, "e": event}
+    raise KeylogBatchError(f"unknown event {raw!r}")
+
+
+def parse_ndjson(text):
+    """Events from an application/x-ndjson body, one JSON object per line."""
+    events = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            events.append(normalize_event(json.loads(line)))
+        except json.JSONDecodeError:
+            raise KeylogBatchError(f"invalid NDJSON line: {line[:80]!r}")
+    return events
+
+
+def parse_legacy_keylogs(text):
+    """Events from the old plain-text log ("Key pressed: X, Timestamp: ...")."""
+    events = []
+    for line in text.splitlines():
+        m = LEGACY_KEY_LINE.match(line)
+        if m:
+            events.append({"t": _to_millis(m.group(2)), "k": m.group(1)})
+        elif "Timestamp:" in line and ("unfocused" in line or "refocused" in line):
+            event = "unfocus" if "unfocused" in line else "refocus"
+            events.append({"t": _to_millis(line.split("Timestamp:")[1].strip()), "e": event})
+    return events
+
+
+_automaton = None
+
+
+def keystroke_automaton():
+    """The process-wide compiled pattern set (Config.KEYLOG_PATTERNS_FILE or the defaults)."""
+    global _automaton
+    if _automaton is None:
+        patterns = load_patterns(Config.KEYLOG_PATTERNS_FILE) if Config.KEYLOG_PATTERNS_FILE else DEFAULT_PATTERNS
+        _automaton = KeystrokeAutomaton(patterns)
+    return _automaton
+
+
+class KeylogDetector:
+    """
+    Pattern counts (copy, paste, Meta, tab switch, ...) over a keystroke
+    stream fed in arbitrary batches. The automaton's scan state is carried
+    between batches, so a pattern split across two batches is still seen.
+    """
+    def __init__(self, state=None, automaton=None):
+        self.automaton = automaton or keystroke_automaton()
+        self._state = self.automaton.scan([], state)
+
+    @property
+    def counts(self):
+        return self._state["counts"]
+
+    def feed(self, events):
+        self._state = self.automaton.scan(events, self._state)
+        return self
+
+    def state(self):
+        return self._state
+
+    def suspicious(self):
+        """The `suspiciousKeylogs` document stored on attempts (non-zero entries only)."""
+        labels = self.automaton.labels()
+        return {name: {labels[name]: count} for name, count in self.counts.items() if count}
+
+
+class KeylogStreams:
+    """
+    Append-only keystroke stream per (exam, user).
+
+    Raw events are appended as NDJSON to <root>/<exam>/<user>.ndjson, and the
+    detector state plus the next expected batch number live in the
+    `keylog_streams` collection. Batches are numbered from 0 by the client;
+    a batch is applied only if it is the next one, so retries are idempotent
+    and two workers can never apply the same batch twice.
+    """
+    def __init__(self, root, streams_collection):
+        self.root = root
+        self.streams = streams_collection
+        self._file_lock = threading.Lock()
+
+    def path(self, exam_id, username):
+        return os.path.join(self.root, secure_filename(str(exam_id)) or "_",
+                            f"{secure_filename(str(username)) or '_'}.ndjson")
+
+    def _append(self, exam_id, username, events):
+        path = self.path(exam_id, username)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in events)
+        with self._file_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+    def state(self, exam_id, username):
+        return self.streams.find_one({"examId": exam_id, "username": username})
+
+    def append_batch(self, exam_id, username, seq, events):
+        """
+        Apply batch `seq` of an attempt's stream.
+
+        Args:
+            seq (int or None): Batch number; None appends after whatever was received last
+            events (list): Normalized events, in the order they happened
+
+        Returns:
+            tuple: (KeylogDetector after the batch, applied) where applied is
+                   False for a batch that had already been received
+
+        Raises:
+            KeylogSequenceGap: an earlier batch is still missing
+        """
+        doc = self.state(exam_id, username) or {}
+        next_seq = doc.get("next_seq", 0)
+        if seq is None:
+            seq = next_seq
+        if seq < next_seq:
+            return KeylogDetector(doc.get("detector")), False
+        if seq > next_seq:
+            raise KeylogSequenceGap(next_seq)
+
+        detector = KeylogDetector(doc.get("detector")).feed(events)
+        try:
+            claimed = self.streams.update_one(
+                {"examId": exam_id, "username": username, "next_seq": next_seq},
+                {"$set": {
+                    "next_seq": next_seq + 1,
+                    "detector": detector.state(),
+                    "updatedAt": datetime.datetime.now(datetime.timezone.utc)
+                }, "$inc": {"events": len(events)}},
+                upsert=not doc
+            )
+        except DuplicateKeyError:
+            # a concurrent first batch created the stream
+            claimed = None
+        if claimed is None or (claimed.matched_count == 0 and claimed.upserted_id is None):
+            # another request applied this batch first
+            return KeylogDetector((self.state(exam_id, username) or {}).get("detector")), False
+
+        try:
+            self._append(exam_id, username, events)
+        except OSError as e:
+            # the detector state is authoritative for analysis; the file is the raw archive
+            logger.error(f"Could not append keylogs for {exam_id}/{username}: {e}")
+        return detector, True
@@ -0,0 +1,167 @@
+"""
+Keystroke-sequence matching for the keylog stream.
+
+A pattern is a sequence of consecutive stream events, optionally with a time
+window from its first to its last event. Keys are named by their KeyboardEvent
+`key` (case-insensitive) and tab/window visibility changes by "<unfocus>" and
+"<refocus>". A chord such as Control+C shows up in a keydown stream as Control
+immediately followed by c, so it is written as a short two-key sequence with a
+tight window.
+
+All patterns are compiled into one Aho-Corasick automaton with a complete
+transition table, so the stream is scanned once, in time linear in the number
+of events, however many patterns are configured.
+"""
+import json
+import hashlib
+from collections import deque, namedtuple
+
+Pattern = namedtuple("Pattern", "name label sequence within_ms suspicious")
+Pattern.__doc__ = """
+    name:       counter name, the key under `suspiciousKeylogs`
+    label:      what is counted, e.g. "ctrl+c"
+    sequence:   tuple of tokens: key names or "<unfocus>"/"<refocus>"
+    within_ms:  max time from first to last event, or None for no limit
+    suspicious: whether CheatingAnalyzer counts it as a suspicious pattern
+"""
+
+CHORD_WINDOW_MS = 1000
+
+DEFAULT_PATTERNS = (
+    Pattern("copy",        "ctrl+c",      ("control", "c"),          CHORD_WINDOW_MS, True),
+    Pattern("paste",       "ctrl+v",      ("control", "v"),          CHORD_WINDOW_MS, True),
+    Pattern("cut",         "ctrl+x",      ("control", "x"),          CHORD_WINDOW_MS, True),
+    Pattern("meta",        "meta",        ("meta",),                 None,            False),
+    Pattern("tab_switch",  "tab+switch",  ("tab", "<unfocus>"),      CHORD_WINDOW_MS, False),
+    Pattern("alt_tab",     "alt+tab",     ("alt", "tab"),            CHORD_WINDOW_MS, True),
+    Pattern("show_desktop", "win+d",      ("meta", "d"),             CHORD_WINDOW_MS, True),
+    Pattern("explorer",    "win+e",       ("meta", "e"),             CHORD_WINDOW_MS, True),
+    Pattern("reload",      "f5",          ("f5",),                   None,            True),
+    Pattern("reload_ctrl", "ctrl+r",      ("control", "r"),          CHORD_WINDOW_MS, True),
+    Pattern("address_bar", "ctrl+l",      ("control", "l"),          CHORD_WINDOW_MS, True),
+    Pattern("screenshot",  "printscreen", ("printscreen",),          None,            True),
+)
+
+
+def load_patterns(path):
+    """
+    Patterns from a JSON file: a list of
+        {"name", "label", "sequence": [...], "within_ms": null|int, "suspicious": bool}
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        specs = json.load(f)
+    return tuple(Pattern(spec["name"], spec.get("label", spec["name"]),
+                         tuple(token.lower() for token in spec["sequence"]),
+                         spec.get("within_ms"), spec.get("suspicious", True))
+                 for spec in specs)
+
+
+class KeystrokeAutomaton:
+    """A set of patterns compiled into a single DFA."""
+    def __init__(self, patterns=DEFAULT_PATTERNS):
+        self.patterns = tuple(patterns)
+        if not self.patterns:
+            raise ValueError("at least one pattern is required")
+        self.names = tuple(dict.fromkeys(p.name for p in self.patterns))
+        self.max_length = max(len(p.sequence) for p in self.patterns)
+        self.fingerprint = hashlib.sha1(repr(self.patterns).encode()).hexdigest()[:16]
+
+        # token -> symbol; anything else maps to the extra "other" symbol,
+        # which sends every state back to the root
+        tokens = sorted({token for p in self.patterns for token in p.sequence})
+        self.symbols = {token: i for i, token in enumerate(tokens)}
+        self.other = len(tokens)
+        self._build()
+
+    def _build(self):
+        # trie
+        goto = [{}]
+        outputs = [[]]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for token in pattern.sequence:
+                symbol = self.symbols[token]
+                if symbol not in goto[state]:
+                    goto.append({})
+                    outputs.append([])
+                    goto[state][symbol] = len(goto) - 1
+                state = goto[state][symbol]
+            outputs[state].append(index)
+
+        # breadth-first failure links, folded straight into a complete table
+        width = self.other + 1
+        delta = [[0] * width for _ in goto]
+        queue = deque()
+        for symbol in range(width):
+            child = goto[0].get(symbol)
+            if child is not None:
+                delta[0][symbol] = child
+                queue.append((child, 0))
+        while queue:
+            state, fail = queue.popleft()
+            outputs[state] = outputs[state] + outputs[fail]
+            for symbol in range(width):
+                child = goto[state].get(symbol)
+                if child is not None:
+                    delta[state][symbol] = child
+                    queue.append((child, delta[fail][symbol]))
+                else:
+                    delta[state][symbol] = delta[fail][symbol]
+
+        self.delta = delta
+        # per state: (counter index, pattern length, window) for every pattern ending there
+        name_index = {name: i for i, name in enumerate(self.names)}
+        self.outputs = [tuple((name_index[self.patterns[i].name], len(self.patterns[i].sequence),
+                               self.patterns[i].within_ms) for i in out)
+                        for out in outputs]
+
+    def suspicious_labels(self):
+        return tuple(p.label for p in self.patterns if p.suspicious)
+
+    def labels(self):
+        """counter name -> label (the first pattern's label when several share a name)."""
+        labels = {}
+        for p in self.patterns:
+            labels.setdefault(p.name, p.label)
+        return labels
+
+    def scan(self, events, state=None):
+        """
+        Advance over `events` and return the new scan state.
+
+        The state is a plain dict ({"fingerprint", "dfa_state", "times", "counts"})
+        so it can be stored between batches. A state saved by a different
+        pattern set keeps its counts but restarts matching at the root.
+        """
+        state = state or {}
+        counts = [state.get("counts", {}).get(name, 0) for name in self.names]
+        if state.get("fingerprint") == self.fingerprint:
+            current = state.get("dfa_state", 0)
+            times = deque(state.get("times", []), maxlen=self.max_length)
+        else:
+            current = 0
+            times = deque(maxlen=self.max_length)
+
+        delta, outputs, symbols, other = self.delta, self.outputs, self.symbols, self.other
+        symbol_cache = {}
+        for event in events:
+            raw = event.get("k")
+            if raw is None:
+                raw = f"<{event.get('e')}>"
+            symbol = symbol_cache.get(raw)
+            if symbol is None:
+                symbol = symbol_cache[raw] = symbols.get(raw.lower(), other)
+
+            t = event.get("t", 0)
+            times.append(t)
+            current = delta[current][symbol]
+            for counter, length, within_ms in outputs[current]:
+                if within_ms is None or t - times[-length] <= within_ms:
+                    counts[counter] += 1
+
+        return {
+            "fingerprint": self.fingerprint,
+            "dfa_state": current,
+            "times": list(times),
+            "counts": dict(zip(self.names, counts)),
+        }
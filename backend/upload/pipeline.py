@@ -0,0 +1,275 @@
+import os
+import math
+import time
+import base64
+import queue
+import logging
+import threading
+from io import BytesIO
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from PIL import Image
+
+from upload.utils import to_bgr
+from upload.inference import inference_worker, InferenceQueueFull
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("queued", "decode", "detect", "persist")
+
+
+class PipelineFull(Exception):
+    """Raised when the ingest queue is full; carries a retry hint in seconds."""
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FrameDropped(Exception):
+    """Set on a frame's future when a newer frame from the same candidate replaced it."""
+
+
+class FrameJob:
+    __slots__ = ("exam_id", "username", "image_blob", "raw", "content_type", "width", "height",
+                 "frame", "objects", "future", "enqueued_at", "stage_started_at")
+
+    def __init__(self, exam_id, username, image_blob):
+        self.exam_id = exam_id
+        self.username = username
+        self.image_blob = image_blob
+        self.raw = None
+        self.content_type = None
+        self.width = None
+        self.height = None
+        self.frame = None
+        self.objects = None
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.stage_started_at = self.enqueued_at
+
+
+class LatestFrameQueue:
+    """
+    Bounded queue holding at most one pending frame per candidate.
+
+    A newer frame from the same candidate replaces the pending one in place,
+    so a slow pipeline analyses the freshest frame instead of a backlog.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._cond = threading.Condition()
+
+    def put(self, key, item):
+        """Returns the frame that was replaced, if any. Raises queue.Full."""
+        with self._cond:
+            replaced = self._items.get(key)
+            if replaced is None and len(self._items) >= self.maxsize:
+                raise queue.Full
+            self._items[key] = item
+            self._cond.notify()
+            return replaced
+
+    def get(self):
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            _, item = self._items.popitem(last=False)
+            return item
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+
+class PipelineMetrics:
+    """Counters and rolling per-stage latencies for sizing the deployment."""
+    def __init__(self, window=1024):
+        self._lock = threading.Lock()
+        self._latencies = {stage: deque(maxlen=window) for stage in STAGES}
+        self._completed_at = deque(maxlen=window)
+        self.counters = {"accepted": 0, "completed": 0, "dropped_stale": 0,
+                         "rejected": 0, "failed": 0}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._latencies[stage].append(seconds)
+
+    def completed(self):
+        with self._lock:
+            self.counters["completed"] += 1
+            self._completed_at.append(time.monotonic())
+
+    def throughput(self):
+        """Frames per second completed over the recent window."""
+        with self._lock:
+            if len(self._completed_at) < 2:
+                return 0.0
+            span = self._completed_at[-1] - self._completed_at[0]
+            return (len(self._completed_at) - 1) / span if span > 0 else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            stages = {}
+            for stage, values in self._latencies.items():
+                ordered = sorted(values)
+                if not ordered:
+                    stages[stage] = {"count": 0}
+                    continue
+                stages[stage] = {
+                    "count": len(ordered),
+                    "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+                    "max_ms": round(ordered[-1] * 1000, 2),
+                }
+            return {"counters": dict(self.counters), "stage_latency": stages}
+
+
+class FrameIngestPipeline:
+    """
+    Staged webcam-frame ingest: accept -> decode -> detect -> persist.
+
+    The request thread only enqueues the raw payload. Decoder threads turn it
+    into a BGR frame, the batch inference worker runs detection, and a persist
+    thread writes flagged frames. Every hand-off is a bounded queue.
+    """
+    def __init__(self, persist, detector=inference_worker, max_pending=512,
+                 decode_workers=2, persist_queue_size=1024):
+        """
+        Args:
+            persist (callable): persist(job), run on the persist thread once detections are in
+            detector (BatchInferenceWorker): Detection stage
+            max_pending (int): Candidates allowed to have a frame waiting for decode
+            decode_workers (int): Number of decoder threads
+            persist_queue_size (int): Detected frames allowed to wait for persistence
+        """
+        self.persist = persist
+        self.detector = detector
+        self.decode_workers = decode_workers
+        self.metrics = PipelineMetrics()
+
+        self._pending = LatestFrameQueue(max_pending)
+        self._persist_queue = queue.Queue(maxsize=persist_queue_size)
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Anything inherited across a fork belongs to the parent's threads
+            self._pending = LatestFrameQueue(self._pending.maxsize)
+            self._persist_queue = queue.Queue(maxsize=self._persist_queue.maxsize)
+            self._threads = [
+                threading.Thread(target=self._decode_loop, name=f"frame-decode-{i}", daemon=True)
+                for i in range(self.decode_workers)
+            ]
+            self._threads.append(threading.Thread(target=self._persist_loop, name="frame-persist", daemon=True))
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def retry_after(self):
+        """Seconds a shed client should wait before sending its next frame."""
+        rate = self.metrics.throughput()
+        if rate <= 0:
+            return 2
+        return max(1, min(30, math.ceil(self._pending.qsize() / rate)))
+
+    def submit(self, exam_id, username, image_blob):
+        """
+        Enqueue a frame and return its Future, which resolves to the detected
+        object names once the detect stage is done.
+        """
+        self._ensure_started()
+        job = FrameJob(exam_id, username, image_blob)
+        try:
+            replaced = self._pending.put((exam_id, username), job)
+        except queue.Full:
+            self.metrics.incr("rejected")
+            raise PipelineFull("Frame ingest queue is full", self.retry_after())
+
+        self.metrics.incr("accepted")
+        if replaced is not None:
+            self.metrics.incr("dropped_stale")
+            replaced.future.set_exception(FrameDropped("Superseded by a newer frame"))
+        return job.future
+
+    def stats(self):
+        snapshot = self.metrics.snapshot()
+        snapshot["queue_depth"] = {
+            "decode": self._pending.qsize(),
+            "detect": self.detector.queue_depth(),
+            "persist": self._persist_queue.qsize(),
+        }
+        snapshot["throughput_fps"] = round(self.metrics.throughput(), 2)
+        return snapshot
+
+    def _advance(self, job, stage):
+        now = time.monotonic()
+        self.metrics.observe(stage, now - job.stage_started_at)
+        job.stage_started_at = now
+
+    def _fail(self, job, error):
+        self.metrics.incr("failed")
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _decode_loop(self):
+        while True:
+            job = self._pending.get()
+            self._advance(job, "queued")
+            try:
+                # strip off the base64 metadata prefix
+                b64data = job.image_blob.split(",", 1)[1]
+                job.raw = base64.b64decode(b64data)
+                img = Image.open(BytesIO(job.raw))
+                job.content_type = Image.MIME.get(img.format, "image/jpeg")
+                job.width, job.height = img.size
+                job.frame = to_bgr(img)
+                job.image_blob = None
+                self._advance(job, "decode")
+                detection = self.detector.submit(job.frame)
+            except InferenceQueueFull as e:
+                self._fail(job, e)
+                continue
+            except Exception as e:
+                logger.error(f"Failed to decode frame from {job.username}: {str(e)}")
+                self._fail(job, e)
+                continue
+            detection.add_done_callback(lambda done, job=job: self._on_detected(job, done))
+
+    def _on_detected(self, job, done):
+        if done.exception() is not None:
+            self._fail(job, done.exception())
+            return
+        job.objects = done.result()
+        job.frame = None
+        self._advance(job, "detect")
+        if not job.future.done():
+            job.future.set_result(job.objects)
+        try:
+            self._persist_queue.put_nowait(job)
+        except queue.Full:
+            logger.warning(f"Persist queue full, dropping detections for {job.username}")
+            self.metrics.incr("failed")
+
+    def _persist_loop(self):
+        while True:
+            job = self._persist_queue.get()
+            try:
+                self.persist(job)
+                self._advance(job, "persist")
+                self.metrics.completed()
+            except Exception as e:
+                logger.error(f"Failed to persist frame from {job.username}: {str(e)}")
+                self.metrics.incr("failed")
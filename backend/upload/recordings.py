@@ -0,0 +1,177 @@
+import os
+import uuid
+import logging
+import datetime
+
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+OPEN, COMPLETE = "open", "complete"
+
+READ_SIZE = 64 * 1024
+
+
+class RecordingError(ValueError):
+    """An upload that cannot be accepted as sent."""
+
+
+class RecordingOffsetMismatch(Exception):
+    """An append did not start where the recording ends; the client must resume from `offset`."""
+    def __init__(self, offset):
+        super().__init__(f"expected offset {offset}")
+        self.offset = offset
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class AudioRecordings:
+    """
+    Chunked, resumable audio recordings: one file per recording under `root`.
+
+    A recording is opened once, appended to in order, then finalized. Every
+    append states the offset it starts at, which must equal the number of
+    bytes acknowledged so far (`size` in the `audio_recordings` document);
+    anything else is refused with the acknowledged offset, so a client that
+    lost a response resumes from there instead of duplicating bytes.
+
+    Bytes go straight from the request stream to the file. The fragments
+    MediaRecorder emits are consecutive pieces of one webm stream, so the
+    file is a single stream that can be read, up to its acknowledged size,
+    while the recording is still open. Byte p of the file is always byte p
+    of that stream, which is what makes overlapping retries harmless.
+    """
+    def __init__(self, root, recordings_collection, max_chunk_bytes=4 * 1024 * 1024):
+        self.root = root
+        self.recordings = recordings_collection
+        self.max_chunk_bytes = max_chunk_bytes
+
+    def path(self, recording):
+        return os.path.join(self.root, recording["file"])
+
+    def open(self, exam_id, username, extension=".webm"):
+        """Start a recording and create its (empty) file."""
+        now = _now()
+        recording_id = uuid.uuid4().hex
+        recording = {
+            "_id": recording_id,
+            "examId": exam_id,
+            "username": username,
+            "file": secure_filename(f"{exam_id}_{username}_{int(now.timestamp())}_{recording_id[:8]}{extension}"),
+            "size": 0,
+            "status": OPEN,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        os.makedirs(self.root, exist_ok=True)
+        open(self.path(recording), "wb").close()
+        self.recordings.insert_one(recording)
+        return recording
+
+    def discard(self, recording):
+        """Remove a recording that was opened for nothing (its attempt is gone), file and document."""
+        try:
+            os.remove(self.path(recording))
+        except FileNotFoundError:
+            pass
+        self.recordings.delete_one({"_id": recording["_id"]})
+
+    def get(self, recording_id):
+        return self.recordings.find_one({"_id": recording_id})
+
+    def append(self, recording, offset, stream, length=None):
+        """
+        Write the bytes of `stream` at `offset`.
+
+        Args:
+            recording (dict): The recording's document
+            offset (int): Where the bytes start in the recording
+            stream: File-like object read to its end (e.g. request.stream)
+            length (int): Bytes the client said it sent, if known
+
+        Returns:
+            int: The new acknowledged size
+
+        Raises:
+            RecordingOffsetMismatch: offset is not the acknowledged size, or the body was cut short
+            RecordingError: the recording is finalized, or the body is too large
+        """
+        if recording["status"] != OPEN:
+            raise RecordingError("recording is already finalized")
+        if offset != recording["size"]:
+            raise RecordingOffsetMismatch(recording["size"])
+        if length is not None and length > self.max_chunk_bytes:
+            raise RecordingError(f"chunk exceeds {self.max_chunk_bytes} bytes")
+
+        written = 0
+        with open(self.path(recording), "r+b") as f:
+            # drop whatever an interrupted append left past the acknowledged size
+            f.seek(offset)
+            f.truncate()
+            while True:
+                piece = stream.read(READ_SIZE)
+                if not piece:
+                    break
+                written += len(piece)
+                if written > self.max_chunk_bytes:
+                    raise RecordingError(f"chunk exceeds {self.max_chunk_bytes} bytes")
+                f.write(piece)
+            f.flush()
+            os.fsync(f.fileno())
+        if length is not None and written != length:
+            # the connection dropped mid-body; the partial bytes stay unacknowledged and are resent
+            raise RecordingOffsetMismatch(offset)
+
+        acknowledged = self.recordings.update_one(
+            {"_id": recording["_id"], "status": OPEN, "size": offset},
+            {"$set": {"size": offset + written, "updatedAt": _now()}},
+        )
+        if acknowledged.matched_count == 0:
+            # a concurrent retry of the same bytes was acknowledged first
+            raise RecordingOffsetMismatch(self.get(recording["_id"])["size"])
+        return offset + written
+
+    def finalize(self, recording, size):
+        """
+        Close a recording at `size` bytes. Finalizing twice is harmless.
+
+        Returns:
+            bool: True if this call closed the recording
+
+        Raises:
+            RecordingOffsetMismatch: bytes are still missing (or extra)
+        """
+        if recording["status"] == COMPLETE and recording["size"] == size:
+            return False
+        if recording["size"] != size:
+            raise RecordingOffsetMismatch(recording["size"])
+        closed = self.recordings.update_one(
+            {"_id": recording["_id"], "status": OPEN, "size": size},
+            {"$set": {"status": COMPLETE, "finalizedAt": _now(), "updatedAt": _now()}},
+        )
+        if closed.matched_count == 0:
+            current = self.get(recording["_id"])
+            if current["status"] == COMPLETE and current["size"] == size:
+                return False
+            raise RecordingOffsetMismatch(current["size"])
+        with open(self.path(recording), "r+b") as f:
+            f.truncate(size)
+        return True
+
+    def read(self, recording, start=0, size=None):
+        """
+        Yield the recording's bytes from `start` up to its acknowledged size
+        (or `size`), so an open recording can be analyzed as it grows.
+        """
+        end = recording["size"] if size is None else min(size, recording["size"])
+        with open(self.path(recording), "rb") as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                piece = f.read(min(READ_SIZE, remaining))
+                if not piece:
+                    break
+                remaining -= len(piece)
+                yield piece
@@ -1,21 +1,23 @@
-from flask import Blueprint, request, jsonify, send_file
-import base64
-from flask import current_app as app
+from flask import Blueprint, request, jsonify, send_file, Response
 from werkzeug.utils import secure_filename
 from exam.utils import parse_questions
-from io import BytesIO
-from PIL import Image
 from datetime import timezone
-from dateutil import parser as date_parser
 import jwt
 from database import init_db
 import datetime
-from upload.utils import allowed_file, detect_objects
+from upload.utils import allowed_file, make_thumbnail
+from upload.pipeline import FrameIngestPipeline, PipelineFull, FrameDropped
+from upload.inference import InferenceQueueFull
+from upload.frame_store import frame_store, is_valid_key, guess_content_type
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from upload.s3utils import upload_to_s3
+from exam.evidence import record_evidence, bump_evidence_version
+from upload.recordings import AudioRecordings, RecordingError, RecordingOffsetMismatch
+from upload.keylogs import (KeylogStreams, KeylogDetector, KeylogBatchError, KeylogSequenceGap,
+                            normalize_event, parse_ndjson, parse_legacy_keylogs)
 from config import Config
 import os
-from audio_analysis.speaker_diarization import run_speaker_analysis_and_store
-import re
+from jobs.store import job_store
 
 db_data = init_db()
 db = db_data['db']
@@ -53,30 +55,113 @@ def upload_frame():
         except jwt.PyJWTError:
             pass
 
+    # clients that don't need the detections back can ask for a 202 instead
+    wait_for_result = not data.get('async', False)
+
     try:
-        # strip off the base64 metadata prefix
-        b64data = image_blob.split(",", 1)[1]
-        raw     = base64.b64decode(b64data)
-        img     = Image.open(BytesIO(raw))
-
-        objects      = detect_objects(img)
-        person_count = objects.count("person")
-        has_phone    = any(o in ("cell phone","laptop") for o in objects)
-
-        if person_count > 1 or has_phone:
-            db_frames.insert_one({
-                "timestamp": datetime.datetime.now(datetime.timezone.utc),
-                "exam_id":   exam_id,
-                "username":  username,
-                "objects":   objects,
-                "image":     b64data
-            })
+        future = frame_pipeline.submit(exam_id, username, image_blob)
+    except PipelineFull as e:
+        response = jsonify(success=False, message=str(e), retry_after=e.retry_after)
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
 
-        return jsonify(success=True, objects=objects), 200
+    if not wait_for_result:
+        return jsonify(success=True, queued=True), 202
 
+    try:
+        objects = future.result(timeout=Config.INFERENCE_TIMEOUT_SECONDS)
+        return jsonify(success=True, objects=objects), 200
+    except FrameDropped:
+        return jsonify(success=True, dropped=True, objects=[]), 200
+    except (FutureTimeoutError, InferenceQueueFull):
+        retry_after = frame_pipeline.retry_after()
+        response = jsonify(success=False, message="Detection is backlogged", retry_after=retry_after)
+        response.headers["Retry-After"] = str(retry_after)
+        return response, 503
     except Exception as e:
         return jsonify(success=False, message=f"Error: {e}"), 500
 
+def store_flagged_frame(job):
+    """
+    Persist the frame if it shows more than one person or a device.
+    The image bytes go to the frame store; `frames` only keeps the key and metadata.
+    """
+    objects      = job.objects
+    person_count = objects.count("person")
+    has_phone    = any(o in ("cell phone","laptop") for o in objects)
+
+    if person_count > 1 or has_phone:
+        image_key = frame_store.put(job.raw, job.content_type)
+        # thumbnails are generated once here so listing pages never touch full frames
+        thumb, thumb_width, thumb_height = make_thumbnail(job.raw, Config.FRAME_THUMBNAIL_SIZE)
+        thumb_key = frame_store.put(thumb, "image/jpeg")
+        db_frames.insert_one({
+            "timestamp":    datetime.datetime.now(datetime.timezone.utc),
+            "exam_id":      job.exam_id,
+            "username":     job.username,
+            "objects":      objects,
+            "image_key":    image_key,
+            "content_type": job.content_type,
+            "width":        job.width,
+            "height":       job.height,
+            "size":         len(job.raw),
+            "thumb_key":    thumb_key,
+            "thumb_width":  thumb_width,
+            "thumb_height": thumb_height
+        })
+        record_evidence(db["attempt_counters"], job.exam_id, job.username, suspicious_frames=1)
+
+keylog_streams = KeylogStreams(Config.KEYLOG_FOLDER, db["keylog_streams"])
+audio_recordings = AudioRecordings(Config.AUDIO_UPLOAD_FOLDER, db["audio_recordings"],
+                                   max_chunk_bytes=Config.AUDIO_CHUNK_MAX_BYTES)
+
+frame_pipeline = FrameIngestPipeline(
+    store_flagged_frame,
+    max_pending=Config.INGEST_MAX_PENDING,
+    decode_workers=Config.INGEST_DECODE_WORKERS,
+    persist_queue_size=Config.INGEST_PERSIST_QUEUE_SIZE,
+)
+
+@upload_bp.route('/metrics', methods=['GET'])
+def ingest_metrics():
+    """Queue depth, per-stage latency and drop counters of the frame pipeline."""
+    return jsonify(success=True, pipeline=frame_pipeline.stats()), 200
+
+@upload_bp.route('/frames/<key>', methods=['GET'])
+def serve_frame(key):
+    """Stream a stored frame. Keys are content hashes, so responses never change."""
+    if not is_valid_key(key):
+        return jsonify(success=False, message="Invalid frame key"), 404
+
+    cache_headers = {
+        "ETag": f'"{key}"',
+        "Cache-Control": f"private, max-age={Config.FRAME_CACHE_MAX_AGE}, immutable",
+    }
+    if key in request.if_none_match:
+        return Response(status=304, headers=cache_headers)
+
+    try:
+        stream, size = frame_store.open(key)
+    except Exception:
+        return jsonify(success=False, message="Frame not found"), 404
+
+    head = stream.read(16)
+
+    def generate():
+        try:
+            yield head
+            while True:
+                chunk = stream.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            stream.close()
+
+    if size is not None:
+        cache_headers["Content-Length"] = str(size)
+    return Response(generate(), mimetype=guess_content_type(head), headers=cache_headers)
+
 @upload_bp.route('/file', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -158,22 +243,24 @@ def upload_audio():
     }
     result = db_collection.update_one(
         {"examId": exam_id, "username": username},
-        {"$set": {"recordings": [recording_entry]}}
+        {"$push": {"recordings": recording_entry}}
     )
     if result.matched_count == 0:
         print(f"[AUDIO UPLOAD] No attempt found for examId={exam_id}, username={username}")
         return jsonify({"success": False, "message": "Attempt not found in DB"}), 404
     print(f"[AUDIO UPLOAD] Updated attempt with audio recording: {recording_entry}")
 
-    # Run analysis in background
-    from threading import Thread
-    thread = Thread(target=run_speaker_analysis_and_store, args=(file_path, exam_id, username, unique_filename))
-    thread.start()
+    # Analysis runs in the job worker's process pool
+    job_id = job_store.enqueue("speaker_analysis",
+                               {"audio_path": file_path, "exam_id": exam_id,
+                                "username": username, "filename": unique_filename},
+                               examId=exam_id, username=username)
 
     return jsonify({
         "success": True,
         "message": "Audio recording received",
-        "recording": recording_entry
+        "recording": recording_entry,
+        "jobId": job_id
     }), 200
 
 @upload_bp.route('/audio/<path:filename>', methods=['GET'])
@@ -182,42 +269,233 @@ def serve_audio(filename):
     return send_file(file_path, mimetype="audio/webm")
 
 
+def _token_username(token):
+    if not token:
+        auth_header = request.headers.get('Authorization', '')
+        parts = auth_header.split(" ", 1)
+        if len(parts) == 2 and parts[0].lower() == "bearer":
+            token = parts[1]
+    if not token:
+        return None
+    try:
+        return jwt.decode(token, os.getenv("JWT_SECRET"), algorithms=["HS256"]).get("username")
+    except jwt.PyJWTError:
+        return None
+
+
+def _owned_recording(recording_id):
+    """The recording, if it exists and belongs to the caller; else an error response."""
+    username = _token_username(request.args.get("token"))
+    if not username:
+        return None, (jsonify({"success": False, "message": "Invalid token"}), 401)
+    recording = audio_recordings.get(recording_id)
+    if recording is None or recording["username"] != username:
+        return None, (jsonify({"success": False, "message": "Recording not found"}), 404)
+    return recording, None
+
+
+@upload_bp.route('/audio-recordings', methods=['POST'])
+def open_audio_recording():
+    """
+    Start a chunked recording upload.
+
+    Body: {"examId", "token"}. The recording is then sent with
+    PUT /audio-recordings/<id>?offset=N (raw bytes starting at N) and closed
+    with POST /audio-recordings/<id>/finalize. After a failed request,
+    GET /audio-recordings/<id> returns the offset to resume from.
+    """
+    data = request.get_json(silent=True) or {}
+    exam_id = data.get("examId")
+    username = _token_username(data.get("token"))
+    if not exam_id:
+        return jsonify({"success": False, "message": "Missing examId"}), 400
+    if not username:
+        return jsonify({"success": False, "message": "Invalid token"}), 401
+
+    # the recorder starts before /exam/connect creates the attempt; don't leave a file per retry
+    if db_collection.find_one({"examId": exam_id, "username": username}, {"_id": 1}) is None:
+        print(f"[AUDIO UPLOAD] No attempt found for examId={exam_id}, username={username}")
+        return jsonify({"success": False, "message": "Attempt not found in DB"}), 404
+
+    recording = audio_recordings.open(exam_id, username)
+    recording_entry = {
+        "file": recording["file"],
+        "recordingId": recording["_id"],
+        "status": "recording",
+        "timestamp": recording["createdAt"]
+    }
+    result = db_collection.update_one(
+        {"examId": exam_id, "username": username},
+        {"$push": {"recordings": recording_entry}}
+    )
+    if result.matched_count == 0:
+        print(f"[AUDIO UPLOAD] No attempt found for examId={exam_id}, username={username}")
+        audio_recordings.discard(recording)
+        return jsonify({"success": False, "message": "Attempt not found in DB"}), 404
+    print(f"[AUDIO UPLOAD] Opened recording {recording['_id']} for {username} in exam {exam_id}")
+
+    return jsonify({
+        "success": True,
+        "recordingId": recording["_id"],
+        "offset": 0,
+        "maxChunkBytes": audio_recordings.max_chunk_bytes
+    }), 201
+
+
+@upload_bp.route('/audio-recordings/<recording_id>', methods=['GET'])
+def audio_recording_status(recording_id):
+    recording, error = _owned_recording(recording_id)
+    if error:
+        return error
+    return jsonify({"success": True, "offset": recording["size"], "status": recording["status"]}), 200
+
+
+@upload_bp.route('/audio-recordings/<recording_id>', methods=['PUT'])
+def append_audio_recording(recording_id):
+    """Append the raw request body at ?offset=N; answers 409 with the offset to resume from."""
+    recording, error = _owned_recording(recording_id)
+    if error:
+        return error
+    try:
+        offset = int(request.args.get("offset", ""))
+    except ValueError:
+        return jsonify({"success": False, "message": "offset must be an integer"}), 400
+
+    try:
+        size = audio_recordings.append(recording, offset, request.stream, request.content_length)
+    except RecordingOffsetMismatch as e:
+        return jsonify({"success": False, "message": "Resume from the given offset", "offset": e.offset}), 409
+    except RecordingError as e:
+        return jsonify({"success": False, "message": str(e), "offset": recording["size"]}), 400
+    return jsonify({"success": True, "offset": size}), 200
+
+
+@upload_bp.route('/audio-recordings/<recording_id>/finalize', methods=['POST'])
+def finalize_audio_recording(recording_id):
+    """Close the recording at {"size"} bytes and queue its analysis."""
+    recording, error = _owned_recording(recording_id)
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "size must be an integer"}), 400
+
+    try:
+        closed = audio_recordings.finalize(recording, size)
+    except RecordingOffsetMismatch as e:
+        return jsonify({"success": False, "message": "Bytes are missing; resume from the given offset",
+                        "offset": e.offset}), 409
+
+    if closed:
+        exam_id, username = recording["examId"], recording["username"]
+        db_collection.update_one(
+            {"examId": exam_id, "username": username, "recordings.recordingId": recording_id},
+            {"$set": {"recordings.$.status": "complete", "recordings.$.size": size}}
+        )
+        job_id = job_store.enqueue("speaker_analysis",
+                                   {"audio_path": audio_recordings.path(recording), "exam_id": exam_id,
+                                    "username": username, "filename": recording["file"]},
+                                   examId=exam_id, username=username)
+        audio_recordings.recordings.update_one({"_id": recording_id}, {"$set": {"jobId": job_id}})
+    else:
+        job_id = (audio_recordings.get(recording_id) or {}).get("jobId")
+
+    return jsonify({"success": True, "recordingId": recording_id, "size": size, "jobId": job_id}), 200
+
+
 @upload_bp.route('/keylogs', methods=['POST'])
 def store_keylogs():
-    # force JSON parsing even if header is missing
-    data = request.get_json(force=True)
-    print("🔍 store_keylogs received:", data)
+    """
+    Append a batch of keystroke events to the attempt's stream.
 
-    # accept either camelCase or lowercase
-    key_logs = data.get('keyLogs') or data.get('keylogs')
-    if not key_logs:
-        return jsonify({"success": False, "message": "No key logs provided"}), 400
+    Either an application/x-ndjson body (one event per line) with examId,
+    username and seq as query parameters, or JSON:
+        { "examId", "username", "seq", "events": [ {"t": ms, "k": key} | {"t": ms, "e": "unfocus"} ] }
+    The old { "keyLogs": "<text log>" } body is still accepted.
+    Detector counts are carried across batches and mirrored to `suspiciousKeylogs`.
+    """
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            exam_id  = request.args.get('examId')
+            username = request.args.get('username')
+            seq      = request.args.get('seq')
+            events   = parse_ndjson(request.get_data(as_text=True))
+        else:
+            # force JSON parsing even if header is missing
+            data     = request.get_json(force=True) or {}
+            exam_id  = data.get('examId')
+            username = data.get('username')
+            seq      = data.get('seq')
+            if data.get('events') is not None:
+                events = [normalize_event(e) for e in data['events']]
+            else:
+                # accept either camelCase or lowercase
+                key_logs = data.get('keyLogs') or data.get('keylogs')
+                if not key_logs:
+                    return jsonify({"success": False, "message": "No key logs provided"}), 400
+                events = parse_legacy_keylogs(key_logs)
+        seq = int(seq) if seq is not None else None
+    except (KeylogBatchError, ValueError) as e:
+        return jsonify({"success": False, "message": f"Invalid keylog batch: {e}"}), 400
 
-    # turn your upload folder into an absolute path to be 100% sure
-    upload_dir = os.path.abspath(Config.UPLOAD_FOLDER)
-    os.makedirs(upload_dir, exist_ok=True)   # just in case
+    if not exam_id or not username:
+        return jsonify({"success": False, "message": "Missing examId or username"}), 400
+    if len(events) > Config.KEYLOG_MAX_BATCH_EVENTS:
+        return jsonify({"success": False, "message": "Keylog batch too large"}), 413
 
-    file_path = os.path.join(upload_dir, 'keylogs.txt')
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(key_logs)
-        print(f"✅ Keylogs written to {file_path}")
-        return jsonify({"success": True, "message": "Keylogs stored successfully"}), 200
-    except Exception as e:
-        print("❌ Error writing keylogs:", e)
-        return jsonify({"success": False, "message": f"Error storing keylogs: {e}"}), 500
+        detector, applied = keylog_streams.append_batch(exam_id, username, seq, events)
+    except KeylogSequenceGap as e:
+        return jsonify({"success": False, "message": "Missing earlier keylog batch",
+                        "expectedSeq": e.expected}), 409
+
+    if applied and events:
+        suspicious = detector.suspicious()
+        if suspicious:
+            db_collection.update_one(
+                {"examId": exam_id, "username": username},
+                {"$set": {
+                   "suspiciousKeylogs": suspicious,
+                   "suspicionCheckedAt": datetime.datetime.now(datetime.timezone.utc).isoformat()
+                }}
+            )
+        bump_evidence_version(db["attempt_counters"], exam_id, username)
+
+    response = {"success": True, "message": "Keylogs stored successfully",
+                "duplicate": not applied, "suspicious": detector.suspicious()}
+    if not applied:
+        # a client that restarted its numbering (page reload) resends its events from here
+        response["nextSeq"] = (keylog_streams.state(exam_id, username) or {}).get("next_seq", 0)
+    return jsonify(response), 200
+
+
+@upload_bp.route('/keylogs', methods=['GET'])
+def keylog_stream_position():
+    """
+    GET ?examId=...&username=...
+    The batch number the attempt's stream expects next, so a reloaded exam
+    page continues the numbering instead of starting again from 0.
+    """
+    exam_id  = request.args.get('examId')
+    username = request.args.get('username')
+    if not exam_id or not username:
+        return jsonify({"success": False, "message": "Missing examId or username"}), 400
+    stream = keylog_streams.state(exam_id, username) or {}
+    return jsonify({"success": True, "nextSeq": stream.get("next_seq", 0)}), 200
 
 
 @upload_bp.route('/keylogs/analyze', methods=['POST'])
 def analyze_keylogs():
     """
     POST JSON: { "examId": "...", "username": "..." }
-    Reads keylogs.txt, parses events in order, detects:
+    Returns the attempt's keylog detector counts:
       • ctrl+c (copy)
       • ctrl+v (paste)
       • Meta key
       • tab + unfocus (tab switch)
-    Stores counts under `suspiciousKeylogs` in MongoDB.
+    They are maintained as batches arrive (see /keylogs), so nothing is re-parsed here.
     """
     data     = request.get_json(silent=True) or {}
     exam_id  = data.get("examId")
@@ -225,72 +503,9 @@ def analyze_keylogs():
     if not exam_id or not username:
         return jsonify(success=False, message="Missing examId or username"), 400
 
-    # locate keylogs.txt
-    upload_dir = os.path.join(app.root_path, Config.UPLOAD_FOLDER)
-    file_path  = os.path.join(upload_dir, 'keylogs.txt')
-    if not os.path.exists(file_path):
-        return jsonify(success=False, message="No keylogs file found"), 404
-
-    # parse the file into a list of timestamped events
-    events = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            # Key pressed lines
-            m = re.match(r"Key pressed:\s*(\w+),\s*Timestamp:\s*([\d\-\:T\.]+Z)", line)
-            if m:
-                key = m.group(1)
-                ts  = date_parser.isoparse(m.group(2))
-                events.append({"type":"key", "key": key, "time": ts})
-                continue
-
-            # Unfocus / refocus lines
-            if "unfocused" in line:
-                ts = date_parser.isoparse(line.split("Timestamp:")[1].strip())
-                events.append({"type":"unfocus", "time": ts})
-            elif "refocused" in line:
-                ts = date_parser.isoparse(line.split("Timestamp:")[1].strip())
-                events.append({"type":"refocus", "time": ts})
-
-    # now scan for patterns in sequence
-    copy_count      = 0
-    paste_count     = 0
-    meta_count      = 0
-    tab_switch_count= 0
-
-    for i, ev in enumerate(events):
-        # count Meta presses
-        if ev["type"] == "key" and ev["key"].lower() == "meta":
-            meta_count += 1
-
-        # look for ctrl+c and ctrl+v
-        if ev["type"]=="key" and ev["key"].lower()=="control" and i+1 < len(events):
-            nxt = events[i+1]
-            if nxt["type"]=="key":
-                if nxt["key"].lower() == "c":
-                    copy_count += 1
-                elif nxt["key"].lower() == "v":
-                    paste_count += 1
-
-        # look for Tab + unfocus
-        if ev["type"]=="key" and ev["key"].lower()=="tab" and i+1 < len(events):
-            if events[i+1]["type"] == "unfocus":
-                tab_switch_count += 1
-
-    # build suspicious dict
-    suspicious = {}
-    if copy_count:       suspicious["copy"]       = {"ctrl+c": copy_count}
-    if paste_count:      suspicious["paste"]      = {"ctrl+v": paste_count}
-    if meta_count:       suspicious["meta"]       = {"meta": meta_count}
-    if tab_switch_count: suspicious["tab_switch"] = {"tab+switch": tab_switch_count}
-
-    # persist to MongoDB if any found
-    if suspicious:
-        db_collection.update_one(
-            {"examId": exam_id, "username": username},
-            {"$set": {
-               "suspiciousKeylogs": suspicious,
-               "suspicionCheckedAt": datetime.datetime.now(datetime.timezone.utc).isoformat()
-            }}
-        )
+    stream = keylog_streams.state(exam_id, username)
+    if not stream:
+        return jsonify(success=False, message="No keylogs found"), 404
 
-    return jsonify(success=True, suspicious=suspicious), 200
\ No newline at end of file
+    suspicious = KeylogDetector(stream.get("detector")).suspicious()
+    return jsonify(success=True, suspicious=suspicious), 200
@@ -1,4 +1,5 @@
 import boto3
+from botocore.exceptions import ClientError
 import uuid
 import os
 from config import Config
@@ -18,4 +19,25 @@ def upload_to_s3(file_path, key_prefix):
     s3.upload_file(file_path, bucket, key)
     
     # Return the public URL of the uploaded file
-    return f"https://{bucket}.s3.amazonaws.com/{key}" 
\ No newline at end of file
+    return f"https://{bucket}.s3.amazonaws.com/{key}" 
+
+def put_object_bytes(key, data, content_type="application/octet-stream"):
+    """Uploads raw bytes to the configured bucket under `key`."""
+    s3.put_object(Bucket=Config.AWS_BUCKET_NAME, Key=key, Body=data, ContentType=content_type)
+
+
+def object_exists(key):
+    """Returns True if `key` is already present in the configured bucket."""
+    try:
+        s3.head_object(Bucket=Config.AWS_BUCKET_NAME, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+def get_object_stream(key):
+    """Returns (streaming body, content length, content type) for `key`."""
+    obj = s3.get_object(Bucket=Config.AWS_BUCKET_NAME, Key=key)
+    return obj["Body"], obj.get("ContentLength"), obj.get("ContentType")
@@ -3,6 +3,7 @@ import cv2
 import numpy as np
 from PIL import Image
 import os
+from io import BytesIO
 from config import Config
 model = YOLO('yolov8n.pt')
 
@@ -11,15 +12,37 @@ def allowed_file(filename):
     ext = os.path.splitext(filename)[1].lower()
     return ext in Config.ALLOWED_EXTENSIONS
 
-def detect_objects(image: Image.Image):
+def to_bgr(image: Image.Image):
+    """Convert a PIL image to the BGR array layout YOLO expects."""
     open_cv_image = np.array(image)
-    open_cv_image = cv2.cvtColor(open_cv_image, cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(open_cv_image, cv2.COLOR_RGB2BGR)
+
+def detect_objects_batch(images):
+    """
+    Run YOLO once over a list of BGR frames.
+    Returns one list of detected object names per input frame, in order.
+    """
+    if not images:
+        return []
 
-    results = model.predict(source=open_cv_image, conf=0.5)
+    results = model.predict(source=list(images), conf=0.5, verbose=False)
 
-    object_names = []
+    detections = []
     for result in results:
-        object_names.extend([model.names[int(cls)] for cls in result.boxes.cls])
+        detections.append([model.names[int(cls)] for cls in result.boxes.cls])
+
+    return detections
+
+def detect_objects(image: Image.Image):
+    return detect_objects_batch([to_bgr(image)])[0]
 
-    return object_names
 
+def make_thumbnail(raw: bytes, max_size=160, quality=70):
+    """Downscale an encoded image to a small JPEG. Returns (bytes, width, height)."""
+    img = Image.open(BytesIO(raw))
+    img.thumbnail((max_size, max_size))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue(), img.size[0], img.size[1]
@@ -1,11 +1,111 @@
 // AudioRec.js (updated)
 import React, { useImperativeHandle, useRef, useEffect, forwardRef } from "react";
 
+const TIMESLICE_MS = 5000;       // MediaRecorder emits a fragment this often
+const MAX_CHUNK_BYTES = 1024 * 1024;
+const RETRY_DELAY_MS = 3000;
+const SUBMIT_UPLOAD_TIMEOUT_MS = 30000; // longest a submit waits for the rest of the recording
+// retrying these cannot help: bad request, bad token, recording gone, chunk too large
+const PERMANENT_STATUSES = [400, 401, 403, 404, 413];
+
+// Streams the recording to the server while it is being made: fragments are
+// appended to a chunked upload at explicit offsets, so a dropped request is
+// simply resent from the last offset the server acknowledged.
 const AudioRecorder = forwardRef(({ examId, token }, ref) => {
   const mediaRecorderRef = useRef(null);
-  const audioChunksRef = useRef([]); // use a ref to store audio chunks
+  const pendingRef = useRef(new Blob([], { type: "audio/webm" })); // bytes not yet acknowledged
+  const uploadRef = useRef({ recordingId: null, offset: 0, maxChunkBytes: MAX_CHUNK_BYTES });
+  const sendingRef = useRef(null);
+  const deadlineRef = useRef(Infinity); // drain() gives up after this (set once the exam is submitted)
+  const rejectedRef = useRef(false);    // the server refused the upload for good
   const [recording, setRecording] = React.useState(false);
   const BASE_URL = process.env.REACT_APP_BASE_URL;
+  const RECORDINGS_URL = `${BASE_URL}/upload/audio-recordings`;
+
+  const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+  // Move the acknowledged offset forward, dropping the bytes the server now holds
+  const acknowledge = (offset) => {
+    const upload = uploadRef.current;
+    if (offset > upload.offset) {
+      pendingRef.current = pendingRef.current.slice(offset - upload.offset);
+      upload.offset = offset;
+    }
+  };
+
+  const openRecording = async () => {
+    const response = await fetch(RECORDINGS_URL, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ examId, token }),
+    });
+    const result = await response.json();
+    if (!result.success) {
+      const err = new Error(result.message || "Could not start recording upload");
+      // 404 only means the attempt does not exist yet (before Start); that one is worth retrying
+      err.permanent = response.status !== 404 && PERMANENT_STATUSES.includes(response.status);
+      throw err;
+    }
+    uploadRef.current = {
+      recordingId: result.recordingId,
+      offset: 0,
+      maxChunkBytes: Math.min(MAX_CHUNK_BYTES, result.maxChunkBytes || MAX_CHUNK_BYTES),
+    };
+  };
+
+  const retryPause = () => sleep(Math.max(0, Math.min(RETRY_DELAY_MS, deadlineRef.current - Date.now())));
+
+  // Send everything pending, one chunk at a time; retries until it gets through,
+  // the server refuses it for good, or the deadline passes
+  const drain = async () => {
+    while (pendingRef.current.size > 0 && !rejectedRef.current) {
+      if (Date.now() >= deadlineRef.current) {
+        console.error(`Audio upload timed out with ${pendingRef.current.size} bytes unsent`);
+        return;
+      }
+      try {
+        if (!uploadRef.current.recordingId) await openRecording();
+        const { recordingId, offset, maxChunkBytes } = uploadRef.current;
+        const response = await fetch(
+          `${RECORDINGS_URL}/${recordingId}?offset=${offset}&token=${encodeURIComponent(token)}`,
+          {
+            method: "PUT",
+            headers: { "Content-Type": "application/octet-stream" },
+            body: pendingRef.current.slice(0, maxChunkBytes),
+          }
+        );
+        const result = await response.json();
+        // 200 carries the new offset; 409 the offset to resume from
+        if (typeof result.offset === "number") acknowledge(result.offset);
+        if (!result.success && response.status !== 409) {
+          if (PERMANENT_STATUSES.includes(response.status)) {
+            console.error("Audio upload rejected:", response.status, result.message);
+            rejectedRef.current = true;
+            return;
+          }
+          await retryPause();
+        }
+      } catch (err) {
+        if (err.permanent) {
+          console.error("Audio upload rejected:", err);
+          rejectedRef.current = true;
+          return;
+        }
+        console.error("Audio chunk upload failed, retrying:", err);
+        await retryPause();
+      }
+    }
+  };
+
+  const flush = () => {
+    if (!sendingRef.current) {
+      sendingRef.current = drain().finally(() => {
+        sendingRef.current = null;
+      });
+    }
+    return sendingRef.current;
+  };
+
   useEffect(() => {
     async function setupRecorder() {
       try {
@@ -13,7 +113,8 @@ const AudioRecorder = forwardRef(({ examId, token }, ref) => {
         const recorder = new MediaRecorder(stream);
         recorder.ondataavailable = (event) => {
           if (event.data && event.data.size > 0) {
-            audioChunksRef.current.push(event.data);
+            pendingRef.current = new Blob([pendingRef.current, event.data], { type: "audio/webm" });
+            flush();
           }
         };
         mediaRecorderRef.current = recorder;
@@ -35,9 +136,11 @@ const AudioRecorder = forwardRef(({ examId, token }, ref) => {
 
   const startRecording = () => {
     if (mediaRecorderRef.current) {
-      // Clear any previous chunks
-      audioChunksRef.current = [];
-      mediaRecorderRef.current.start();
+      pendingRef.current = new Blob([], { type: "audio/webm" });
+      uploadRef.current = { recordingId: null, offset: 0, maxChunkBytes: MAX_CHUNK_BYTES };
+      deadlineRef.current = Infinity;
+      rejectedRef.current = false;
+      mediaRecorderRef.current.start(TIMESLICE_MS);
       setRecording(true);
     }
   };
@@ -45,38 +148,41 @@ const AudioRecorder = forwardRef(({ examId, token }, ref) => {
   const stopRecording = () => {
     return new Promise((resolve) => {
       if (mediaRecorderRef.current && recording) {
-        mediaRecorderRef.current.onstop = () => {
-          // Create a Blob from all collected audio chunks
-          const blob = new Blob(audioChunksRef.current, { type: "audio/webm" });
-          resolve(blob);
-        };
+        // the last fragment is delivered through ondataavailable before onstop
+        mediaRecorderRef.current.onstop = () => resolve(true);
         mediaRecorderRef.current.stop();
         setRecording(false);
       } else {
-        resolve(null);
+        resolve(false);
       }
     });
   };
 
-  // Expose uploadRecording via the ref
+  // Expose uploadRecording via the ref: stops recording, sends what is left and finalizes
   const uploadRecording = async () => {
-    const blob = await stopRecording();
-    if (blob) {
-      const formData = new FormData();
-      formData.append("audio", blob, "recording.webm");
-      formData.append("examId", examId);
-      formData.append("token", token);
-      try {
-        const response = await fetch(`${BASE_URL}/upload/audio`, {
+    const stopped = await stopRecording();
+    if (!stopped) return;
+    // drain() keeps going until nothing is pending, including the final fragment, but
+    // the submit must not wait on it forever; a request still hanging is not waited for either
+    deadlineRef.current = Date.now() + SUBMIT_UPLOAD_TIMEOUT_MS;
+    await Promise.race([flush(), sleep(SUBMIT_UPLOAD_TIMEOUT_MS)]);
+    const { recordingId, offset } = uploadRef.current;
+    if (!recordingId || rejectedRef.current) return;
+    // whatever did not arrive in time is left out; the recording is closed at what the server holds
+    try {
+      const response = await fetch(
+        `${RECORDINGS_URL}/${recordingId}/finalize?token=${encodeURIComponent(token)}`,
+        {
           method: "POST",
-          body: formData,
-        });
-        const result = await response.json();
-        console.log("Audio recording uploaded:", result);
-        return result;
-      } catch (err) {
-        console.error("Error uploading recording:", err);
-      }
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ size: offset }),
+        }
+      );
+      const result = await response.json();
+      console.log("Audio recording uploaded:", result);
+      return result;
+    } catch (err) {
+      console.error("Error finalizing recording:", err);
     }
   };
 
@@ -19,7 +19,7 @@ const ExamCardTeacher = ({ exam, viewMode = "grid" }) => {
   useEffect(() => {
     async function fetchExamStats() {
       try {
-        const res = await fetch(`${BASE_URL}/exam/attempts?examId=${exam.id}`);
+        const res = await fetch(`${BASE_URL}/exam/attempts?examId=${exam.id}&framesLimit=0`);
         const data = await res.json();
         if (data.success) {
           setTotalAttempts(data.attempts.length);
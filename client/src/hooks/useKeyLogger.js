@@ -17,35 +17,136 @@ export function useKeyLogger(isLoggingActive, setKeyLogs) {
         };
     }, [isLoggingActive, setKeyLogs]);
 }*/
-import { useEffect } from 'react';
 
-export function useKeyLogger(isLoggingActive, setKeyLogs) {
+import { useCallback, useEffect, useRef } from 'react';
+
+const FLUSH_INTERVAL_MS = 5000;
+const MAX_BATCH_EVENTS = 500;
+
+// Streams keystroke events to /upload/keylogs as numbered NDJSON batches.
+// A batch is resent unchanged until the server acknowledges it, so retries never
+// double count; new events wait for the next batch. Numbering continues from the
+// server's stream, so a reloaded page does not reuse batch numbers already taken.
+export function useKeyLogger(isLoggingActive, setKeyLogs, stream) {
+    const pendingRef = useRef([]);
+    const inFlightRef = useRef(null);
+    const seqRef = useRef(0);
+    const syncedRef = useRef(false);
+    const streamRef = useRef(stream);
+    streamRef.current = stream;
+
+    const runningRef = useRef(null);
+
+    const sendPending = useCallback(async () => {
+        const target = streamRef.current;
+        if (!target || !target.examId || !target.username) return;
+
+        if (!syncedRef.current) {
+            // after a reload the stream may already hold batches from this attempt
+            try {
+                const params = new URLSearchParams({ examId: target.examId, username: target.username });
+                const response = await fetch(`${target.baseUrl}/upload/keylogs?${params}`);
+                if (!response.ok) throw new Error(`status ${response.status}`);
+                const { nextSeq } = await response.json();
+                seqRef.current = Math.max(seqRef.current, nextSeq);
+                syncedRef.current = true;
+            } catch (err) {
+                console.error('Could not read the keylog stream position, will retry:', err);
+                return;
+            }
+        }
+
+        while (inFlightRef.current || pendingRef.current.length) {
+            if (!inFlightRef.current) {
+                const events = pendingRef.current.splice(0, MAX_BATCH_EVENTS);
+                inFlightRef.current = {
+                    seq: seqRef.current,
+                    body: events.map((e) => JSON.stringify(e)).join('\n') + '\n'
+                };
+            }
+            const batch = inFlightRef.current;
+            const params = new URLSearchParams({
+                examId: target.examId,
+                username: target.username,
+                seq: String(batch.seq)
+            });
+            let response;
+            try {
+                response = await fetch(`${target.baseUrl}/upload/keylogs?${params}`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/x-ndjson' },
+                    body: batch.body
+                });
+            } catch (err) {
+                console.error('Keylog batch upload failed, will retry:', err);
+                return;
+            }
+            if (response.status === 409) {
+                // the server is missing an earlier batch; those events are gone, continue from there
+                const { expectedSeq } = await response.json();
+                seqRef.current = expectedSeq;
+                inFlightRef.current = { ...batch, seq: expectedSeq };
+                continue;
+            }
+            if (!response.ok) {
+                console.error('Keylog batch rejected:', response.status);
+                inFlightRef.current = null;
+                seqRef.current = batch.seq + 1;
+                return;
+            }
+            const result = await response.json().catch(() => ({}));
+            if (result.duplicate && result.nextSeq > batch.seq + 1) {
+                // the server had this number from an earlier page load, not these events: resend them
+                seqRef.current = result.nextSeq;
+                inFlightRef.current = { ...batch, seq: result.nextSeq };
+                continue;
+            }
+            inFlightRef.current = null;
+            seqRef.current = batch.seq + 1;
+        }
+    }, []);
+
+    // one upload loop at a time; callers share the running one
+    const flush = useCallback(() => {
+        if (!runningRef.current) {
+            runningRef.current = sendPending().finally(() => { runningRef.current = null; });
+        }
+        return runningRef.current;
+    }, [sendPending]);
+
     useEffect(() => {
         if (!isLoggingActive) return;
 
-        const logKeyStroke = (e) => {
-            const logEntry = `Key pressed: ${e.key}, Timestamp: ${new Date().toISOString()}\n`;
+        const record = (event, logEntry) => {
+            pendingRef.current.push(event);
             setKeyLogs((prevLogs) => prevLogs + logEntry);
         };
 
+        const logKeyStroke = (e) => {
+            const now = new Date();
+            record({ t: now.getTime(), k: e.key }, `Key pressed: ${e.key}, Timestamp: ${now.toISOString()}\n`);
+        };
+
         const handleVisibilityChange = () => {
+            const now = new Date();
             if (document.visibilityState === 'hidden') {
-                const logEntry = `Tab or window unfocused, Timestamp: ${new Date().toISOString()}\n`;
-                setKeyLogs((prevLogs) => prevLogs + logEntry);
+                record({ t: now.getTime(), e: 'unfocus' }, `Tab or window unfocused, Timestamp: ${now.toISOString()}\n`);
             } else if (document.visibilityState === 'visible') {
-                const logEntry = `Tab or window refocused, Timestamp: ${new Date().toISOString()}\n`;
-                setKeyLogs((prevLogs) => prevLogs + logEntry);
+                record({ t: now.getTime(), e: 'refocus' }, `Tab or window refocused, Timestamp: ${now.toISOString()}\n`);
             }
         };
 
         // Add event listeners for key logging and visibility change
         window.addEventListener('keydown', logKeyStroke);
         document.addEventListener('visibilitychange', handleVisibilityChange);
+        const timer = setInterval(flush, FLUSH_INTERVAL_MS);
 
         return () => {
             window.removeEventListener('keydown', logKeyStroke);
             document.removeEventListener('visibilitychange', handleVisibilityChange);
+            clearInterval(timer);
         };
-    }, [isLoggingActive, setKeyLogs]);
-}
+    }, [isLoggingActive, setKeyLogs, flush]);
 
+    return flush;
+}
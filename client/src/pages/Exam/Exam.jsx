@@ -38,7 +38,11 @@ function Exam() {
   const examContainerRef = useExamSecurity(examStarted);
   
   // useTabFocusMonitor();
-  useKeyLogger(isLoggingActive, setKeyLogs);
+  const flushKeyLogs = useKeyLogger(isLoggingActive, setKeyLogs, {
+    examId,
+    username: localStorage.getItem("username"),
+    baseUrl: BASE_URL
+  });
 
   // Fetch exam details based on the examId from the URL
   useEffect(() => {
@@ -194,19 +198,9 @@ function Exam() {
     setExamToken(null);
 
     try {
-      // send your keyLogs to the backend
+      // keystrokes are streamed during the exam; send whatever is still buffered
       const token = localStorage.getItem("token");
-      console.log("Sending keylogs:", { keyLogs }); // Debug log
-      const response = await fetch(`${BASE_URL}/upload/keylogs`, {
-        method: "POST",
-        headers: { 
-          "Content-Type": "application/json",
-          "Authorization": `Bearer ${token}`
-        },
-        body: JSON.stringify({ keyLogs })
-      });
-      const result = await response.json(); // Get the response
-      console.log("Keylogs upload response:", result); // Debug log
+      await flushKeyLogs();
 
       await fetch(`${BASE_URL}/upload/keylogs/analyze`, {
         method: "POST",
@@ -16,6 +16,34 @@ const ExamAttempts = () => {
   const [diarizationError, setDiarizationError] = useState(null);
   const [selectedRecording, setSelectedRecording] = useState(null);
   const BASE_URL = process.env.REACT_APP_BASE_URL;
+
+  // Frames are served by URL; older ones may still carry an inline base64 image
+  const frameSrc = (frame) =>
+    frame.imageUrl ? `${BASE_URL}${frame.imageUrl}` : `data:image/jpeg;base64,${frame.image}`;
+  const thumbSrc = (frame) =>
+    frame.thumbnailUrl ? `${BASE_URL}${frame.thumbnailUrl}` : frameSrc(frame);
+
+  // The attempts list only carries a few thumbnails per student; the modal pages through the rest
+  const [modalUser, setModalUser] = useState(null);
+  const [modalTotal, setModalTotal] = useState(0);
+  const FRAMES_PAGE_SIZE = 12;
+
+  const loadFramesPage = async (username, offset) => {
+    const res = await fetch(
+      `${BASE_URL}/exam/attempts/frames?examId=${examId}&username=${encodeURIComponent(username)}&offset=${offset}&limit=${FRAMES_PAGE_SIZE}`
+    );
+    const data = await res.json();
+    if (data.success) {
+      setModalFrames((prev) => (offset === 0 ? data.frames : [...(prev || []), ...data.frames]));
+      setModalTotal(data.total);
+    }
+  };
+
+  const openFramesModal = (username) => {
+    setModalUser(username);
+    setModalFrames([]);
+    loadFramesPage(username, 0);
+  };
   
   useEffect(() => {
     async function fetchAttempts() {
@@ -57,10 +85,23 @@ const ExamAttempts = () => {
         method: 'POST',
         body: formData
       });
-      const data = await apiResponse.json();
-      setDiarizationData(data);
-      if (!data.success) {
-        setDiarizationError(data.error || 'Diarization failed');
+      const queued = await apiResponse.json();
+      if (!queued.success) {
+        setDiarizationError(queued.error || 'Diarization failed');
+        return;
+      }
+      // Diarization runs as a background job; poll until it finishes
+      let job = null;
+      while (!job || job.status === 'pending' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        const statusResponse = await fetch(queued.statusUrl);
+        job = (await statusResponse.json()).job;
+        if (!job) break;
+      }
+      if (job && job.status === 'done') {
+        setDiarizationData(job.result);
+      } else {
+        setDiarizationError((job && job.error) || 'Diarization failed');
       }
     } catch (error) {
       setDiarizationError('Failed to analyze audio');
@@ -178,23 +219,24 @@ const ExamAttempts = () => {
               )}
 
               {/* Suspicious Frames */}
-              {attempt.cheatingFrames && attempt.cheatingFrames.length > 0 && (
+              {attempt.cheatingFramesTotal > 0 && (
                 <div className="mb-4">
                   <div className="flex items-center justify-between mb-2">
                     <h4 className="text-md font-semibold text-gray-900">Suspicious Frames</h4>
                     <button
-                      onClick={() => setModalFrames(attempt.cheatingFrames)}
+                      onClick={() => openFramesModal(attempt.username)}
                       className="text-blue-600 hover:text-blue-800 flex items-center space-x-1"
                     >
                       <Eye className="h-4 w-4" />
-                      <span>View All</span>
+                      <span>View All ({attempt.cheatingFramesTotal})</span>
                     </button>
                   </div>
                   <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
                     {attempt.cheatingFrames.slice(0, 4).map((frame, index) => (
                       <div key={index} className="relative">
                         <img
-                          src={`data:image/jpeg;base64,${frame.image}`}
+                          src={thumbSrc(frame)}
+                          loading="lazy"
                           alt={`Suspicious frame ${index + 1}`}
                           className="w-full h-32 object-cover rounded-lg"
                         />
@@ -211,6 +253,11 @@ const ExamAttempts = () => {
               {attempt.recordings && attempt.recordings.length > 0 && (
                 <div className="mb-4">
                   <h4 className="text-md font-semibold text-gray-900 mb-2">Exam Audio Recording</h4>
+                  {attempt.audioMaxSpeakers > 1 && (
+                    <p className="text-sm text-red-600 mb-2">
+                      Live audio check heard up to {attempt.audioMaxSpeakers} different voices in the same stretch of the exam
+                    </p>
+                  )}
                   <div className="space-y-2">
                     {attempt.recordings.map((recording, index) => {
                       const audioUrl = `${BASE_URL}/upload/audio/${recording.file}`;
@@ -292,18 +339,29 @@ const ExamAttempts = () => {
             </div>
             <div className="grid grid-cols-2 md:grid-cols-3 gap-4">
               {modalFrames.map((frame, index) => (
-                <div key={index} className="relative">
+                <a key={index} className="relative block" href={frameSrc(frame)} target="_blank" rel="noreferrer">
                   <img
-                    src={`data:image/jpeg;base64,${frame.image}`}
+                    src={thumbSrc(frame)}
+                    loading="lazy"
                     alt={`Suspicious frame ${index + 1}`}
                     className="w-full h-48 object-cover rounded-lg"
                   />
                   <div className="absolute bottom-0 left-0 right-0 bg-black bg-opacity-50 text-white text-xs p-1 rounded-b-lg">
                     {new Date(frame.timestamp).toLocaleString()}
                   </div>
-                </div>
+                </a>
               ))}
             </div>
+            {modalFrames.length < modalTotal && (
+              <div className="text-center mt-4">
+                <button
+                  onClick={() => loadFramesPage(modalUser, modalFrames.length)}
+                  className="bg-blue-600 text-white px-4 py-2 rounded-lg hover:bg-blue-700 transition-colors"
+                >
+                  Load more ({modalFrames.length}/{modalTotal})
+                </button>
+              </div>
+            )}
           </div>
         </div>
       )}